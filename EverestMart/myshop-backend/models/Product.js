@@ -36,6 +36,9 @@ const productSchema = new mongoose.Schema({
   },
   
   createdAt: { type: Date, default: Date.now }
+}, {
+  // updatedAt lets the recommendation service sync edited products incrementally
+  timestamps: { createdAt: false, updatedAt: true }
 });
 
 module.exports = mongoose.model('Product', productSchema);
@@ -1,15 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import os
+import asyncio
 from dotenv import load_dotenv
 import logging
 
 # Import recommendation models
-from models.collaborative_filter import CollaborativeFilter
-from models.content_based import ContentBasedFilter
+from models.registry import ModelRegistry, ModelBundle, create_models, train_models, save_version, new_version
 from utils.data_loader import DataLoader
+from utils.event_log import EventLog
+from utils.behavior_writer import BehaviorWriter, WriteQueueFull
+from utils.bulk_ingest import parse_batch, validate_events, BatchTooLarge, MAX_REPORTED_ERRORS
+from utils.online_updates import OnlineUpdater
+from utils.retraining import RetrainManager
+from utils.readiness import ReadinessTracker, FirstResponseMiddleware
+from utils.materialized_views import MaterializedView
+from utils.response_cache import ResponseCache, etag_for, etag_matches
+from utils.external_data import external_data
 
 # Load environment variables
 load_dotenv()
@@ -18,6 +27,13 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Startup progress per component, reported by /ready
+readiness = ReadinessTracker(['models', 'data', 'online_updates'])
+
+# Fast start: serve from the saved model snapshot immediately and load data /
+# train in the background. FAST_START=0 waits for everything before serving.
+FAST_START = os.getenv('FAST_START', '1') == '1'
+
 # Initialize FastAPI app
 app = FastAPI(
     title="EverestMart Recommendation API",
@@ -25,6 +41,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Time-to-first-successful-response is measured on the recommendation endpoints
+app.add_middleware(FirstResponseMiddleware, tracker=readiness)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -34,48 +53,191 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize models and data loader
+# Initialize data loader and the model registry
 data_loader = DataLoader()
-collaborative_model = None
-content_based_model = None
+
+# Tracked behaviors are group-committed to a local segmented log and replayed
+# on startup, so restarts keep recent signals (EVENT_LOG_DIR='' disables it)
+EVENT_LOG_DIR = os.getenv('EVENT_LOG_DIR', 'data/event_log')
+if EVENT_LOG_DIR:
+    data_loader.event_log = EventLog(
+        EVENT_LOG_DIR,
+        segment_bytes=int(os.getenv('EVENT_LOG_SEGMENT_MB', '64')) * 1024 * 1024,
+        fsync_interval=float(os.getenv('EVENT_LOG_FSYNC_INTERVAL', '0.05')),
+        retention=float(os.getenv('EVENT_LOG_RETENTION_HOURS', '168')) * 3600
+    )
+
+# Tracked behaviors are written to MongoDB in the background, in batches
+if data_loader.use_mongodb:
+    data_loader.behavior_writer = BehaviorWriter(
+        data_loader._open_database,
+        data_loader._close_client,
+        batch_size=int(os.getenv('MONGO_WRITE_BATCH_SIZE', '1000')),
+        flush_interval=float(os.getenv('MONGO_WRITE_FLUSH_INTERVAL', '1')),
+        max_queue=int(os.getenv('MONGO_WRITE_MAX_QUEUE', '100000'))
+    )
+
+# Model versions are memory-mapped artifact directories shared by all worker processes;
+# handlers read registry.active once so a request never mixes model versions
+registry = ModelRegistry(os.getenv('MODEL_DIR', 'models/saved'))
+
+# Tracked behaviors are folded into the trained models every few seconds
+online_updater = OnlineUpdater(
+    lambda: registry.active.user_models(),
+    interval=float(os.getenv('ONLINE_UPDATE_INTERVAL', '2'))
+)
+
+# Full retrains run in a separate process and are hot-swapped in when complete
+retrainer = RetrainManager(
+    registry,
+    data_loader,
+    online_updater,
+    use_processes=os.getenv('RETRAIN_IN_PROCESS', '1') == '1',
+    refresh_data=lambda: _sync_data()
+)
+
+# Seconds between incremental MongoDB syncs (0 disables the sync loop)
+SYNC_INTERVAL = float(os.getenv('SYNC_INTERVAL', '5'))
+
+# Recommendation responses are cached per model and catalog version
+response_cache = ResponseCache(
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', '30')),
+    max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000')),
+    max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_MB', '64')) * 1024 * 1024
+)
+
+# External trending API, kept fresh in the background so requests only read the cache
+EXTERNAL_TRENDING_URL = os.getenv('EXTERNAL_TRENDING_URL', '')
+
+# Largest batch accepted by POST /behavior/bulk
+BULK_MAX_EVENTS = int(os.getenv('BULK_MAX_EVENTS', '10000'))
+
+# Limit materialized for the anonymous endpoints (their default); other limits are rendered on first request
+VIEW_DEFAULT_LIMIT = 10
+VIEW_MAX_ENTRIES = int(os.getenv('VIEW_MAX_ENTRIES', '1024'))
+
+# Selectable algorithms for personalized (user) recommendations
+USER_ALGORITHMS = ('collaborative', 'item_based', 'als')
+ALGORITHM_NAMES = {
+    'collaborative': 'collaborative_filtering',
+    'item_based': 'item_based_filtering',
+    'als': 'matrix_factorization'
+}
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize models on startup"""
-    global collaborative_model, content_based_model
-    
     logger.info("🚀 Starting Recommendation Service...")
     
     try:
-        # Load data
-        logger.info("📊 Loading data...")
-        await data_loader.load_data()
-        
-        # Initialize models
-        logger.info("🤖 Initializing models...")
-        collaborative_model = CollaborativeFilter()
-        content_based_model = ContentBasedFilter()
-        
-        # Try to load pre-trained models
+        # Serve from the last saved model version right away (memory-mapped, no training)
+        logger.info("🤖 Loading model snapshot...")
+        readiness.mark('models', 'loading')
         try:
-            collaborative_model.load_model('models/saved/collaborative_model.pkl')
-            content_based_model.load_model('models/saved/content_based_model.pkl')
-            logger.info("✅ Loaded pre-trained models")
+            registry.publish(registry.load_current())
+            readiness.mark('models', 'ready', f"snapshot {registry.active.version}")
         except FileNotFoundError:
             logger.warning("⚠️  No pre-trained models found. Train models first.")
-            # Train with initial data
-            if data_loader.has_data():
-                logger.info("🔧 Training initial models...")
-                collaborative_model.train(data_loader.get_interaction_data())
-                content_based_model.train(data_loader.get_product_data())
-                logger.info("✅ Initial training complete")
+            readiness.mark('models', 'pending', "no snapshot, waiting for data to train")
         
-        logger.info("✅ Recommendation Service Ready!")
+        if data_loader.event_log is not None:
+            data_loader.event_log.start()
+        if data_loader.behavior_writer is not None:
+            asyncio.create_task(data_loader.behavior_writer.run())
+        asyncio.create_task(online_updater.run())
+        readiness.mark('online_updates', 'ready')
+        if EXTERNAL_TRENDING_URL:
+            asyncio.create_task(external_data.client.run([EXTERNAL_TRENDING_URL]))
+        if data_loader.use_mongodb and SYNC_INTERVAL > 0:
+            asyncio.create_task(_sync_loop())
+        
+        if FAST_START:
+            asyncio.create_task(_warm_up())
+        else:
+            await _warm_up()
+        
+        logger.info(f"✅ Recommendation Service accepting requests after {readiness.elapsed()}s")
         
     except Exception as e:
         logger.error(f"❌ Startup failed: {str(e)}")
         # Don't fail on startup, allow service to run
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write queued behaviors to MongoDB and commit buffered ones to the event log"""
+    if data_loader.behavior_writer is not None:
+        await data_loader.behavior_writer.close()
+    if data_loader.event_log is not None:
+        data_loader.event_log.close()
+    await external_data.client.close()
+
+async def _warm_up():
+    """Load data and, when no snapshot was available, train the initial models"""
+    try:
+        logger.info("📊 Loading data...")
+        readiness.mark('data', 'loading')
+        await data_loader.load_data()
+        _refresh_views()
+        readiness.mark('data', 'ready', f"{len(data_loader.catalog)} products, {len(data_loader.behavior_store)} behaviors")
+    except Exception as e:
+        logger.error(f"❌ Data loading failed: {str(e)}")
+        readiness.mark('data', 'failed', str(e))
+    
+    # A snapshot from a legacy deployment may lack some models; train a full version then
+    if readiness.is_ready('models') and registry.active.complete():
+        return
+    
+    try:
+        if not data_loader.has_data():
+            if not registry.active.trained():
+                registry.publish(ModelBundle(new_version(), create_models()))
+                readiness.mark('models', 'pending', "untrained, no data")
+            return
+        
+        # Train with initial data
+        logger.info("🔧 Training initial models...")
+        readiness.mark('models', 'loading', "training initial models")
+        loop = asyncio.get_running_loop()
+        models, _ = await loop.run_in_executor(
+            None, train_models, data_loader.get_product_data(), data_loader.get_interaction_data()
+        )
+        logger.info("✅ Initial training complete")
+        version = new_version()
+        registry.publish(ModelBundle(version, models))
+        readiness.mark('models', 'ready', f"trained version {version}")
+        # Saved like a retrained version, so the next start loads it instead of training again
+        try:
+            await loop.run_in_executor(None, save_version, registry.model_dir, version, models)
+            await loop.run_in_executor(None, registry.persist, version)
+        except Exception as e:
+            logger.error(f"❌ Saving initial models failed, serving them unsaved: {str(e)}")
+    except Exception as e:
+        logger.error(f"❌ Initial training failed: {str(e)}")
+        readiness.mark('models', 'failed', str(e))
+
+async def _sync_data():
+    """Merge MongoDB changes since the last sync into the loaded data and the live models"""
+    delta = await data_loader.sync_from_mongodb()
+    if delta['upserted']:
+        _reindex_catalog('upsert', delta['upserted'])
+    if delta['removed']:
+        _reindex_catalog('remove', delta['removed'])
+    if delta['upserted'] or delta['removed']:
+        _refresh_views()
+    for behavior in delta['behaviors']:
+        online_updater.submit(behavior)
+    _invalidate_users(delta['behaviors'])
+    return delta
+
+async def _sync_loop():
+    """Incremental MongoDB sync; started as a background task on startup"""
+    while True:
+        await asyncio.sleep(SYNC_INTERVAL)
+        try:
+            await _sync_data()
+        except Exception as e:
+            logger.error(f"MongoDB sync failed: {str(e)}")
+
 # ============================================
 # REQUEST/RESPONSE MODELS
 # ============================================
@@ -85,6 +247,7 @@ class RecommendationRequest(BaseModel):
     product_id: Optional[str] = None
     limit: int = 10
     include_metadata: bool = False
+    algorithm: str = "collaborative"  # collaborative, item_based, als
 
 class RecommendationResponse(BaseModel):
     recommendations: List[Dict]
@@ -98,53 +261,134 @@ class RecommendationResponse(BaseModel):
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    models = registry.active
     return {
         "status": "healthy",
         "service": "recommendation-api",
         "models_loaded": {
-            "collaborative": collaborative_model is not None,
-            "content_based": content_based_model is not None
+            "collaborative": models.collaborative is not None,
+            "content_based": models.content_based is not None
         },
+        "model_version": models.version,
         "data_loaded": data_loader.has_data()
     }
 
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """
+    Readiness per component (models, data, online_updates)
+    Returns 503 until a loaded or trained model is being served; data may still be loading
+    """
+    ready = registry.active.trained()
+    if not ready:
+        response.status_code = 503
+    return {
+        "ready": ready,
+        "fast_start": FAST_START,
+        "model_version": registry.active.version,
+        **readiness.report()
+    }
+
 # ============================================
 # RECOMMENDATION ENDPOINTS
 # ============================================
 
+def _data_version():
+    """What every cached response depends on: the served model version, its online updates and the catalog"""
+    return (registry.active.version, online_updater.version, data_loader.catalog.version)
+
+def _respond(request: Request, body: bytes, etag: str) -> Response:
+    """A JSON response with its ETag, or 304 Not Modified when the client already has it"""
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+async def _cached(request: Request, key: tuple, compute, tags: tuple = (), offload: bool = True) -> Response:
+    """
+    Serve ``key`` from the response cache, computing the payload on a miss
+
+    The payload is computed on an executor thread so a miss does not block
+    other requests; ``offload=False`` keeps cheap reads of state that only
+    the event loop updates on the loop.
+    """
+    version = _data_version()
+    entry = response_cache.get(key, version)
+    if entry is None:
+        if offload:
+            payload = await asyncio.get_running_loop().run_in_executor(None, compute)
+        else:
+            payload = compute()
+        # Not cached if the version moved on while computing
+        entry = response_cache.put(key, version, payload, tags)
+    return _respond(request, entry.body, entry.etag)
+
+def _invalidate_users(behaviors: List[Dict]):
+    """Drop cached responses personalized for the users of new behaviors"""
+    for user_id in {behavior.get('userId') for behavior in behaviors}:
+        if user_id is not None:
+            response_cache.invalidate(('user', str(user_id)))
+
+def _recommend_for_user(user_id: str, limit: int, algorithm: str) -> List[Dict]:
+    """Dispatch a personalized recommendation to the selected algorithm"""
+    models = registry.active
+    if algorithm == 'item_based':
+        if not models.item_based:
+            raise HTTPException(status_code=503, detail="Item-based model not loaded")
+        return models.item_based.recommend(
+            user_id, limit, recent_interactions=lambda: data_loader.get_user_behaviors(user_id)
+        )
+    
+    if algorithm == 'als':
+        if not models.als:
+            raise HTTPException(status_code=503, detail="ALS model not loaded")
+        return models.als.recommend(user_id, limit)
+    
+    if not models.collaborative:
+        raise HTTPException(status_code=503, detail="Collaborative model not loaded")
+    return models.collaborative.recommend(user_id, limit)
+
+def _user_response(user_id: str, limit: int, algorithm: str) -> Dict:
+    recommendations = _recommend_for_user(user_id, limit, algorithm)
+    
+    # If not enough recommendations, supplement with trending products
+    if len(recommendations) < limit:
+        trending = _trending_response(limit - len(recommendations))
+        recommendations.extend(trending['recommendations'])
+    
+    return {
+        "success": True,
+        "user_id": user_id,
+        "recommendations": recommendations[:limit],
+        "algorithm": ALGORITHM_NAMES[algorithm],
+        "count": len(recommendations)
+    }
+
 @app.get("/recommend/user/{user_id}")
 async def get_user_recommendations(
     user_id: str, 
-    limit: int = 10
+    request: Request,
+    limit: int = 10,
+    algorithm: str = "collaborative"
 ):
     """
     Get personalized recommendations for a user
-    Uses collaborative filtering based on user behavior
+    Uses collaborative (user-based) or item-based filtering on user behavior
+    Cached until the model or catalog changes, the user is active again, or the TTL passes
     """
+    if algorithm not in USER_ALGORITHMS:
+        raise HTTPException(status_code=400, detail=f"Unknown algorithm '{algorithm}', expected one of {list(USER_ALGORITHMS)}")
+    
     try:
-        if not collaborative_model:
-            raise HTTPException(status_code=503, detail="Collaborative model not loaded")
-        
-        # Get recommendations from collaborative filtering
-        recommendations = collaborative_model.recommend(user_id, limit)
-        
-        # If not enough recommendations, supplement with trending products
-        if len(recommendations) < limit:
-            trending = await get_trending_products(limit - len(recommendations))
-            recommendations.extend(trending['recommendations'])
-        
-        return {
-            "success": True,
-            "user_id": user_id,
-            "recommendations": recommendations[:limit],
-            "algorithm": "collaborative_filtering",
-            "count": len(recommendations)
-        }
+        return await _cached(
+            request, ('user', user_id, limit, algorithm),
+            lambda: _user_response(user_id, limit, algorithm),
+            tags=(('user', user_id),)
+        )
     
     except Exception as e:
         logger.error(f"Error getting user recommendations: {str(e)}")
-        # Fallback to trending products
-        trending = await get_trending_products(limit)
+        # Fallback to trending products (not cached)
+        trending = _trending_response(limit)
         return {
             "success": True,
             "user_id": user_id,
@@ -153,9 +397,28 @@ async def get_user_recommendations(
             "count": len(trending['recommendations'])
         }
 
+def _find_similar(product_id: str, limit: int) -> List[Dict]:
+    """Similar products, scoring catalog products added since training live"""
+    content_model = registry.active.content_based
+    product_data = None
+    if not content_model.has_product(product_id):
+        product_data = data_loader.get_product_by_id(product_id)
+    return content_model.find_similar(product_id, limit, product_data=product_data)
+
+def _similar_response(product_id: str, limit: int) -> Dict:
+    recommendations = _find_similar(product_id, limit)
+    return {
+        "success": True,
+        "product_id": product_id,
+        "recommendations": recommendations,
+        "algorithm": "content_based_filtering",
+        "count": len(recommendations)
+    }
+
 @app.get("/recommend/similar/{product_id}")
 async def get_similar_products(
     product_id: str, 
+    request: Request,
     limit: int = 10
 ):
     """
@@ -163,87 +426,110 @@ async def get_similar_products(
     Uses content-based filtering on product attributes
     """
     try:
-        if not content_based_model:
+        if not registry.active.content_based:
             raise HTTPException(status_code=503, detail="Content-based model not loaded")
         
-        recommendations = content_based_model.find_similar(product_id, limit)
-        
-        return {
-            "success": True,
-            "product_id": product_id,
-            "recommendations": recommendations,
-            "algorithm": "content_based_filtering",
-            "count": len(recommendations)
-        }
+        return await _cached(request, ('similar', product_id, limit), lambda: _similar_response(product_id, limit))
     
     except Exception as e:
         logger.error(f"Error getting similar products: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
 
+def _trending_response(limit: int, window: str = "24h", external: Optional[List[Dict]] = None) -> Dict:
+    # Maintained incrementally as behaviors arrive
+    trending = data_loader.get_trending_products(limit, window)
+    response = {
+        "success": True,
+        "recommendations": trending,
+        "algorithm": "trending",
+        "window": window,
+        "count": len(trending) 
+    }
+    if external is not None:
+        response["external"] = external[:limit]
+    return response
+
 @app.get("/recommend/trending")
-async def get_trending_products(limit: int = 10):
+async def get_trending_products(request: Request, limit: int = 10, window: str = "24h"):
     """
     Get trending products based on recent interactions
+    Scores are action-weighted and decayed within the window (1h, 24h or 7d)
+    With EXTERNAL_TRENDING_URL set, the external feed is returned as 'external'
     """
+    if window not in data_loader.trending.windows:
+        raise HTTPException(status_code=400, detail=f"Unknown window '{window}', expected one of {list(data_loader.trending.windows)}")
+    
     try:
-        # Get trending from data loader (based on recent behaviors)
-        trending = data_loader.get_trending_products(limit)
-        
-        return {
-            "success": True,
-            "recommendations": trending,
-            "algorithm": "trending",
-            "count": len(trending) 
-        }
+        external = None
+        feed_version = None
+        if EXTERNAL_TRENDING_URL:
+            # Kept fresh by the background refresher, so this reads the cache
+            external = await external_data.fetch_trending_from_api(EXTERNAL_TRENDING_URL)
+            external = external if isinstance(external, list) else None
+            feed_version = external_data.client.fetched_at(EXTERNAL_TRENDING_URL)
+        # Keyed on the trending generation and feed, which move with every tracked event or refresh
+        key = ('trending', limit, window, data_loader.trending.generation, feed_version)
+        return await _cached(request, key, lambda: _trending_response(limit, window, external), offload=False)
     
     except Exception as e:
         logger.error(f"Error getting trending products: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get trending products: {str(e)}")
 
+def _hybrid_response(request: RecommendationRequest) -> Dict:
+    user_recommendations = []
+    similar_recommendations = []
+    
+    # Get personalized recommendations if user_id provided
+    if request.user_id:
+        try:
+            user_recs = _recommend_for_user(request.user_id, request.limit // 2, request.algorithm)
+            user_recommendations.extend(user_recs)
+        except HTTPException:
+            logger.warning(f"{request.algorithm} model not loaded, skipping user recommendations")
+    
+    # Get content-based recommendations if product_id provided
+    if request.product_id and registry.active.content_based:
+        similar_recs = _find_similar(request.product_id, request.limit // 2)
+        similar_recommendations.extend(similar_recs)
+    
+    # Combine and deduplicate
+    all_recommendations = user_recommendations + similar_recommendations
+    seen = set()
+    unique_recommendations = []
+    
+    for rec in all_recommendations:
+        product_id = rec.get('product_id') or rec.get('_id')
+        if product_id not in seen:
+            seen.add(product_id)
+            unique_recommendations.append(rec)
+    
+    # Fill remaining with trending if needed
+    if len(unique_recommendations) < request.limit:
+        trending = data_loader.get_trending_products(request.limit - len(unique_recommendations))
+        for trend in trending:
+            product_id = trend.get('product_id') or trend.get('_id')
+            if product_id not in seen:
+                unique_recommendations.append(trend)
+    
+    return {
+        "success": True,
+        "recommendations": unique_recommendations[:request.limit],
+        "algorithm": "hybrid",
+        "count": len(unique_recommendations)
+    }
+
 @app.post("/recommend/hybrid")
-async def get_hybrid_recommendations(request: RecommendationRequest):
+async def get_hybrid_recommendations(request: RecommendationRequest, http_request: Request):
     """
     Get hybrid recommendations combining multiple algorithms
     """
+    if request.algorithm not in USER_ALGORITHMS:
+        raise HTTPException(status_code=400, detail=f"Unknown algorithm '{request.algorithm}', expected one of {list(USER_ALGORITHMS)}")
+    
     try:
-        user_recommendations = []
-        similar_recommendations = []
-        
-        # Get user-based recommendations if user_id provided
-        if request.user_id and collaborative_model:
-            user_recs = collaborative_model.recommend(request.user_id, request.limit // 2)
-            user_recommendations.extend(user_recs)
-        
-        # Get content-based recommendations if product_id provided
-        if request.product_id and content_based_model:
-            similar_recs = content_based_model.find_similar(request.product_id, request.limit // 2)
-            similar_recommendations.extend(similar_recs)
-        
-        # Combine and deduplicate
-        all_recommendations = user_recommendations + similar_recommendations
-        seen = set()
-        unique_recommendations = []
-        
-        for rec in all_recommendations:
-            product_id = rec.get('product_id') or rec.get('_id')
-            if product_id not in seen:
-                seen.add(product_id)
-                unique_recommendations.append(rec)
-        
-        # Fill remaining with trending if needed
-        if len(unique_recommendations) < request.limit:
-            trending = data_loader.get_trending_products(request.limit - len(unique_recommendations))
-            for trend in trending:
-                product_id = trend.get('product_id') or trend.get('_id')
-                if product_id not in seen:
-                    unique_recommendations.append(trend)
-        
-        return {
-            "success": True,
-            "recommendations": unique_recommendations[:request.limit],
-            "algorithm": "hybrid",
-            "count": len(unique_recommendations)
-        }
+        key = ('hybrid', request.user_id, request.product_id, request.limit, request.algorithm)
+        tags = (('user', request.user_id),) if request.user_id else ()
+        return await _cached(http_request, key, lambda: _hybrid_response(request), tags)
     
     except Exception as e:
         logger.error(f"Error getting hybrid recommendations: {str(e)}")
@@ -253,61 +539,98 @@ async def get_hybrid_recommendations(request: RecommendationRequest):
 # COLD START & SPECIALIZED RECOMMENDATIONS
 # ============================================
 
+def _cold_start_response(category: str, limit: int) -> Dict:
+    recommendations = data_loader.get_cold_start_recommendations(category or None, limit)
+    return {
+        "success": True,
+        "recommendations": recommendations,
+        "algorithm": "cold_start_patterns",
+        "count": len(recommendations)
+    }
+
+def _time_based_response(daypart: int, limit: int) -> Dict:
+    recommendations = data_loader.get_time_based_recommendations(limit, hour=daypart)
+    return {
+        "success": True,
+        "recommendations": recommendations,
+        "algorithm": "time_based",
+        "count": len(recommendations)
+    }
+
+# The anonymous endpoints only depend on the catalog (and the hour), so their
+# responses are serialized ahead of time for every category and daypart
+cold_start_view = MaterializedView(
+    'cold_start',
+    _cold_start_response,
+    lambda: [(category, VIEW_DEFAULT_LIMIT) for category in data_loader.cold_start_categories()],
+    lambda: data_loader.catalog.version,
+    max_entries=VIEW_MAX_ENTRIES
+)
+time_based_view = MaterializedView(
+    'time_based',
+    _time_based_response,
+    lambda: [(daypart, VIEW_DEFAULT_LIMIT) for daypart in sorted(set(data_loader.daypart(hour) for hour in range(24)))],
+    lambda: data_loader.catalog.version,
+    max_entries=VIEW_MAX_ENTRIES
+)
+
+def _refresh_views():
+    """Re-materialize the anonymous endpoints after a catalog change"""
+    cold_start_view.refresh()
+    time_based_view.refresh()
+
 @app.get("/recommend/cold-start")
-async def get_cold_start_recommendations(category: str = None, limit: int = 10):
+async def get_cold_start_recommendations(request: Request, category: str = None, limit: int = 10):
     """
     Get recommendations for new users with no history
     Uses external data patterns for cold-start problem
+    Served from a pre-serialized view, rebuilt when the catalog changes
     """
     try:
-        recommendations = data_loader.get_cold_start_recommendations(category, limit)
-        
-        return {
-            "success": True,
-            "recommendations": recommendations,
-            "algorithm": "cold_start_patterns",
-            "count": len(recommendations)
-        }
+        body = cold_start_view.get((category or '').lower(), limit)
+        return _respond(request, body, etag_for(body))
     
     except Exception as e:
         logger.error(f"Error getting cold-start recommendations: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
 
+def _frequently_bought_response(product_id: str, limit: int) -> Dict:
+    recommendations = data_loader.get_frequently_bought_together(product_id, limit)
+    return {
+        "success": True,
+        "product_id": product_id,
+        "recommendations": recommendations,
+        "algorithm": "market_basket_analysis",
+        "count": len(recommendations)
+    }
+
 @app.get("/recommend/frequently-bought/{product_id}")
-async def get_frequently_bought_together(product_id: str, limit: int = 5):
+async def get_frequently_bought_together(product_id: str, request: Request, limit: int = 5):
     """
     Get products frequently bought together with a given product
     Based on market basket analysis patterns
     """
     try:
-        recommendations = data_loader.get_frequently_bought_together(product_id, limit)
-        
-        return {
-            "success": True,
-            "product_id": product_id,
-            "recommendations": recommendations,
-            "algorithm": "market_basket_analysis",
-            "count": len(recommendations)
-        }
+        # Basket counts are updated on the event loop and read in O(k), so this stays on it
+        return await _cached(
+            request, ('frequently_bought', product_id, limit),
+            lambda: _frequently_bought_response(product_id, limit),
+            offload=False
+        )
     
     except Exception as e:
         logger.error(f"Error getting frequently bought together: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
 
 @app.get("/recommend/time-based")
-async def get_time_based_recommendations(limit: int = 10):
+async def get_time_based_recommendations(request: Request, limit: int = 10):
     """
     Get recommendations based on current time of day
+    Every daypart is materialized, so the hour only picks the pre-serialized response
     """
     try:
-        recommendations = data_loader.get_time_based_recommendations(limit)
-        
-        return {
-            "success": True,
-            "recommendations": recommendations,
-            "algorithm": "time_based",
-            "count": len(recommendations)
-        }
+        body = time_based_view.get(data_loader.daypart(), limit)
+        return _respond(request, body, etag_for(body))
     
     except Exception as e:
         logger.error(f"Error getting time-based recommendations: {str(e)}")
@@ -340,6 +663,8 @@ async def track_behavior(event: BehaviorEvent):
         }
         
         data_loader.add_behavior(behavior_data)
+        online_updater.submit(behavior_data)
+        _invalidate_users([behavior_data])
         
         logger.debug(f"Tracked behavior: {event.action} for product {event.product_id}")
         
@@ -348,10 +673,48 @@ async def track_behavior(event: BehaviorEvent):
             "message": "Behavior tracked successfully"
         }
     
+    except WriteQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Error tracking behavior: {str(e)}")
         return {"success": False, "error": str(e)}
 
+@app.post("/behavior/bulk")
+async def track_behaviors_bulk(request: Request):
+    """
+    Track a batch of behaviors: a JSON array, {"behaviors": [...]} or NDJSON
+
+    Events are validated together and valid ones are applied in one pass;
+    invalid events are rejected individually without failing the batch.
+    """
+    body = await request.body()
+    try:
+        events, parse_errors = parse_batch(body, request.headers.get('content-type'), BULK_MAX_EVENTS)
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    behaviors, errors = validate_events(events, parse_errors)
+    if behaviors:
+        try:
+            behaviors = data_loader.add_behaviors(behaviors)
+        except WriteQueueFull as e:
+            # Nothing from the batch was applied, so the whole batch can be retried
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+        online_updater.submit_many(behaviors)
+        _invalidate_users(behaviors)
+    
+    logger.debug(f"Bulk tracked {len(behaviors)} behaviors, rejected {len(errors)}")
+    
+    return {
+        "success": True,
+        "received": len(events),
+        "accepted": len(behaviors),
+        "rejected": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS]
+    }
+
 @app.get("/user/{user_id}/profile")
 async def get_user_profile(user_id: str):
     """
@@ -370,6 +733,77 @@ async def get_user_profile(user_id: str):
         logger.error(f"Error getting user profile: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get user profile: {str(e)}")
 
+# ============================================
+# CATALOG UPDATES
+# ============================================
+
+class CatalogUpdate(BaseModel):
+    products: List[Dict]  # product documents with _id (or id), name, description, category, ...
+
+def _reindex_catalog(kind: str, payload: List):
+    """Apply a catalog change to the content model, retraining legacy (non-incremental) models"""
+    content_model = registry.active.content_based
+    if not content_model:
+        return
+    try:
+        if kind == 'upsert':
+            content_model.upsert_products(payload)
+        else:
+            content_model.remove_products(payload)
+    except ValueError:
+        logger.info("Content model is not incremental, retraining on the full catalog")
+        content_model.train(data_loader.get_product_data())
+    # A retrain in progress replays the change onto the version it is building
+    retrainer.record_catalog_change(kind, payload)
+
+@app.post("/catalog/products")
+async def upsert_catalog_products(update: CatalogUpdate):
+    """
+    Add or update catalog products and index them for similarity right away
+    Only the changed products are vectorized; no full retrain is needed
+    """
+    products = []
+    for product in update.products:
+        product_id = product.get('_id', product.get('id'))
+        if product_id is None:
+            raise HTTPException(status_code=400, detail="Every product needs an _id or id")
+        products.append({**product, '_id': str(product_id)})
+    
+    try:
+        data_loader.upsert_products(products)
+        _reindex_catalog('upsert', products)
+        _refresh_views()
+        
+        return {
+            "success": True,
+            "indexed": len(products),
+            "catalog_size": len(data_loader.catalog)
+        }
+    
+    except Exception as e:
+        logger.error(f"Error updating catalog: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to update catalog: {str(e)}")
+
+@app.delete("/catalog/products/{product_id}")
+async def remove_catalog_product(product_id: str):
+    """
+    Remove a product from the catalog and from all similar-product lists
+    """
+    try:
+        data_loader.remove_products([product_id])
+        _reindex_catalog('remove', [product_id])
+        _refresh_views()
+        
+        return {
+            "success": True,
+            "product_id": product_id,
+            "catalog_size": len(data_loader.catalog)
+        }
+    
+    except Exception as e:
+        logger.error(f"Error removing catalog product: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to remove product: {str(e)}")
+
 # ============================================
 # MODEL MANAGEMENT
 # ============================================
@@ -378,64 +812,135 @@ async def get_user_profile(user_id: str):
 async def retrain_models():
     """
     Retrain recommendation models with latest data
+    Runs in the background and hot-swaps the new version in when complete;
+    poll /model/retrain/{job_id} for progress
     """
     try:
-        logger.info("🔄 Retraining models...")
-        
-        # Reload data from database
-        await data_loader.load_data()
-        
-        # Retrain collaborative filter
-        if collaborative_model:
-            collaborative_model.train(data_loader.get_interaction_data())
-            collaborative_model.save_model('models/saved/collaborative_model.pkl')
-        
-        # Retrain content-based filter  
-        if content_based_model:
-            content_based_model.train(data_loader.get_product_data())
-            content_based_model.save_model('models/saved/content_based_model.pkl')
-        
-        logger.info("✅ Models retrained successfully")
+        job = retrainer.submit()
+        logger.info(f"🔄 Retrain job {job['job_id']} {job['status']}")
         
         return {
             "success": True,
-            "message": "Models retrained successfully",
-            "data_stats": {
-                "products": len(data_loader.products),
-                "behaviors": len(data_loader.behaviors)
-            }
+            "message": "Retrain started" if job['status'] == 'queued' else "Retrain already in progress",
+            "job_id": job['job_id'],
+            "status": job['status'],
+            "active_version": registry.active.version
         }
     
     except Exception as e:
-        logger.error(f"Error retraining models: {str(e)}")
+        logger.error(f"Error starting retrain: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to retrain models: {str(e)}")
 
+@app.get("/model/retrain/{job_id}")
+async def get_retrain_status(job_id: str):
+    """
+    Progress of a retrain job: stage, duration and the version it published
+    """
+    job = retrainer.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown retrain job '{job_id}'")
+    
+    return {
+        "success": True,
+        "job": job,
+        "active_version": registry.active.version
+    }
+
 @app.get("/model/status")
 async def get_model_status():
     """
     Get current model status and statistics
     """
+    models = registry.active
     return {
         "success": True,
+        "version": models.version,
+        "version_created_at": models.created_at,
+        "last_retrain": retrainer.latest(),
         "models": {
             "collaborative": {
-                "loaded": collaborative_model is not None,
-                "trained": collaborative_model.trained if collaborative_model else False,
-                "users": len(collaborative_model.user_ids) if collaborative_model and collaborative_model.trained else 0,
-                "products": len(collaborative_model.product_ids) if collaborative_model and collaborative_model.trained else 0
+                "loaded": models.collaborative is not None,
+                "trained": models.collaborative.trained if models.collaborative else False,
+                "users": len(models.collaborative.user_ids) if models.collaborative and models.collaborative.trained else 0,
+                "products": len(models.collaborative.product_ids) if models.collaborative and models.collaborative.trained else 0
             },
             "content_based": {
-                "loaded": content_based_model is not None,
-                "trained": content_based_model.trained if content_based_model else False,
-                "products": len(content_based_model.product_ids) if content_based_model and content_based_model.trained else 0
+                "loaded": models.content_based is not None,
+                "trained": models.content_based.trained if models.content_based else False,
+                "products": len(models.content_based.product_ids) if models.content_based and models.content_based.trained else 0,
+                "incremental": models.content_based.incremental if models.content_based else False
+            },
+            "item_based": {
+                "loaded": models.item_based is not None,
+                "trained": models.item_based.trained if models.item_based else False,
+                "products": len(models.item_based.product_ids) if models.item_based and models.item_based.trained else 0
+            },
+            "als": {
+                "loaded": models.als is not None,
+                "trained": models.als.trained if models.als else False,
+                "users": len(models.als.user_ids) if models.als and models.als.trained else 0,
+                "products": len(models.als.product_ids) if models.als and models.als.trained else 0,
+                "iteration_times_ms": [round(t * 1000, 2) for t in models.als.iteration_times] if models.als else []
             }
         },
+        "trending": data_loader.trending.stats(),
+        "user_profiles": data_loader.profiles.stats(),
+        "market_basket": data_loader.basket.stats(),
+        "views": {"cold_start": cold_start_view.stats(), "time_based": time_based_view.stats()},
+        "event_log": data_loader.event_log.status() if data_loader.event_log is not None else None,
+        "online_updates": {
+            **online_updater.stats,
+            "pending": online_updater.pending(),
+            "interval_seconds": online_updater.interval
+        },
         "data": {
-            "products_loaded": len(data_loader.products),
-            "behaviors_loaded": len(data_loader.behaviors)
+            "products_loaded": len(data_loader.catalog),
+            "behaviors_loaded": len(data_loader.behavior_store),
+            "behavior_capacity": data_loader.behavior_store.capacity,
+            "behaviors_evicted": data_loader.behavior_store.evicted,
+            "sync_interval_seconds": SYNC_INTERVAL if data_loader.use_mongodb else None,
+            "watermarks": {name: str(value) if value is not None else None for name, value in data_loader.watermarks.items()}
         }
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Pipeline counters: MongoDB write-behind, event log, online updates, external data client and response cache"""
+    writer = data_loader.behavior_writer
+    return {
+        "behavior_writer": writer.metrics() if writer is not None else None,
+        "event_log": data_loader.event_log.status() if data_loader.event_log is not None else None,
+        "online_updates": {**online_updater.stats, "pending": online_updater.pending()},
+        "external_data": external_data.client.metrics(),
+        "response_cache": response_cache.stats()
+    }
+
+@app.get("/model/ann-report")
+async def get_ann_report(model: str = "content_based", k: int = 10, queries: int = 200):
+    """
+    Recall-versus-latency report of a model's ANN index against the exact scan
+    Used to pick n_probe operating points for large catalogs
+    """
+    active = registry.active
+    models = {'content_based': active.content_based, 'als': active.als}
+    if model not in models:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{model}', expected one of {list(models)}")
+    
+    target = models[model]
+    if not target or target.ann_index is None:
+        raise HTTPException(status_code=404, detail=f"No ANN index built for {model} (catalog below ann_threshold)")
+    
+    report = target.ann_index.evaluate(k=k, n_queries=queries)
+    
+    return {
+        "success": True,
+        "model": model,
+        "k": k,
+        "indexed_vectors": len(target.ann_index),
+        "default_n_probe": target.ann_index.n_probe,
+        "report": report
+    }
+
 # ============================================
 # RUN SERVER
 # ============================================
@@ -0,0 +1,245 @@
+"""
+Approximate Nearest-Neighbor Index
+Pure-NumPy inverted-file (IVF) index over dense item or user vectors
+"""
+
+import time
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class IVFIndex:
+    """
+    Inverted-file index with a spherical k-means coarse quantizer
+
+    Vectors are partitioned into ``n_lists`` clusters and stored contiguously
+    per cluster. A query scores the centroids, scans only the ``n_probe``
+    best lists and partially sorts those candidates, so latency scales with
+    n / n_lists * n_probe instead of n. Raising ``n_probe`` trades latency for
+    recall; ``evaluate`` measures that trade-off against the exact scan.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, metric='cosine', n_iter=10, sample_size=50000, random_state=42):
+        """
+        Args:
+            n_lists: Number of coarse clusters (defaults to ~sqrt(n_vectors))
+            n_probe: Lists scanned per query by default
+            metric: 'cosine' (vectors are L2-normalized) or 'dot' (inner product)
+            n_iter: k-means iterations for the coarse quantizer
+            sample_size: Max vectors used to fit the quantizer
+            random_state: Seed for centroid initialization and sampling
+        """
+        if metric not in ('cosine', 'dot'):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.metric = metric
+        self.n_iter = n_iter
+        self.sample_size = sample_size
+        self.random_state = random_state
+        self.centroids = None
+        self.list_offsets = None
+        self.list_items = None
+        self.vectors = None
+        self._positions = None
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def build(self, vectors):
+        """
+        Build the index over ``vectors`` (n x d); row i is returned as id i
+
+        Returns:
+            self
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.metric == 'cosine':
+            vectors = self._normalize(vectors)
+        n = vectors.shape[0]
+        n_lists = self.n_lists or int(np.sqrt(n))
+        n_lists = int(min(max(1, n_lists), max(1, n)))
+
+        # Spherical k-means on a sample: partitions by direction for both metrics
+        rng = np.random.default_rng(self.random_state)
+        directions = self._normalize(vectors)
+        sample = directions[rng.choice(n, min(n, self.sample_size), replace=False)] if n else directions
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy() if n else np.zeros((1, vectors.shape[1]), np.float32)
+        for _ in range(self.n_iter):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = self._normalize(sums)
+
+        assignment = np.argmax(directions @ centroids.T, axis=1) if n else np.zeros(0, dtype=np.int64)
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=n_lists)
+
+        self.centroids = centroids.astype(np.float32)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.list_items = order.astype(np.int32)
+        self.vectors = vectors[order]
+        self._build_positions()
+        logger.info(f"Built IVF index: {n} vectors, {n_lists} lists")
+        return self
+
+    def add(self, vectors):
+        """
+        Index with ``vectors`` appended as ids len(self), len(self) + 1, ...
+
+        Each new vector joins the list of its nearest centroid; the centroids
+        are not refit, so rebuild after the data has drifted. A new index is
+        returned and this one is left untouched for concurrent searches.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.metric == 'cosine':
+            vectors = self._normalize(vectors)
+        n_lists = len(self.centroids)
+        assignment = np.concatenate([
+            np.repeat(np.arange(n_lists), np.diff(self.list_offsets)),
+            np.argmax(self._normalize(vectors) @ self.centroids.T, axis=1)
+        ])
+        ids = np.concatenate([self.list_items, np.arange(len(self), len(self) + len(vectors), dtype=np.int32)])
+        order = np.argsort(assignment, kind='stable')
+
+        index = IVFIndex(n_lists=self.n_lists, n_probe=self.n_probe, metric=self.metric, n_iter=self.n_iter,
+                         sample_size=self.sample_size, random_state=self.random_state)
+        index.centroids = self.centroids
+        index.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+        index.list_items = ids[order].astype(np.int32)
+        index.vectors = np.concatenate([self.vectors, vectors])[order]
+        index._build_positions()
+        return index
+
+    def _build_positions(self):
+        self._positions = np.empty(len(self.list_items), dtype=np.int64)
+        self._positions[self.list_items] = np.arange(len(self.list_items))
+
+    def vector(self, item_id):
+        """Stored (possibly normalized) vector for an indexed id"""
+        return self.vectors[self._positions[item_id]]
+
+    def __len__(self):
+        return 0 if self.list_items is None else len(self.list_items)
+
+    def _prepare_query(self, query):
+        query = np.asarray(query, dtype=np.float32).ravel()
+        return self._normalize(query) if self.metric == 'cosine' else query
+
+    def search(self, query, k=10, n_probe=None):
+        """
+        Approximate top-k search
+
+        Args:
+            query: Query vector (d,)
+            k: Number of results
+            n_probe: Lists to scan (defaults to ``self.n_probe``)
+
+        Returns:
+            Tuple of (ids, scores) sorted by descending score
+        """
+        query = self._prepare_query(query)
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        # Lists are stored contiguously, so each probe is a slice, not a gather
+        ranges = [(self.list_offsets[p], self.list_offsets[p + 1]) for p in probe]
+        ids = np.concatenate([self.list_items[lo:hi] for lo, hi in ranges])
+        scores = np.concatenate([self.vectors[lo:hi] @ query for lo, hi in ranges])
+        return self._top_k(ids, scores, k)
+
+    def exact_search(self, query, k=10):
+        """Brute-force top-k over every indexed vector"""
+        query = self._prepare_query(query)
+        return self._top_k(self.list_items, self.vectors @ query, k)
+
+    @staticmethod
+    def _top_k(ids, scores, k):
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    def evaluate(self, queries=None, k=10, n_probe_values=(1, 2, 4, 8, 16, 32), n_queries=200):
+        """
+        Recall-versus-latency report against the exact scan
+
+        Args:
+            queries: Query vectors (defaults to a sample of indexed vectors)
+            k: Result list size used for recall@k
+            n_probe_values: Operating points to measure
+            n_queries: Number of sampled queries when ``queries`` is omitted
+
+        Returns:
+            List of dicts, one per n_probe, plus the exact-scan baseline
+        """
+        if queries is None:
+            rng = np.random.default_rng(self.random_state)
+            sample = rng.choice(len(self), min(len(self), n_queries), replace=False)
+            queries = self.vectors[sample]
+
+        exact_results = []
+        exact_latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            ids, _ = self.exact_search(query, k)
+            exact_latencies.append(time.perf_counter() - start)
+            exact_results.append(set(ids.tolist()))
+
+        report = [{
+            'n_probe': 'exact',
+            'recall': 1.0,
+            'mean_latency_ms': float(np.mean(exact_latencies) * 1000),
+            'p95_latency_ms': float(np.percentile(exact_latencies, 95) * 1000)
+        }]
+
+        for n_probe in n_probe_values:
+            if n_probe > len(self.centroids):
+                break
+            hits = 0
+            latencies = []
+            for query, expected in zip(queries, exact_results):
+                start = time.perf_counter()
+                ids, _ = self.search(query, k, n_probe)
+                latencies.append(time.perf_counter() - start)
+                hits += len(expected.intersection(ids.tolist()))
+            total = sum(len(expected) for expected in exact_results)
+            report.append({
+                'n_probe': n_probe,
+                'recall': hits / total if total else 1.0,
+                'mean_latency_ms': float(np.mean(latencies) * 1000),
+                'p95_latency_ms': float(np.percentile(latencies, 95) * 1000)
+            })
+
+        return report
+
+    def to_dict(self):
+        """Serializable state for persisting the index with a model"""
+        return {
+            'n_lists': self.n_lists,
+            'n_probe': self.n_probe,
+            'metric': self.metric,
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'list_items': self.list_items,
+            'vectors': self.vectors
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """Restore an index saved with ``to_dict``"""
+        index = cls(n_lists=state['n_lists'], n_probe=state['n_probe'], metric=state['metric'])
+        index.centroids = state['centroids']
+        index.list_offsets = state['list_offsets']
+        index.list_items = state['list_items']
+        index.vectors = state['vectors']
+        index._build_positions()
+        return index
@@ -0,0 +1,146 @@
+"""
+Model Artifacts
+Versioned on-disk model layout of raw NumPy/CSR arrays opened with mmap_mode
+"""
+
+import os
+import json
+import time
+import shutil
+import uuid
+import pickle
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the directory layout changes incompatibly
+ARTIFACT_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+
+def save_artifact(path, model_data, model_type=None):
+    """
+    Write ``model_data`` as an artifact directory
+
+    Arrays become ``.npy`` files, CSR matrices are split into their
+    data/indices/indptr arrays and id lists are stored as fixed-width unicode
+    arrays, so every large component can be memory-mapped on load. Scalars
+    live in ``manifest.json``; anything else (fitted vectorizers, feature
+    records) is pickled next to it. The directory is written under a temporary
+    name and renamed into place, so readers never see a partial artifact.
+
+    Args:
+        path: Artifact directory
+        model_data: Dict of component name -> value (nested dicts allowed)
+        model_type: Model class name recorded in the manifest
+    """
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_path)
+    try:
+        manifest = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'model_type': model_type,
+            'created_at': time.time(),
+            'components': {name: _write_component(tmp_path, name, value) for name, value in model_data.items()}
+        }
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    # Processes that mapped the old files keep their pages until they reload
+    old_path = None
+    if os.path.exists(path):
+        old_path = f"{path}.old-{uuid.uuid4().hex[:8]}"
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    if old_path:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _write_component(directory, name, value):
+    if value is None or isinstance(value, (bool, int, float, str, np.generic)):
+        return {'kind': 'value', 'value': value.item() if isinstance(value, np.generic) else value}
+
+    if issparse(value):
+        value = value.tocsr()
+        for part in ('data', 'indices', 'indptr'):
+            np.save(os.path.join(directory, f"{name}.{part}.npy"), getattr(value, part))
+        return {'kind': 'csr', 'shape': list(value.shape)}
+
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(value))
+        return {'kind': 'array'}
+
+    if isinstance(value, dict):
+        return {
+            'kind': 'dict',
+            'components': {key: _write_component(directory, f"{name}.{key}", item) for key, item in value.items()}
+        }
+
+    if isinstance(value, (list, tuple)):
+        if all(isinstance(item, str) for item in value):
+            # Compact id table: one fixed-width unicode array instead of pickled str objects
+            np.save(os.path.join(directory, f"{name}.npy"), np.array(value, dtype=str))
+            return {'kind': 'ids'}
+        if all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in value):
+            return {'kind': 'value', 'value': list(value)}
+
+    with open(os.path.join(directory, f"{name}.pkl"), 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {'kind': 'object'}
+
+
+def load_artifact(path, mmap_mode='r'):
+    """
+    Load model data saved with ``save_artifact``, or a legacy joblib pickle
+
+    Arrays are opened with ``mmap_mode`` so processes loading the same
+    artifact share one page-cache copy; they are read-only, so models must
+    copy before mutating them in place.
+
+    Returns:
+        Dict of component name -> value, in the shape passed to ``save_artifact``
+    """
+    if not os.path.isdir(path):
+        import joblib
+        return joblib.load(path)
+
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest['format_version'] > ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Artifact format {manifest['format_version']} is newer than supported ({ARTIFACT_FORMAT_VERSION})")
+
+    return {
+        name: _read_component(path, name, entry, mmap_mode)
+        for name, entry in manifest['components'].items()
+    }
+
+
+def _read_component(directory, name, entry, mmap_mode):
+    kind = entry['kind']
+    if kind == 'value':
+        return entry['value']
+    if kind == 'array':
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+    if kind == 'csr':
+        data, indices, indptr = (
+            np.load(os.path.join(directory, f"{name}.{part}.npy"), mmap_mode=mmap_mode)
+            for part in ('data', 'indices', 'indptr')
+        )
+        return csr_matrix((data, indices, indptr), shape=tuple(entry['shape']), copy=False)
+    if kind == 'ids':
+        # Models index ids through dicts and append to them, so hand back a list
+        return np.load(os.path.join(directory, f"{name}.npy")).tolist()
+    if kind == 'dict':
+        return {
+            key: _read_component(directory, f"{name}.{key}", item, mmap_mode)
+            for key, item in entry['components'].items()
+        }
+    if kind == 'object':
+        with open(os.path.join(directory, f"{name}.pkl"), 'rb') as f:
+            return pickle.load(f)
+    raise ValueError(f"Unknown artifact component kind: {kind}")
@@ -3,22 +3,206 @@ Collaborative Filtering Recommendation Model
 Uses user-product interaction matrix and similarity-based filtering
 """
 
+import threading
 import numpy as np
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from scipy.sparse import dok_matrix
-import joblib
+from scipy.sparse import coo_matrix, csr_matrix
 import logging
 
+from .neighbors import top_k_neighbors, neighbors_to_csr, resize_csr, scale_rows, SparseRows, DEFAULT_MAX_BLOCK_BYTES
+from .artifacts import save_artifact, load_artifact
+
 logger = logging.getLogger(__name__)
 
+# Implicit feedback weight for each tracked action type
+ACTION_SCORES = {
+    'view': 1,
+    'click': 2,
+    'add_to_cart': 3,
+    'purchase': 5,
+    'wishlist': 4
+}
+
+
+def count_interactions(interaction_data):
+    """Number of interactions in a list of dicts or a dict of equal-length columns"""
+    if not interaction_data:
+        return 0
+    if isinstance(interaction_data, dict):
+        return len(next(iter(interaction_data.values())))
+    return len(interaction_data)
+
+
+def _interaction_frame(interaction_data):
+    """Interactions as a DataFrame with usable ids, plus their action-weighted scores"""
+    # Imported on first use so serving a loaded snapshot never pays for pandas
+    import pandas as pd
+    df = pd.DataFrame(interaction_data)
+    df = df.dropna(subset=['userId', 'productId'])
+
+    if 'action' in df.columns:
+        scores = df['action'].map(ACTION_SCORES).fillna(1)
+    elif 'score' in df.columns:
+        scores = df['score'].fillna(1)
+    else:
+        scores = pd.Series(1, index=df.index)
+
+    return df, scores
+
+
+def build_interaction_matrix(interaction_data):
+    """
+    Build a sparse user-item matrix from raw interactions in one vectorized step
+
+    Users and products are integer-coded with ``pd.factorize`` and the scores
+    are scattered into a COO matrix; converting to CSR sums duplicate
+    (user, product) interactions. Interactions already interned by the
+    behavior store skip the DataFrame entirely.
+
+    Args:
+        interaction_data: List of dicts with userId, productId, and score/action,
+            a dict of those columns, or ``BehaviorStore.interaction_arrays()``
+
+    Returns:
+        Tuple of (csr user-item matrix, user_ids, product_ids)
+    """
+    if isinstance(interaction_data, dict) and 'user_codes' in interaction_data:
+        return _coded_interaction_matrix(interaction_data)
+    
+    import pandas as pd
+    df, scores = _interaction_frame(interaction_data)
+
+    user_codes, user_ids = pd.factorize(df['userId'].astype(str))
+    product_codes, product_ids = pd.factorize(df['productId'].astype(str))
+
+    matrix = coo_matrix(
+        (scores.to_numpy(dtype=np.float32), (user_codes, product_codes)),
+        shape=(len(user_ids), len(product_ids))
+    ).tocsr()
+    matrix.sum_duplicates()
+
+    return matrix, user_ids.tolist(), product_ids.tolist()
+
+
+def _coded_interaction_matrix(arrays):
+    """User-item matrix from interned code arrays, compacted to the ids that occur"""
+    user_codes, product_codes = arrays['user_codes'], arrays['product_codes']
+    valid = (user_codes >= 0) & (product_codes >= 0)
+    
+    # One score per action code; the extra last entry serves code -1 (no action)
+    action_scores = np.array(
+        [ACTION_SCORES.get(name, 1) for name in arrays['action_names']] + [1], dtype=np.float32
+    )
+    scores = action_scores[arrays['action_codes'][valid]]
+    
+    user_used, user_index = np.unique(user_codes[valid], return_inverse=True)
+    product_used, product_index = np.unique(product_codes[valid], return_inverse=True)
+    matrix = coo_matrix(
+        (scores, (user_index, product_index)), shape=(len(user_used), len(product_used))
+    ).tocsr()
+    matrix.sum_duplicates()
+    
+    user_ids, product_ids = arrays['user_ids'], arrays['product_ids']
+    return matrix, [user_ids[code] for code in user_used], [product_ids[code] for code in product_used]
+
+
+def code_interactions(user_index, product_index, interaction_data):
+    """
+    Integer-code new interactions against existing user and product indexes
+
+    Unseen users and products get the codes following the existing ones.
+
+    Returns:
+        Tuple of (csr delta matrix over all users and products, appended user
+        ids, appended product ids, touched user rows, touched product columns)
+    """
+    df, scores = _interaction_frame(interaction_data)
+    users = df['userId'].astype(str).tolist()
+    products = df['productId'].astype(str).tolist()
+
+    new_user_ids = [uid for uid in dict.fromkeys(users) if uid not in user_index]
+    new_product_ids = [pid for pid in dict.fromkeys(products) if pid not in product_index]
+    added_users = {uid: len(user_index) + idx for idx, uid in enumerate(new_user_ids)}
+    added_products = {pid: len(product_index) + idx for idx, pid in enumerate(new_product_ids)}
+
+    user_codes = np.array([user_index.get(uid, added_users.get(uid)) for uid in users], dtype=np.int64)
+    product_codes = np.array([product_index.get(pid, added_products.get(pid)) for pid in products], dtype=np.int64)
+
+    shape = (len(user_index) + len(new_user_ids), len(product_index) + len(new_product_ids))
+    delta = coo_matrix(
+        (scores.to_numpy(dtype=np.float32), (user_codes, product_codes)), shape=shape
+    ).tocsr()
+
+    return delta, new_user_ids, new_product_ids, np.unique(user_codes), np.unique(product_codes)
+
+
+def fold_in_interactions(user_item_matrix, user_index, product_index, interaction_data):
+    """
+    Add new interactions to an existing user-item matrix
+
+    Unseen users and products are appended after the existing rows/columns.
+    The input matrix is not modified; a new matrix is returned so readers
+    holding the old one stay consistent.
+
+    Returns:
+        Tuple of (new matrix, appended user ids, appended product ids,
+        touched user rows, touched product columns)
+    """
+    delta, new_user_ids, new_product_ids, touched_users, touched_products = code_interactions(
+        user_index, product_index, interaction_data
+    )
+    matrix = (resize_csr(user_item_matrix, delta.shape) + delta).tocsr()
+
+    return matrix, new_user_ids, new_product_ids, touched_users, touched_products
+
+
+def popular_products(user_item_matrix, product_ids, n=10):
+    """Get most popular products based on summed interaction scores"""
+    return rank_popular(np.asarray(user_item_matrix.sum(axis=0)).ravel(), product_ids, n)
+
+
+def rank_popular(product_popularity, product_ids, n=10):
+    """Top products of a per-product popularity array"""
+    top_indices = product_popularity.argsort()[::-1][:n]
+    
+    return [
+        {
+            'product_id': str(product_ids[idx]),
+            'score': float(product_popularity[idx]),
+            'rank': rank + 1,
+            'reason': 'popular'
+        }
+        for rank, idx in enumerate(top_indices)
+        if product_popularity[idx] > 0
+    ]
+
+
 class CollaborativeFilter:
-    def __init__(self):
-        self.user_item_matrix = None
-        self.user_similarity = None
+    def __init__(self, n_neighbors=50, n_jobs=None, max_block_bytes=DEFAULT_MAX_BLOCK_BYTES):
+        """
+        Args:
+            n_neighbors: Number of most similar users kept per user
+            n_jobs: Worker threads for the neighbor computation (defaults to CPU count)
+            max_block_bytes: Memory budget for in-flight similarity blocks
+        """
+        self.n_neighbors = n_neighbors
+        self.n_jobs = n_jobs
+        self.max_block_bytes = max_block_bytes
+        # User-item matrix and top-K neighbor graph; online updates replace rows in an overlay
+        self.interactions = None
+        self.similarity = None
         self.product_ids = []
         self.user_ids = []
+        self._user_index = {}
+        self._product_index = {}
         self.trained = False
+        # Summed scores per product and L2 norms per user, kept in over-allocated
+        # buffers so online updates only touch the affected entries
+        self._popularity = None
+        self._norms = None
+        # Guards the published (ids, matrix, similarity) state; held only to swap or snapshot
+        self._lock = threading.Lock()
+        # Serializes online updates against each other
+        self._update_lock = threading.Lock()
     
     def train(self, interaction_data):
         """
@@ -28,64 +212,137 @@ class CollaborativeFilter:
             interaction_data: List of dicts with userId, productId, and score/action
         """
         try:
-            if not interaction_data or len(interaction_data) == 0:
+            n_interactions = count_interactions(interaction_data)
+            if n_interactions == 0:
                 logger.warning("No interaction data provided for training")
                 return
             
-            logger.info(f"Training collaborative filter with {len(interaction_data)} interactions")
-            
-            # Convert to DataFrame
-            df = pd.DataFrame(interaction_data)
-            
-            # Create scoring based on action types
-            action_scores = {
-                'view': 1,
-                'click': 2,
-                'add_to_cart': 3,
-                'purchase': 5,
-                'wishlist': 4
-            }
-            
-            if 'action' in df.columns:
-                df['score'] = df['action'].map(action_scores).fillna(1)
-            elif 'score' not in df.columns:
-                df['score'] = 1
+            logger.info(f"Training collaborative filter with {n_interactions} interactions")
             
-            # Get unique users and products
-            self.user_ids = df['userId'].unique().tolist()
-            self.product_ids = df['productId'].unique().tolist()
+            user_item_matrix, user_ids, product_ids = build_interaction_matrix(interaction_data)
+            n_users, n_products = user_item_matrix.shape
             
-            # Create user-item matrix
-            n_users = len(self.user_ids)
-            n_products = len(self.product_ids)
+            # Keep only the top-K neighbors per user as a sparse graph so memory
+            # stays linear in n_users * K
+            neighbor_idx, neighbor_scores = top_k_neighbors(
+                user_item_matrix,
+                self.n_neighbors,
+                n_jobs=self.n_jobs,
+                max_block_bytes=self.max_block_bytes
+            )
+            user_similarity = neighbors_to_csr(neighbor_idx, neighbor_scores, n_users)
             
-            self.user_item_matrix = dok_matrix((n_users, n_products), dtype=np.float32)
+            with self._update_lock, self._lock:
+                self._set_state(user_item_matrix, user_similarity, user_ids, product_ids)
+                self.trained = True
+            logger.info(f"✅ Collaborative filter trained: {n_users} users, {n_products} products")
             
-            user_id_map = {uid: idx for idx, uid in enumerate(self.user_ids)}
-            product_id_map = {pid: idx for idx, pid in enumerate(self.product_ids)}
+        except Exception as e:
+            logger.error(f"Error training collaborative filter: {str(e)}")
+            raise
+    
+    @property
+    def user_item_matrix(self):
+        """The user-item matrix as one CSR (merges pending row updates, so O(nnz))"""
+        return self.interactions.tocsr() if self.interactions is not None else None
+    
+    @property
+    def user_similarity(self):
+        """The top-K neighbor graph as one CSR"""
+        return self.similarity.tocsr() if self.similarity is not None else None
+    
+    def _set_state(self, user_item_matrix, user_similarity, user_ids, product_ids):
+        self.interactions = SparseRows(user_item_matrix)
+        self.similarity = SparseRows(user_similarity)
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self._popularity = np.bincount(
+            user_item_matrix.indices, weights=user_item_matrix.data, minlength=user_item_matrix.shape[1]
+        )
+        self._norms = None
+        self._build_indexes()
+    
+    def _build_indexes(self):
+        self._user_index = {uid: idx for idx, uid in enumerate(self.user_ids)}
+        self._product_index = {pid: idx for idx, pid in enumerate(self.product_ids)}
+    
+    @staticmethod
+    def _grow(buffer, n):
+        """Return a writable buffer with room for ``n`` entries, doubling when full"""
+        if n <= len(buffer):
+            return buffer
+        grown = np.zeros(max(n, 2 * len(buffer)), dtype=buffer.dtype)
+        grown[:len(buffer)] = buffer
+        return grown
+    
+    def partial_fit(self, interaction_data):
+        """
+        Fold new interactions into the trained model without a full retrain
+        
+        The affected users' rows are updated, unseen users and products are
+        appended, and the top-K neighbor lists of the affected users are
+        recomputed. Only those users are renormalized and scored, against
+        the users sharing a product with them (through an inverted index of
+        the matrix), so the cost follows the touched users' neighborhoods
+        rather than the matrix. Other users' neighbor lists are refreshed at
+        the next full training run. The new state is built off to the side
+        and published with a single swap, so concurrent ``recommend`` calls
+        see either the old or the new model.
+        
+        Args:
+            interaction_data: List of dicts with userId, productId, and score/action
+        """
+        if not self.trained or not interaction_data:
+            return
+        
+        with self._update_lock:
+            delta, new_user_ids, new_product_ids, touched_users, _ = code_interactions(
+                self._user_index, self._product_index, interaction_data
+            )
+            n_users, n_products = delta.shape
+            n_old_users = self.interactions.n_rows
+            if self._norms is None:
+                matrix = self.interactions.tocsr()
+                self._norms = np.sqrt(np.bincount(
+                    np.repeat(np.arange(n_old_users), np.diff(matrix.indptr)),
+                    weights=matrix.data.astype(np.float64) ** 2, minlength=n_old_users
+                ))
             
-            # Fill matrix with interaction scores
-            for _, row in df.iterrows():
-                user_idx = user_id_map.get(row['userId'])
-                product_idx = product_id_map.get(row['productId'])
-                
-                if user_idx is not None and product_idx is not None:
-                    # Accumulate scores for multiple interactions
-                    self.user_item_matrix[user_idx, product_idx] += row['score']
+            # Touched rows = their previous rows (none for new users) plus the new interactions
+            rows = self.interactions.plus(touched_users, delta[touched_users])
+            interactions = self.interactions.replace(touched_users, rows, n_users)
             
-            # Convert to dense for similarity calculation
-            matrix_dense = self.user_item_matrix.toarray()
+            norms = self._grow(self._norms, n_users)
+            norms[touched_users] = np.sqrt(np.asarray(rows.multiply(rows).sum(axis=1)).ravel())
             
-            # Calculate user similarity using cosine similarity
-            # Add small epsilon to avoid division by zero
-            self.user_similarity = cosine_similarity(matrix_dense + 1e-9)
+            # Cosine similarity of the touched users with every user sharing a product
+            # (both have interactions, so neither norm is zero)
+            neighbor_idx, neighbor_scores = interactions.top_k(
+                scale_rows(rows, 1 / norms[touched_users]),
+                min(self.n_neighbors, n_users),
+                self_indices=touched_users,
+                column_norms=norms
+            )
+            similarity = self.similarity.replace(
+                touched_users, neighbors_to_csr(neighbor_idx, neighbor_scores, n_users), n_users
+            )
             
-            self.trained = True
-            logger.info(f"✅ Collaborative filter trained: {n_users} users, {n_products} products")
+            popularity = self._grow(self._popularity, n_products)
             
-        except Exception as e:
-            logger.error(f"Error training collaborative filter: {str(e)}")
-            raise
+            with self._lock:
+                np.add.at(popularity, delta.indices, delta.data)
+                for uid in new_user_ids:
+                    self._user_index[uid] = len(self.user_ids)
+                    self.user_ids.append(uid)
+                for pid in new_product_ids:
+                    self._product_index[pid] = len(self.product_ids)
+                    self.product_ids.append(pid)
+                self.interactions = interactions
+                self.similarity = similarity
+                self._popularity = popularity
+            self._norms = norms
+        
+        logger.debug(f"Folded {len(interaction_data)} interactions into collaborative filter ({len(touched_users)} users)")
     
     def recommend(self, user_id, n_recommendations=10):
         """
@@ -103,35 +360,45 @@ class CollaborativeFilter:
                 logger.warning("Model not trained yet")
                 return []
             
+            # Snapshot the published state so a concurrent update can't mix versions
+            with self._lock:
+                user_idx = self._user_index.get(str(user_id))
+                interactions = self.interactions
+                similarity = self.similarity
+                product_ids = self.product_ids
+            
             # Check if user exists in training data
-            if user_id not in self.user_ids:
+            if user_idx is None:
                 logger.info(f"User {user_id} not in training data, returning popular items")
                 return self._get_popular_products(n_recommendations)
             
-            user_idx = self.user_ids.index(user_id)
-            
-            # Get similar users
-            similar_users = self.user_similarity[user_idx]
-            
-            # Get weighted average of similar users' preferences
-            user_ratings = self.user_item_matrix.toarray()
-            weighted_ratings = similar_users.dot(user_ratings)
+            # Weighted sum of the K nearest neighbors' preferences (sparse)
+            similar_users = similarity.rows([user_idx])
+            weights = csr_matrix(similar_users.data.reshape(1, -1))
+            weighted_ratings = (weights @ interactions.rows(similar_users.indices)).tocsr()
+            candidate_ids = weighted_ratings.indices
+            candidate_scores = weighted_ratings.data
             
             # Get products user hasn't interacted with
-            user_products = user_ratings[user_idx]
-            weighted_ratings[user_products > 0] = -np.inf  # Exclude already interacted products
+            user_products = interactions.rows([user_idx]).indices
+            keep = ~np.isin(candidate_ids, user_products) & (candidate_scores > 0)
+            candidate_ids = candidate_ids[keep]
+            candidate_scores = candidate_scores[keep]
             
             # Get top N recommendations
-            top_indices = weighted_ratings.argsort()[::-1][:n_recommendations]
+            if len(candidate_scores) > n_recommendations:
+                top = np.argpartition(-candidate_scores, n_recommendations - 1)[:n_recommendations]
+            else:
+                top = np.arange(len(candidate_scores))
+            top = top[np.argsort(-candidate_scores[top])]
             
             recommendations = [
-               {
-                    'product_id': str(self.product_ids[idx]),
-                    'score': float(weighted_ratings[idx]),
+                {
+                    'product_id': str(product_ids[candidate_ids[idx]]),
+                    'score': float(candidate_scores[idx]),
                     'rank': rank + 1
                 }
-                for rank, idx in enumerate(top_indices)
-                if weighted_ratings[idx] > -np.inf
+                for rank, idx in enumerate(top)
             ]
             
             # If not enough recommendations, fill with popular items
@@ -147,23 +414,10 @@ class CollaborativeFilter:
     
     def _get_popular_products(self, n=10):
         """Get most popular products based on interaction count"""
-        if not self.trained or self.user_item_matrix is None:
+        if not self.trained or self._popularity is None:
             return []
         
-        # Sum interactions across all users
-        product_popularity = np.array(self.user_item_matrix.sum(axis=0)).flatten()
-        top_indices = product_popularity.argsort()[::-1][:n]
-        
-        return [
-            {
-                'product_id': str(self.product_ids[idx]),
-                'score': float(product_popularity[idx]),
-                'rank': rank + 1,
-                'reason': 'popular'
-            }
-            for rank, idx in enumerate(top_indices)
-            if product_popularity[idx] > 0
-        ]
+        return rank_popular(self._popularity[:len(self.product_ids)], self.product_ids, n)
     
     def save_model(self, filepath):
         """Save trained model to disk"""
@@ -178,19 +432,23 @@ class CollaborativeFilter:
                 'user_ids': self.user_ids,
                 'trained': self.trained
             }
-            joblib.dump(model_data, filepath)
+            save_artifact(filepath, model_data, type(self).__name__)
             logger.info(f"✅ Model saved to {filepath}")
         except Exception as e:
             logger.error(f"Error saving model: {str(e)}")
+            raise
     
     def load_model(self, filepath):
         """Load trained model from disk"""
         try:
-            model_data = joblib.load(filepath)
-            self.user_item_matrix = model_data['user_item_matrix']
-            self.user_similarity = model_data['user_similarity']
-            self.product_ids = model_data['product_ids']
-            self.user_ids = model_data['user_ids']
+            model_data = load_artifact(filepath)
+            # Older pickles hold a dok matrix and a dense similarity array
+            self._set_state(
+                csr_matrix(model_data['user_item_matrix']),
+                csr_matrix(model_data['user_similarity']),
+                model_data['product_ids'],
+                model_data['user_ids']
+            )
             self.trained = model_data['trained']
             logger.info(f"✅ Model loaded from {filepath}")
         except Exception as e:
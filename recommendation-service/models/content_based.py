@@ -3,26 +3,79 @@ Content-Based Filtering Recommendation Model
 Uses product features and TF-IDF for similarity
 """
 
+import threading
 import numpy as np
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import joblib
+from scipy.sparse import csr_matrix
 import logging
 
+from .ann_index import IVFIndex
+from .neighbors import top_k_neighbors, top_k_rows, SparseRows, DEFAULT_MAX_BLOCK_BYTES
+from .artifacts import save_artifact, load_artifact
+
 logger = logging.getLogger(__name__)
 
 class ContentBasedFilter:
-    def __init__(self):
-        self.tfidf_vectorizer = TfidfVectorizer(
-            max_features=500,
-            stop_words='english',
-            ngram_range=(1, 2)
-        )
-        self.tfidf_matrix = None
+    def __init__(self, n_similar=50, ann_threshold=5000, ann_components=64,
+                 n_jobs=None, max_block_bytes=DEFAULT_MAX_BLOCK_BYTES,
+                 incremental=False, n_features=2 ** 18):
+        """
+        Args:
+            n_similar: Size of the precomputed similar-products table per product
+            ann_threshold: Catalog size from which an ANN index replaces the exact scan
+            ann_components: SVD dimensions of the item vectors held in the ANN index
+            n_jobs: Worker threads for the table computation (defaults to CPU count)
+            max_block_bytes: Memory budget for in-flight similarity blocks
+            incremental: Use a hashed feature space with persisted document
+                         frequencies so products can be upserted/removed
+                         without refitting the vocabulary
+            n_features: Hashed feature space size in incremental mode
+        """
+        self.n_similar = n_similar
+        self.n_jobs = n_jobs
+        self.max_block_bytes = max_block_bytes
+        self.neighbor_indices = None
+        self.neighbor_scores = None
+        self.ann_threshold = ann_threshold
+        self.ann_components = ann_components
+        self.ann_index = None
+        # pandas and scikit-learn are imported on first use, so serving a
+        # loaded snapshot doesn't pay for them at startup
+        self.tfidf_vectorizer = None
+        self.incremental = incremental
+        self.n_features = n_features
+        self._hasher = None
+        self.document_frequency = None
+        self.n_documents = 0
+        # TF-IDF rows; catalog updates replace rows in an overlay instead of copying the matrix
+        self.tfidf_rows = None
         self.product_features = None
         self.product_ids = []
+        self._product_index = {}
         self.trained = False
+        # Table arrays are views into over-allocated buffers so appended products can be added
+        self._index_buffer = None
+        self._score_buffer = None
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+    
+    @property
+    def tfidf_matrix(self):
+        """The TF-IDF matrix as one CSR (merges pending row updates, so O(nnz))"""
+        return self.tfidf_rows.tocsr() if self.tfidf_rows is not None else None
+    
+    @property
+    def hashing_vectorizer(self):
+        if self._hasher is None:
+            from sklearn.feature_extraction.text import HashingVectorizer
+            # Raw term counts; IDF weighting and normalization are applied on top
+            self._hasher = HashingVectorizer(
+                n_features=self.n_features,
+                stop_words='english',
+                ngram_range=(1, 2),
+                alternate_sign=False,
+                norm=None
+            )
+        return self._hasher
     
     def train(self, product_data):
         """
@@ -40,47 +93,356 @@ class ContentBasedFilter:
             logger.info(f"Training content-based filter with {len(product_data)} products")
             
             # Convert to DataFrame
+            import pandas as pd
             df = pd.DataFrame(product_data)
             
-            # Store product IDs
-            self.product_ids = df['_id'].astype(str).tolist() if '_id' in df.columns else df['id'].astype(str).tolist()
+            with self._update_lock:
+                # Store product IDs
+                product_ids = self._ids(df)
+                
+                # Create TF-IDF matrix
+                if self.incremental:
+                    counts = self.hashing_vectorizer.transform(self._combined_features(df))
+                    self.document_frequency = np.bincount(counts.indices, minlength=counts.shape[1]).astype(np.int64)
+                    self.n_documents = counts.shape[0]
+                    tfidf_matrix = self._weight(counts)
+                else:
+                    from sklearn.feature_extraction.text import TfidfVectorizer
+                    self.tfidf_vectorizer = TfidfVectorizer(
+                        max_features=500,
+                        stop_words='english',
+                        ngram_range=(1, 2)
+                    )
+                    tfidf_matrix = self.tfidf_vectorizer.fit_transform(self._combined_features(df))
+                
+                # Store product features for reference
+                product_features = df[['name', 'category', 'price']].to_dict('records') if 'name' in df.columns else []
+                
+                # Materialize the top-N similar products per product (TF-IDF rows are L2-normalized)
+                neighbor_indices, neighbor_scores = top_k_neighbors(
+                    tfidf_matrix,
+                    self.n_similar,
+                    n_jobs=self.n_jobs,
+                    max_block_bytes=self.max_block_bytes,
+                    normalized=True
+                )
+                
+                with self._lock:
+                    self.product_ids = product_ids
+                    self.tfidf_rows = SparseRows(tfidf_matrix)
+                    self.product_features = product_features
+                    self._product_index = {pid: idx for idx, pid in enumerate(product_ids)}
+                    self._set_tables(neighbor_indices, neighbor_scores)
+                
+                # Large catalogs get an ANN index over SVD-reduced TF-IDF vectors
+                self.ann_index = self._build_ann_index(tfidf_matrix) if len(product_ids) >= self.ann_threshold else None
             
-            # Create combined feature text from name, description, category
-            df['combined_features'] = ''
+            self.trained = True
+            logger.info(f"✅ Content-based filter trained with {len(self.product_ids)} products")
             
-            if 'name' in df.columns:
-                df['combined_features'] += df['name'].fillna('').astype(str) + ' '
+        except Exception as e:
+            logger.error(f"Error training content-based filter: {str(e)}")
+            raise
+    
+    @staticmethod
+    def _ids(df):
+        return df['_id'].astype(str).tolist() if '_id' in df.columns else df['id'].astype(str).tolist()
+    
+    @staticmethod
+    def _combined_features(df):
+        """Create combined feature text from name, description, category and tags"""
+        import pandas as pd
+        combined = pd.Series('', index=df.index)
+        
+        if 'name' in df.columns:
+            combined += df['name'].fillna('').astype(str) + ' '
+        
+        if 'description' in df.columns:
+            combined += df['description'].fillna('').astype(str) + ' '
+        
+        if 'category' in df.columns:
+            # Repeat category multiple times to increase its weight
+            combined += (df['category'].fillna('').astype(str) + ' ') * 3
+        
+        if 'tags' in df.columns:
+            combined += df['tags'].fillna('').astype(str) + ' '
+        
+        return combined
+    
+    def _weight(self, counts):
+        """Apply smoothed IDF from the persisted document frequencies and L2-normalize"""
+        from sklearn.preprocessing import normalize
+        idf = np.log((1 + self.n_documents) / (1 + self.document_frequency)) + 1
+        weighted = csr_matrix(counts, dtype=np.float64, copy=True)
+        weighted.data *= idf[weighted.indices]
+        return normalize(weighted)
+    
+    def _transform(self, df):
+        """Vectorize products without changing the model's state"""
+        if self.incremental:
+            return self._weight(self.hashing_vectorizer.transform(self._combined_features(df)))
+        return self.tfidf_vectorizer.transform(self._combined_features(df))
+    
+    def upsert_products(self, product_data):
+        """
+        Add new products or re-index edited ones without a full retrain
+        
+        Only the given products are vectorized and scored against the
+        catalog. Their TF-IDF rows are replaced (or appended) in an overlay,
+        the document frequencies are adjusted and only the similar-products
+        lists they enter or leave are rewritten, so the cost is proportional
+        to the changed products and their neighborhoods rather than the
+        catalog. Existing rows keep the IDF weights they were indexed with
+        until the next full ``train``.
+        
+        Args:
+            product_data: List of product dicts (same shape as for ``train``)
+        
+        Returns:
+            Number of products indexed
+        """
+        if not product_data:
+            return 0
+        if not self.trained:
+            self.train(product_data)
+            return len(self.product_ids)
+        if not self.incremental:
+            raise ValueError("Catalog updates require a model trained with incremental=True")
+        
+        import pandas as pd
+        df = pd.DataFrame(product_data)
+        df['_pid'] = self._ids(df)
+        df = df.drop_duplicates('_pid', keep='last').reset_index(drop=True)
+        product_ids = df['_pid'].tolist()
+        
+        with self._update_lock:
+            n_old = len(self.product_ids)
+            positions = np.array([self._product_index.get(pid, -1) for pid in product_ids], dtype=np.int64)
+            is_new = positions < 0
+            positions[is_new] = np.arange(n_old, n_old + int(is_new.sum()))
+            n_total = n_old + int(is_new.sum())
             
-            if 'description' in df.columns:
-                df['combined_features'] += df['description'].fillna('').astype(str) + ' '
+            # Edited products stop counting towards the frequencies of their old terms
+            counts = self.hashing_vectorizer.transform(self._combined_features(df))
+            edited = positions[~is_new]
+            old_rows = self.tfidf_rows.rows(edited)
+            n_features = counts.shape[1]
+            self.document_frequency = (
+                self.document_frequency
+                - np.bincount(old_rows.indices, minlength=n_features)
+                + np.bincount(counts.indices, minlength=n_features)
+            )
+            self.n_documents += int(is_new.sum())
             
-            if 'category' in df.columns:
-                # Repeat category multiple times to increase its weight
-                df['combined_features'] += (df['category'].fillna('').astype(str) + ' ') * 3
+            tfidf_rows = self.tfidf_rows.replace(positions, self._weight(counts), n_total)
+            patch = self._refresh_neighbor_tables(tfidf_rows, positions, edited, old_rows, np.zeros(0, dtype=np.int64))
+            index_buffer, score_buffer = self._table_buffers(n_total, patch[1].shape[1])
+            records = [
+                {key: record[key] for key in ('name', 'category', 'price') if key in record}
+                for record in df.to_dict('records')
+            ]
             
-            if 'tags' in df.columns:
-                df['combined_features'] += df['tags'].fillna('').astype(str) + ' '
+            with self._lock:
+                for pid in np.array(product_ids)[is_new]:
+                    self._product_index[pid] = len(self.product_ids)
+                    self.product_ids.append(pid)
+                # Features are only kept when they were known for the whole catalog
+                if len(self.product_features) >= n_old:
+                    self.product_features.extend({} for _ in range(n_total - len(self.product_features)))
+                    for position, record in zip(positions, records):
+                        self.product_features[position] = record
+                self.tfidf_rows = tfidf_rows
+                self._patch_tables(index_buffer, score_buffer, n_total, *patch)
+        
+        logger.info(f"Indexed {len(product_ids)} catalog products ({int(is_new.sum())} new)")
+        return len(product_ids)
+    
+    def remove_products(self, product_ids):
+        """
+        Drop products from the index and from every similar-products list
+        
+        Removed rows are zeroed rather than compacted, so the positions of the
+        remaining products stay stable until the next full ``train``.
+        
+        Returns:
+            Number of products removed
+        """
+        if not self.trained:
+            return 0
+        if not self.incremental:
+            raise ValueError("Catalog updates require a model trained with incremental=True")
+        
+        with self._update_lock:
+            positions = np.array(
+                [self._product_index[str(pid)] for pid in product_ids if str(pid) in self._product_index],
+                dtype=np.int64
+            )
+            positions = np.unique(positions)
+            if len(positions) == 0:
+                return 0
             
-            # Create TF-IDF matrix
-            self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(df['combined_features'])
+            old_rows = self.tfidf_rows.rows(positions)
+            self.document_frequency = self.document_frequency - np.bincount(old_rows.indices, minlength=old_rows.shape[1])
+            self.n_documents -= len(positions)
             
-            # Store product features for reference
-            self.product_features = df[['name', 'category', 'price']].to_dict('records') if 'name' in df.columns else []
+            n_total = len(self.product_ids)
+            tfidf_rows = self.tfidf_rows.replace(positions, csr_matrix(old_rows.shape))
+            patch = self._refresh_neighbor_tables(tfidf_rows, np.zeros(0, dtype=np.int64), positions, old_rows, positions)
+            index_buffer, score_buffer = self._table_buffers(n_total, patch[1].shape[1])
             
-            self.trained = True
-            logger.info(f"✅ Content-based filter trained with {len(self.product_ids)} products")
+            with self._lock:
+                for position in positions:
+                    del self._product_index[self.product_ids[position]]
+                    if position < len(self.product_features):
+                        self.product_features[position] = {}
+                self.tfidf_rows = tfidf_rows
+                self._patch_tables(index_buffer, score_buffer, n_total, *patch)
+        
+        logger.info(f"Removed {len(positions)} products from the content index")
+        return len(positions)
+    
+    def _refresh_neighbor_tables(self, tfidf_rows, changed, replaced, replaced_rows, removed):
+        """
+        Rows of the top-N tables to rewrite after ``changed`` rows were
+        re-vectorized (or appended) and ``removed`` rows zeroed
+        
+        Only the changed products are scored against the catalog: they get
+        their own lists and are merged into the lists they now qualify for.
+        Lists that held one of the ``replaced`` products (previous vectors in
+        ``replaced_rows``) have a stale score and are recomputed; they are
+        found by scoring those previous vectors. No other row is read.
+        
+        Args:
+            tfidf_rows: TF-IDF rows after the update
+            changed: Positions re-vectorized or appended
+            replaced: Positions that existed before and changed or were removed
+            replaced_rows: Their TF-IDF rows before the update
+            removed: Positions removed
+        
+        Returns:
+            Tuple of (rows, indices, scores) to write into the tables
+        """
+        n_total = tfidf_rows.n_rows
+        n_table, old_width = self.neighbor_indices.shape
+        width = max(min(self.n_similar, n_total), old_width)
+        # Score rows a block at a time so a block's (possibly dense) scores fit the budget
+        block_size = int(max(1, self.max_block_bytes // (n_total * 12)))
+        
+        listers = [np.zeros(0, dtype=np.int64)]
+        for start in range(0, len(replaced), block_size):
+            previous = self.tfidf_rows.score(replaced_rows[start:start + block_size]).tocoo()
+            holder = previous.col < n_table
+            rows, products = previous.col[holder], replaced[start + previous.row[holder]]
+            if len(rows) * old_width > self.neighbor_indices.size:
+                # Cheaper to scan the whole table once than to check every pair
+                dirty = np.zeros(n_table, dtype=bool)
+                dirty[replaced[replaced < n_table]] = True
+                listed = self.neighbor_indices >= 0
+                listers = [np.flatnonzero((dirty[np.where(listed, self.neighbor_indices, 0)] & listed).any(axis=1))]
+                break
+            listed = (self.neighbor_indices[rows] == products[:, None]).any(axis=1)
+            listers.append(rows[listed])
+        
+        recompute = np.setdiff1d(np.union1d(changed, np.concatenate(listers)), removed)
+        is_changed = np.isin(recompute, changed)
+        indices = np.full((len(recompute), width), -1, dtype=np.int32)
+        scores = np.zeros((len(recompute), width), dtype=np.float32)
+        candidates = []
+        for start in range(0, len(recompute), block_size):
+            block = recompute[start:start + block_size]
+            sims = tfidf_rows.score(tfidf_rows.rows(block))
+            indices[start:start + len(block)], scores[start:start + len(block)] = top_k_rows(sims, width, self_indices=block)
             
-        except Exception as e:
-            logger.error(f"Error training content-based filter: {str(e)}")
-            raise
+            # Other lists a changed product enters: it beats their last entry
+            changed_sims = sims[np.flatnonzero(is_changed[start:start + len(block)])].tocoo()
+            rows = changed_sims.col.astype(np.int64)
+            products = block[is_changed[start:start + len(block)]][changed_sims.row]
+            values = changed_sims.data
+            keep = (rows < n_table) & ~np.isin(rows, recompute) & ~np.isin(rows, removed)
+            if old_width == width and width:
+                keep[keep] = values[keep] > self.neighbor_scores[rows[keep], -1]
+            candidates.append((rows[keep], products[keep], values[keep]))
+        
+        hit_rows = np.zeros(0, dtype=np.int64)
+        hit_indices = np.zeros((0, width), dtype=np.int32)
+        hit_scores = np.zeros((0, width), dtype=np.float32)
+        if candidates and sum(len(rows) for rows, _, _ in candidates):
+            rows, products, values = (np.concatenate(parts) for parts in zip(*candidates))
+            # At most ``width`` candidates per row, best first
+            order = np.lexsort((-values, rows))
+            rows, products, values = rows[order], products[order], values[order]
+            hit_rows, starts = np.unique(rows, return_index=True)
+            group = np.repeat(np.arange(len(hit_rows)), np.diff(np.append(starts, len(rows))))
+            rank = np.arange(len(rows)) - starts[group]
+            keep = rank < width
+            candidate_indices = np.full((len(hit_rows), width), -1, dtype=np.int32)
+            candidate_scores = np.zeros((len(hit_rows), width), dtype=np.float32)
+            candidate_indices[group[keep], rank[keep]] = products[keep]
+            candidate_scores[group[keep], rank[keep]] = values[keep]
+            
+            current_indices = np.full((len(hit_rows), width), -1, dtype=np.int32)
+            current_scores = np.zeros((len(hit_rows), width), dtype=np.float32)
+            current_indices[:, :old_width] = self.neighbor_indices[hit_rows]
+            current_scores[:, :old_width] = self.neighbor_scores[hit_rows]
+            merged_indices = np.hstack([current_indices, candidate_indices])
+            merged_scores = np.hstack([current_scores, candidate_scores])
+            top = np.argsort(-merged_scores, axis=1, kind='stable')[:, :width]
+            hit_scores = np.take_along_axis(merged_scores, top, axis=1)
+            hit_indices = np.where(hit_scores > 0, np.take_along_axis(merged_indices, top, axis=1), -1)
+        
+        return (
+            np.concatenate([recompute, hit_rows, removed]),
+            np.vstack([indices, hit_indices, np.full((len(removed), width), -1, dtype=np.int32)]),
+            np.vstack([scores, hit_scores, np.zeros((len(removed), width), dtype=np.float32)])
+        )
+    
+    def _set_tables(self, neighbor_indices, neighbor_scores):
+        self._index_buffer = neighbor_indices
+        self._score_buffer = neighbor_scores
+        self.neighbor_indices = neighbor_indices
+        self.neighbor_scores = neighbor_scores
+    
+    def _table_buffers(self, n_rows, width):
+        """Writable table buffers with room for ``n_rows`` rows of ``width``, doubling when full"""
+        index_buffer, score_buffer = self._index_buffer, self._score_buffer
+        if n_rows <= index_buffer.shape[0] and width == index_buffer.shape[1]:
+            if index_buffer.flags.writeable and score_buffer.flags.writeable:
+                return index_buffer, score_buffer
+            # Memory-mapped tables from a loaded artifact are read-only
+            return np.array(index_buffer), np.array(score_buffer)
+        capacity = n_rows if n_rows <= index_buffer.shape[0] else max(n_rows, 2 * index_buffer.shape[0])
+        n_current, current_width = self.neighbor_indices.shape
+        grown_indices = np.full((capacity, width), -1, dtype=np.int32)
+        grown_scores = np.zeros((capacity, width), dtype=np.float32)
+        grown_indices[:n_current, :current_width] = self.neighbor_indices
+        grown_scores[:n_current, :current_width] = self.neighbor_scores
+        return grown_indices, grown_scores
+    
+    def _patch_tables(self, index_buffer, score_buffer, n_rows, rows, indices, scores):
+        """Write rewritten rows and publish the table views; called under ``_lock``"""
+        index_buffer[rows] = indices
+        score_buffer[rows] = scores
+        self._index_buffer = index_buffer
+        self._score_buffer = score_buffer
+        self.neighbor_indices = index_buffer[:n_rows]
+        self.neighbor_scores = score_buffer[:n_rows]
     
-    def find_similar(self, product_id, n_recommendations=10):
+    def has_product(self, product_id):
+        """Check if a product was part of the last training run"""
+        return str(product_id) in self._product_index
+    
+    def find_similar(self, product_id, n_recommendations=10, product_data=None):
         """
         Find similar products based on content features
         
+        Served from the precomputed top-N table; live scoring is only used for
+        products added after the last training run (``product_data`` given)
+        or when more than ``n_similar`` results are requested.
+        
         Args:
             product_id: Product ID to find similar products for
             n_recommendations: Number of similar products to return
+            product_data: Product dict used to vectorize products unknown to the model
         
         Returns:
             List of similar product IDs with similarity scores
@@ -91,39 +453,76 @@ class ContentBasedFilter:
                 return []
             
             product_id = str(product_id)
+            with self._lock:
+                product_idx = self._product_index.get(product_id)
+                if product_idx is not None and n_recommendations <= self.neighbor_indices.shape[1]:
+                    # Table lookup: O(N)
+                    similar_indices = self.neighbor_indices[product_idx, :n_recommendations].copy()
+                    similar_scores = self.neighbor_scores[product_idx, :n_recommendations].copy()
+                else:
+                    similar_indices = None
+            
+            if similar_indices is not None:
+                valid = similar_indices >= 0
+                return self._format_similar(similar_indices[valid], similar_scores[valid])
             
-            # Check if product exists
-            if product_id not in self.product_ids:
+            if product_idx is not None:
+                product_vector = self.tfidf_rows.rows([product_idx])
+            elif product_data is not None:
+                logger.info(f"Product {product_id} added after training, scoring live")
+                import pandas as pd
+                product_vector = self._transform(pd.DataFrame([product_data]))
+            else:
                 logger.warning(f"Product {product_id} not found in training data")
                 return []
             
-            # Get product index
-            product_idx = self.product_ids.index(product_id)
-            
-            # Calculate cosine similarity with all products
-            product_vector = self.tfidf_matrix[product_idx]
-            similarities = cosine_similarity(product_vector, self.tfidf_matrix).flatten()
-            
-            # Get top N similar products (excluding the product itself)
-            similar_indices = similarities.argsort()[::-1][1:n_recommendations + 1]
-            
-            recommendations = [
-                {
-                    'product_id': self.product_ids[idx],
-                    'similarity_score': float(similarities[idx]),
-                    'rank': rank + 1,
-                    'features': self.product_features[idx] if idx < len(self.product_features) else {}
-                }
-                for rank, idx in enumerate(similar_indices)
-                if similarities[idx] > 0.01  # Minimum similarity threshold
-            ]
-            
-            return recommendations
+            similar_indices, similar_scores = self._live_similar(product_vector, n_recommendations, product_idx)
+            return self._format_similar(similar_indices, similar_scores)
             
         except Exception as e:
             logger.error(f"Error finding similar products: {str(e)}")
             return []
     
+    def _live_similar(self, product_vector, n_recommendations, product_idx=None):
+        """Score a TF-IDF vector against the catalog (ANN when available, else exact)"""
+        if self.ann_index is not None and product_idx is not None and product_idx < len(self.ann_index):
+            # Approximate candidates, re-ranked with exact TF-IDF cosine
+            candidates, _ = self.ann_index.search(self.ann_index.vector(product_idx), n_recommendations * 10 + 1)
+            candidates = candidates[candidates != product_idx]
+            candidate_scores = (self.tfidf_rows.rows(candidates) @ product_vector.T).toarray().ravel()
+            order = np.argsort(-candidate_scores)[:n_recommendations]
+            return candidates[order], candidate_scores[order]
+        
+        # Cosine similarity with all products (TF-IDF rows are L2-normalized)
+        similarities = self.tfidf_rows.score(product_vector).toarray().ravel()
+        if product_idx is not None:
+            similarities[product_idx] = -np.inf
+        
+        # Get top N similar products (excluding the product itself)
+        n = min(n_recommendations, len(similarities) - (product_idx is not None))
+        similar_indices = np.argpartition(-similarities, n - 1)[:n] if n > 0 else np.array([], dtype=int)
+        similar_indices = similar_indices[np.argsort(-similarities[similar_indices])]
+        return similar_indices, similarities[similar_indices]
+    
+    def _format_similar(self, similar_indices, similar_scores):
+        return [
+            {
+                'product_id': self.product_ids[idx],
+                'similarity_score': float(score),
+                'rank': rank + 1,
+                'features': self.product_features[idx] if idx < len(self.product_features) else {}
+            }
+            for rank, (idx, score) in enumerate(zip(similar_indices, similar_scores))
+            if score > 0.01  # Minimum similarity threshold
+        ]
+    
+    def _build_ann_index(self, tfidf_matrix):
+        """Reduce TF-IDF vectors with SVD and index them for approximate search"""
+        n_components = max(1, min(self.ann_components, tfidf_matrix.shape[1] - 1))
+        from sklearn.decomposition import TruncatedSVD
+        vectors = TruncatedSVD(n_components=n_components, random_state=42).fit_transform(tfidf_matrix)
+        return IVFIndex(metric='cosine').build(vectors)
+    
     def get_recommendations_by_category(self, category, n_recommendations=10):
         """Get top products in a specific category"""
         try:
@@ -166,22 +565,49 @@ class ContentBasedFilter:
                 'tfidf_matrix': self.tfidf_matrix,
                 'product_features': self.product_features,
                 'product_ids': self.product_ids,
+                # Products removed incrementally keep their position, so list the indexed ones
+                'indexed_product_ids': list(self._product_index),
+                'neighbor_indices': self.neighbor_indices,
+                'neighbor_scores': self.neighbor_scores,
+                'ann_index': self.ann_index.to_dict() if self.ann_index is not None else None,
+                'document_frequency': self.document_frequency if self.incremental else None,
+                'n_documents': self.n_documents,
                 'trained': self.trained
             }
-            joblib.dump(model_data, filepath)
+            save_artifact(filepath, model_data, type(self).__name__)
             logger.info(f"✅ Model saved to {filepath}")
         except Exception as e:
             logger.error(f"Error saving model: {str(e)}")
+            raise
     
     def load_model(self, filepath):
         """Load trained model from disk"""
         try:
-            model_data = joblib.load(filepath)
+            model_data = load_artifact(filepath)
             self.tfidf_vectorizer = model_data['tfidf_vectorizer']
-            self.tfidf_matrix = model_data['tfidf_matrix']
+            self.tfidf_rows = SparseRows(model_data['tfidf_matrix'])
             self.product_features = model_data['product_features']
             self.product_ids = model_data['product_ids']
             self.trained = model_data['trained']
+            self._product_index = {pid: idx for idx, pid in enumerate(self.product_ids)}
+            indexed = model_data.get('indexed_product_ids')
+            if indexed is not None:
+                indexed = set(indexed)
+                self._product_index = {pid: idx for pid, idx in self._product_index.items() if pid in indexed}
+            self.document_frequency = model_data.get('document_frequency')
+            self.n_documents = model_data.get('n_documents', 0)
+            self.incremental = self.document_frequency is not None
+            if self.incremental:
+                self.n_features = len(self.document_frequency)
+                self._hasher = None
+            neighbor_indices = model_data.get('neighbor_indices')
+            neighbor_scores = model_data.get('neighbor_scores')
+            if neighbor_indices is None:
+                neighbor_indices = np.zeros((len(self.product_ids), 0), dtype=np.int32)
+                neighbor_scores = np.zeros((len(self.product_ids), 0), dtype=np.float32)
+            self._set_tables(neighbor_indices, neighbor_scores)
+            ann_state = model_data.get('ann_index')
+            self.ann_index = IVFIndex.from_dict(ann_state) if ann_state else None
             logger.info(f"✅ Model loaded from {filepath}")
         except Exception as e:
             logger.error(f"Error loading model: {str(e)}")
@@ -0,0 +1,336 @@
+"""
+Item-Based Collaborative Filtering Model
+Precomputes a top-K item-to-item similarity graph and scores users from their history
+"""
+
+import threading
+import numpy as np
+from scipy.sparse import csr_matrix
+import logging
+
+from .collaborative_filter import ACTION_SCORES, build_interaction_matrix, code_interactions, rank_popular, count_interactions
+from .neighbors import top_k_neighbors, top_k_rows, neighbors_to_csr, scale_rows, SparseRows, DEFAULT_MAX_BLOCK_BYTES
+from .artifacts import save_artifact, load_artifact
+
+logger = logging.getLogger(__name__)
+
+class ItemBasedFilter:
+    def __init__(self, n_neighbors=50, n_jobs=None, max_block_bytes=DEFAULT_MAX_BLOCK_BYTES):
+        """
+        Args:
+            n_neighbors: Number of most similar items kept per item
+            n_jobs: Worker threads for the neighbor computation (defaults to CPU count)
+            max_block_bytes: Memory budget for in-flight similarity blocks
+        """
+        self.n_neighbors = n_neighbors
+        self.n_jobs = n_jobs
+        self.max_block_bytes = max_block_bytes
+        # User-major histories, item-major vectors and the top-K item graph;
+        # online updates replace rows in an overlay
+        self.interactions = None
+        self.item_vectors = None
+        self.similarity = None
+        self.product_ids = []
+        self.user_ids = []
+        self._user_index = {}
+        self._product_index = {}
+        self.trained = False
+        # Summed scores and L2 norms per product, in over-allocated buffers
+        self._popularity = None
+        self._norms = None
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+
+    def train(self, interaction_data):
+        """
+        Train item-based model by precomputing the item neighbor graph
+
+        Args:
+            interaction_data: List of dicts with userId, productId, and score/action
+        """
+        try:
+            n_interactions = count_interactions(interaction_data)
+            if n_interactions == 0:
+                logger.warning("No interaction data provided for training")
+                return
+
+            logger.info(f"Training item-based filter with {n_interactions} interactions")
+
+            user_item_matrix, user_ids, product_ids = build_interaction_matrix(interaction_data)
+            n_users, n_products = user_item_matrix.shape
+
+            # Items are the columns of the interaction matrix
+            neighbor_idx, neighbor_scores = top_k_neighbors(
+                user_item_matrix.T.tocsr(),
+                self.n_neighbors,
+                n_jobs=self.n_jobs,
+                max_block_bytes=self.max_block_bytes
+            )
+            item_similarity = neighbors_to_csr(neighbor_idx, neighbor_scores, n_products)
+
+            with self._update_lock, self._lock:
+                self._set_state(user_item_matrix, item_similarity, user_ids, product_ids)
+                self.trained = True
+            logger.info(f"✅ Item-based filter trained: {n_products} products, {item_similarity.nnz} neighbor links")
+
+        except Exception as e:
+            logger.error(f"Error training item-based filter: {str(e)}")
+            raise
+
+    @property
+    def user_item_matrix(self):
+        """The user-item matrix as one CSR (merges pending row updates, so O(nnz))"""
+        return self.interactions.tocsr() if self.interactions is not None else None
+
+    @property
+    def item_similarity(self):
+        """The top-K item neighbor graph as one CSR"""
+        return self.similarity.tocsr() if self.similarity is not None else None
+
+    def _set_state(self, user_item_matrix, item_similarity, user_ids, product_ids):
+        self.interactions = SparseRows(user_item_matrix)
+        self.item_vectors = SparseRows(user_item_matrix.T.tocsr())
+        self.similarity = SparseRows(item_similarity)
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self._popularity = np.bincount(
+            user_item_matrix.indices, weights=user_item_matrix.data, minlength=user_item_matrix.shape[1]
+        )
+        self._norms = None
+        self._build_indexes()
+
+    def _build_indexes(self):
+        self._user_index = {uid: idx for idx, uid in enumerate(self.user_ids)}
+        self._product_index = {pid: idx for idx, pid in enumerate(self.product_ids)}
+
+    def partial_fit(self, interaction_data):
+        """
+        Fold new interactions into the trained model without a full retrain
+
+        Only the touched users' history rows and the touched products'
+        vectors are replaced. The touched products are scored against every
+        product sharing a user with them (through an inverted index), which
+        gives their new neighbor lists, and the products in those lists get
+        the touched products' new scores merged into their own lists, which
+        are then cut back to the top K. Other lists are refreshed at the next
+        full training run. The new state is published with a single swap
+        under the read lock.
+
+        Args:
+            interaction_data: List of dicts with userId, productId, and score/action
+        """
+        if not self.trained or not interaction_data:
+            return
+
+        with self._update_lock:
+            delta, new_user_ids, new_product_ids, touched_users, touched_products = code_interactions(
+                self._user_index, self._product_index, interaction_data
+            )
+            n_users, n_products = delta.shape
+            if self._norms is None:
+                vectors = self.item_vectors.tocsr()
+                self._norms = np.sqrt(np.bincount(
+                    np.repeat(np.arange(vectors.shape[0]), np.diff(vectors.indptr)),
+                    weights=vectors.data.astype(np.float64) ** 2, minlength=vectors.shape[0]
+                ))
+
+            user_rows = self.interactions.plus(touched_users, delta[touched_users])
+            interactions = self.interactions.replace(touched_users, user_rows, n_users)
+            item_rows = self.item_vectors.plus(touched_products, delta.T.tocsr()[touched_products])
+            item_vectors = self.item_vectors.replace(touched_products, item_rows, n_products)
+
+            norms = self._grow(self._norms, n_products)
+            norms[touched_products] = np.sqrt(np.asarray(item_rows.multiply(item_rows).sum(axis=1)).ravel())
+
+            # Cosine similarity of the touched products with every product sharing a user
+            sims = item_vectors.score(scale_rows(item_rows, 1 / norms[touched_products]))
+            sims.data /= norms[sims.indices]
+            k = min(self.n_neighbors, n_products)
+            neighbor_idx, neighbor_scores = top_k_rows(sims, k, self_indices=touched_products)
+
+            # Reverse links: the touched products' new scores replace their entries in the
+            # lists of their new neighbors, which are then cut back to the top K
+            linked = np.setdiff1d(np.unique(neighbor_idx[neighbor_idx >= 0]), touched_products)
+            touched = np.zeros(n_products, dtype=bool)
+            touched[touched_products] = True
+            lists = self.similarity.rows(linked)
+            lists = csr_matrix((lists.data, lists.indices, lists.indptr), shape=(len(linked), n_products))
+            lists.data[touched[lists.indices]] = 0
+            slots = np.full(n_products, -1, dtype=np.int64)
+            slots[linked] = np.arange(len(linked))
+            sim_rows = np.repeat(touched_products, np.diff(sims.indptr))
+            hit = slots[sims.indices] >= 0
+            reverse = csr_matrix(
+                (sims.data[hit], (slots[sims.indices[hit]], sim_rows[hit])), shape=(len(linked), n_products)
+            )
+            merged_idx, merged_scores = top_k_rows(lists + reverse, k, self_indices=linked)
+
+            similarity = self.similarity.replace(
+                np.concatenate([touched_products, linked]),
+                neighbors_to_csr(np.vstack([neighbor_idx, merged_idx]), np.vstack([neighbor_scores, merged_scores]), n_products),
+                n_products
+            )
+            popularity = self._grow(self._popularity, n_products)
+
+            with self._lock:
+                np.add.at(popularity, delta.indices, delta.data)
+                for uid in new_user_ids:
+                    self._user_index[uid] = len(self.user_ids)
+                    self.user_ids.append(uid)
+                for pid in new_product_ids:
+                    self._product_index[pid] = len(self.product_ids)
+                    self.product_ids.append(pid)
+                self.interactions = interactions
+                self.item_vectors = item_vectors
+                self.similarity = similarity
+                self._popularity = popularity
+            self._norms = norms
+
+        logger.debug(f"Folded {len(interaction_data)} interactions into item-based filter ({len(touched_products)} products)")
+
+    @staticmethod
+    def _grow(buffer, n):
+        """Return a writable buffer with room for ``n`` entries, doubling when full"""
+        if n <= len(buffer):
+            return buffer
+        grown = np.zeros(max(n, 2 * len(buffer)), dtype=buffer.dtype)
+        grown[:len(buffer)] = buffer
+        return grown
+
+    def _history(self, user_id, recent_interactions, interactions):
+        """The user's history as (product indices, weights), or None"""
+        user_idx = self._user_index.get(str(user_id))
+        if user_idx is not None:
+            row = interactions.rows([user_idx])
+            return row.indices, row.data
+
+        # Unseen user: score from events tracked since the last training run
+        if callable(recent_interactions):
+            recent_interactions = recent_interactions()
+        weights = {}
+        for behavior in recent_interactions or []:
+            product_idx = self._product_index.get(str(behavior.get('productId')))
+            if product_idx is not None:
+                score = ACTION_SCORES.get(behavior.get('action'), 1)
+                weights[product_idx] = weights.get(product_idx, 0) + score
+
+        if not weights:
+            return None
+        return np.fromiter(weights.keys(), dtype=np.int64), np.fromiter(weights.values(), dtype=np.float32)
+
+    def recommend(self, user_id, n_recommendations=10, recent_interactions=None):
+        """
+        Get recommendations for a user from their items' neighbor lists
+
+        Args:
+            user_id: User ID to get recommendations for
+            n_recommendations: Number of recommendations to return
+            recent_interactions: Behavior dicts for the user, or a callable returning
+                                 them, used when the user is not in the training data;
+                                 a callable is only called for such users
+
+        Returns:
+            List of recommended product IDs with scores
+        """
+        try:
+            if not self.trained:
+                logger.warning("Model not trained yet")
+                return []
+
+            # Fetched outside the lock: only unseen users need their tracked history
+            if callable(recent_interactions) and str(user_id) not in self._user_index:
+                recent_interactions = recent_interactions()
+
+            # Snapshot the published state so a concurrent update can't mix versions
+            with self._lock:
+                interactions = self.interactions
+                similarity = self.similarity
+                product_ids = self.product_ids
+                history = self._history(user_id, recent_interactions, interactions)
+
+            if history is None or len(history[0]) == 0:
+                logger.info(f"No usable history for user {user_id}, returning popular items")
+                return self._get_popular_products(n_recommendations)
+
+            # Only the neighbor lists of the user's items are touched
+            history_products, history_weights = history
+            weights = csr_matrix(history_weights.reshape(1, -1))
+            weighted_ratings = (weights @ similarity.rows(history_products)).tocsr()
+            candidate_ids = weighted_ratings.indices
+            candidate_scores = weighted_ratings.data
+
+            keep = ~np.isin(candidate_ids, history_products) & (candidate_scores > 0)
+            candidate_ids = candidate_ids[keep]
+            candidate_scores = candidate_scores[keep]
+
+            if len(candidate_scores) > n_recommendations:
+                top = np.argpartition(-candidate_scores, n_recommendations - 1)[:n_recommendations]
+            else:
+                top = np.arange(len(candidate_scores))
+            top = top[np.argsort(-candidate_scores[top])]
+
+            recommendations = [
+                {
+                    'product_id': str(product_ids[candidate_ids[idx]]),
+                    'score': float(candidate_scores[idx]),
+                    'rank': rank + 1
+                }
+                for rank, idx in enumerate(top)
+            ]
+
+            # If not enough recommendations, fill with popular items
+            if len(recommendations) < n_recommendations:
+                popular = self._get_popular_products(n_recommendations - len(recommendations))
+                recommendations.extend(popular)
+
+            return recommendations[:n_recommendations]
+
+        except Exception as e:
+            logger.error(f"Error generating item-based recommendations: {str(e)}")
+            return self._get_popular_products(n_recommendations)
+
+    def _get_popular_products(self, n=10):
+        """Get most popular products based on interaction count"""
+        if not self.trained or self._popularity is None:
+            return []
+
+        with self._lock:
+            product_ids = self.product_ids
+            popularity = self._popularity[:len(product_ids)]
+        return rank_popular(popularity, product_ids, n)
+
+    def save_model(self, filepath):
+        """Save trained model to disk"""
+        try:
+            import os
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+            model_data = {
+                'user_item_matrix': self.user_item_matrix,
+                'item_similarity': self.item_similarity,
+                'product_ids': self.product_ids,
+                'user_ids': self.user_ids,
+                'trained': self.trained
+            }
+            save_artifact(filepath, model_data, type(self).__name__)
+            logger.info(f"✅ Model saved to {filepath}")
+        except Exception as e:
+            logger.error(f"Error saving model: {str(e)}")
+            raise
+
+    def load_model(self, filepath):
+        """Load trained model from disk"""
+        try:
+            model_data = load_artifact(filepath)
+            with self._update_lock, self._lock:
+                self._set_state(
+                    csr_matrix(model_data['user_item_matrix']),
+                    csr_matrix(model_data['item_similarity']),
+                    model_data['user_ids'],
+                    model_data['product_ids']
+                )
+                self.trained = model_data['trained']
+            logger.info(f"✅ Model loaded from {filepath}")
+        except Exception as e:
+            logger.error(f"Error loading model: {str(e)}")
+            raise FileNotFoundError(f"Model file not found: {filepath}")
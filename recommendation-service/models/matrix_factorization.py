@@ -0,0 +1,418 @@
+"""
+Implicit-Feedback Matrix Factorization Model
+Learns low-rank user and item factors with alternating least squares (ALS)
+"""
+
+import os
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy.sparse import csr_matrix
+import logging
+
+from .collaborative_filter import build_interaction_matrix, code_interactions, rank_popular, count_interactions
+from .neighbors import SparseRows
+from .ann_index import IVFIndex
+from .artifacts import save_artifact, load_artifact
+
+logger = logging.getLogger(__name__)
+
+class MatrixFactorizationFilter:
+    def __init__(self, factors=64, regularization=0.1, alpha=40.0, iterations=15, cg_steps=3,
+                 n_jobs=None, max_block_bytes=64 * 1024 * 1024, random_state=42, ann_threshold=5000):
+        """
+        Args:
+            factors: Dimension of the user and item latent factors
+            regularization: L2 penalty on the factors
+            alpha: Confidence scaling, c_ui = 1 + alpha * r_ui
+            iterations: Number of ALS sweeps (users then items)
+            cg_steps: Conjugate-gradient steps per row solve in each sweep
+            n_jobs: Worker threads for the batched solves (defaults to CPU count)
+            max_block_bytes: Memory budget for one block of rows solved together
+            random_state: Seed for the factor initialization
+            ann_threshold: Catalog size from which scoring uses an ANN index over item factors
+        """
+        self.factors = factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.iterations = iterations
+        self.cg_steps = cg_steps
+        self.n_jobs = n_jobs
+        self.max_block_bytes = max_block_bytes
+        self.random_state = random_state
+        self.ann_threshold = ann_threshold
+        self.ann_index = None
+        # User-item matrix; online updates replace the touched users' rows in an overlay
+        self.interactions = None
+        self.user_factors = None
+        self.item_factors = None
+        self.product_ids = []
+        self.user_ids = []
+        self._user_index = {}
+        self._product_index = {}
+        self.iteration_times = []
+        self.trained = False
+        # Factor arrays are views into over-allocated buffers so folded-in rows can be appended
+        self._user_buffer = None
+        self._item_buffer = None
+        # Summed scores per product, over-allocated like the factors
+        self._popularity = None
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+
+    def train(self, interaction_data):
+        """
+        Train ALS model on implicit feedback
+
+        Interaction scores use the same ACTION_SCORES weights as CollaborativeFilter.
+
+        Args:
+            interaction_data: List of dicts with userId, productId, and score/action
+        """
+        try:
+            n_interactions = count_interactions(interaction_data)
+            if n_interactions == 0:
+                logger.warning("No interaction data provided for training")
+                return
+
+            logger.info(f"Training ALS model with {n_interactions} interactions")
+
+            user_item_matrix, user_ids, product_ids = build_interaction_matrix(interaction_data)
+            n_users, n_products = user_item_matrix.shape
+
+            # Confidence minus one; the "1 +" part is folded into YtY
+            confidence = self._confidence(user_item_matrix)
+            confidence_t = confidence.T.tocsr()
+
+            rng = np.random.default_rng(self.random_state)
+            user_factors = (rng.standard_normal((n_users, self.factors)) * 0.01).astype(np.float32)
+            item_factors = (rng.standard_normal((n_products, self.factors)) * 0.01).astype(np.float32)
+
+            iteration_times = []
+            for iteration in range(self.iterations):
+                start = time.perf_counter()
+                user_factors = self._solve(confidence, item_factors, user_factors)
+                item_factors = self._solve(confidence_t, user_factors, item_factors)
+                elapsed = time.perf_counter() - start
+                iteration_times.append(elapsed)
+                logger.info(f"ALS iteration {iteration + 1}/{self.iterations}: {elapsed * 1000:.1f} ms")
+
+            # Inner-product index over item factors for large catalogs
+            ann_index = IVFIndex(metric='dot').build(item_factors) if n_products >= self.ann_threshold else None
+
+            with self._update_lock, self._lock:
+                self._set_interactions(user_item_matrix)
+                self.user_ids = user_ids
+                self.product_ids = product_ids
+                self._set_factors(user_factors, item_factors)
+                self.iteration_times = iteration_times
+                self.ann_index = ann_index
+                self._build_indexes()
+                self.trained = True
+            logger.info(
+                f"✅ ALS model trained: {n_users} users, {n_products} products, "
+                f"{self.factors} factors in {sum(self.iteration_times):.2f}s"
+            )
+
+        except Exception as e:
+            logger.error(f"Error training ALS model: {str(e)}")
+            raise
+
+    def _confidence(self, user_item_matrix):
+        return (user_item_matrix * self.alpha).astype(np.float32).tocsr()
+
+    @property
+    def user_item_matrix(self):
+        """The user-item matrix as one CSR (merges pending row updates, so O(nnz))"""
+        return self.interactions.tocsr() if self.interactions is not None else None
+
+    def _set_interactions(self, user_item_matrix):
+        self.interactions = SparseRows(user_item_matrix)
+        self._popularity = np.bincount(
+            user_item_matrix.indices, weights=user_item_matrix.data, minlength=user_item_matrix.shape[1]
+        )
+
+    def _build_indexes(self):
+        self._user_index = {uid: idx for idx, uid in enumerate(self.user_ids)}
+        self._product_index = {pid: idx for idx, pid in enumerate(self.product_ids)}
+
+    def _set_factors(self, user_factors, item_factors):
+        self._user_buffer = user_factors
+        self._item_buffer = item_factors
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+
+    @staticmethod
+    def _grow(buffer, n_rows):
+        """Return a writable buffer with room for ``n_rows`` rows, doubling when full"""
+        if n_rows <= buffer.shape[0]:
+            if buffer.flags.writeable:
+                return buffer
+            # Memory-mapped factors from a loaded artifact are read-only
+            return np.array(buffer)
+        grown = np.zeros((max(n_rows, 2 * buffer.shape[0]),) + buffer.shape[1:], dtype=buffer.dtype)
+        grown[:buffer.shape[0]] = buffer
+        return grown
+
+    def partial_fit(self, interaction_data):
+        """
+        Fold new interactions into the trained model without a full retrain
+
+        The factors of every touched user are solved against the item
+        factors first, then the factors of unseen products from those user
+        factors, and the touched users once more so they pick up the new
+        products. Existing item factors stay fixed until the next full
+        training run. Confidences are built for the touched users' rows and
+        the new products' columns only, so a batch never touches the whole
+        matrix. New rows are appended to over-allocated buffers and
+        published by swapping the factor views (and the ANN index, extended
+        with the new products) under the read lock.
+
+        Args:
+            interaction_data: List of dicts with userId, productId, and score/action
+        """
+        if not self.trained or not interaction_data:
+            return
+
+        with self._update_lock:
+            delta, new_user_ids, new_product_ids, touched_users, _ = code_interactions(
+                self._user_index, self._product_index, interaction_data
+            )
+            n_users, n_products = delta.shape
+            n_old_products = self.item_factors.shape[0]
+            rows = self.interactions.plus(touched_users, delta[touched_users])
+            interactions = self.interactions.replace(touched_users, rows, n_users)
+
+            # Rows past the published views are unused zeros, so new users and
+            # products contribute nothing until they are solved below
+            user_buffer = self._grow(self._user_buffer, n_users)
+            item_buffer = self._grow(self._item_buffer, n_products)
+            item_factors = item_buffer[:n_products]
+            user_rows = self._confidence(rows)
+            solved_users = self._solve(user_rows, item_factors, user_buffer[touched_users])
+
+            ann_index = self.ann_index
+            if n_products > n_old_products:
+                with self._lock:
+                    user_buffer[touched_users] = solved_users
+                new_items = np.arange(n_old_products, n_products)
+                # New products have no interactions before this batch
+                item_rows = self._confidence(delta.T.tocsr()[new_items])
+                item_buffer[new_items] = self._solve(
+                    item_rows, user_buffer[:n_users], np.zeros((len(new_items), self.factors), dtype=np.float32)
+                )
+                solved_users = self._solve(user_rows, item_factors, solved_users)
+                if ann_index is not None:
+                    ann_index = ann_index.add(item_buffer[new_items])
+                elif n_products >= self.ann_threshold:
+                    ann_index = IVFIndex(metric='dot').build(item_factors)
+            popularity = self._grow(self._popularity, n_products)
+
+            with self._lock:
+                np.add.at(popularity, delta.indices, delta.data)
+                user_buffer[touched_users] = solved_users
+                for uid in new_user_ids:
+                    self._user_index[uid] = len(self.user_ids)
+                    self.user_ids.append(uid)
+                for pid in new_product_ids:
+                    self._product_index[pid] = len(self.product_ids)
+                    self.product_ids.append(pid)
+                self._user_buffer = user_buffer
+                self._item_buffer = item_buffer
+                self.user_factors = user_buffer[:n_users]
+                self.item_factors = item_factors
+                self.interactions = interactions
+                self._popularity = popularity
+                self.ann_index = ann_index
+
+        logger.debug(f"Folded {len(interaction_data)} interactions into ALS model ({len(touched_users)} users)")
+
+    def _solve(self, confidence, fixed, current):
+        """
+        Solve the regularized normal equations for every row of ``confidence``
+
+        For row u with observed items I and confidences c:
+            (YtY + Y_I^T diag(c) Y_I + reg * I) x_u = Y_I^T (1 + c)
+        All rows of a block are solved together with a few warm-started
+        conjugate-gradient steps, which only needs sparse/dense products
+        (O(nnz * f) per step) instead of materializing an f x f system per row.
+        Blocks are sized to ``max_block_bytes`` and run on a thread pool.
+        """
+        n_rows = confidence.shape[0]
+        f = self.factors
+        gram = fixed.T @ fixed + self.regularization * np.eye(f, dtype=np.float32)
+        solved = current.copy()
+
+        # Each nnz needs a few f-length float32 temporaries per CG step
+        budget = max(1, self.max_block_bytes // (f * 4 * 4))
+        blocks = []
+        start = 0
+        while start < n_rows:
+            stop = int(np.searchsorted(confidence.indptr, confidence.indptr[start] + budget, side='right')) - 1
+            stop = min(max(stop, start + 1), n_rows)
+            blocks.append((start, stop))
+            start = stop
+
+        def _solve_block(bounds):
+            start, stop = bounds
+            block = confidence[start:stop]
+            rows = np.repeat(np.arange(stop - start), np.diff(block.indptr))
+            cols = block.indices
+            conf = block.data.astype(np.float32)
+
+            def _apply(x):
+                projected = np.einsum('ij,ij->i', x[rows], fixed[cols])
+                weighted = csr_matrix((conf * projected, cols, block.indptr), shape=block.shape)
+                return x @ gram + weighted @ fixed
+
+            x = solved[start:stop]
+            rhs = csr_matrix((1.0 + conf, cols, block.indptr), shape=block.shape) @ fixed
+            residual = rhs - _apply(x)
+            direction = residual.copy()
+            rs_old = np.einsum('ij,ij->i', residual, residual)
+
+            for _ in range(self.cg_steps):
+                applied = _apply(direction)
+                denom = np.einsum('ij,ij->i', direction, applied)
+                step = np.divide(rs_old, denom, out=np.zeros_like(rs_old), where=denom > 0)
+                x += step[:, None] * direction
+                residual -= step[:, None] * applied
+                rs_new = np.einsum('ij,ij->i', residual, residual)
+                beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 0)
+                direction = residual + beta[:, None] * direction
+                rs_old = rs_new
+
+            solved[start:stop] = x
+
+        n_jobs = self.n_jobs or os.cpu_count() or 1
+        if n_jobs == 1 or len(blocks) == 1:
+            for bounds in blocks:
+                _solve_block(bounds)
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+                list(pool.map(_solve_block, blocks))
+
+        return solved
+
+    def recommend(self, user_id, n_recommendations=10):
+        """
+        Get recommendations for a user
+
+        Args:
+            user_id: User ID to get recommendations for
+            n_recommendations: Number of recommendations to return
+
+        Returns:
+            List of recommended product IDs with scores
+        """
+        try:
+            if not self.trained:
+                logger.warning("Model not trained yet")
+                return []
+
+            # Snapshot the published state; the user row is copied because
+            # online updates rewrite touched user rows in place
+            with self._lock:
+                user_idx = self._user_index.get(str(user_id))
+                if user_idx is not None:
+                    user_vector = self.user_factors[user_idx].copy()
+                item_factors = self.item_factors
+                interactions = self.interactions
+                product_ids = self.product_ids
+                ann_index = self.ann_index
+
+            if user_idx is None:
+                logger.info(f"User {user_id} not in training data, returning popular items")
+                return self._get_popular_products(n_recommendations)
+
+            # A zero vector scores every item 0 and would rank them arbitrarily
+            if not user_vector.any():
+                logger.info(f"No usable factors for user {user_id}, returning popular items")
+                return self._get_popular_products(n_recommendations)
+
+            seen = interactions.rows([user_idx]).indices
+
+            if ann_index is not None:
+                top, top_scores = ann_index.search(user_vector, n_recommendations + len(seen))
+                keep = ~np.isin(top, seen)
+                top, top_scores = top[keep][:n_recommendations], top_scores[keep][:n_recommendations]
+            else:
+                # One dense dot product against the item factors plus a partial sort
+                scores = item_factors @ user_vector
+                scores[seen] = -np.inf
+
+                n = min(n_recommendations, len(scores))
+                top = np.argpartition(-scores, n - 1)[:n] if n > 0 else np.array([], dtype=int)
+                top = top[np.argsort(-scores[top])]
+                top = top[scores[top] > -np.inf]
+                top_scores = scores[top]
+
+            recommendations = [
+                {
+                    'product_id': str(product_ids[idx]),
+                    'score': float(score),
+                    'rank': rank + 1
+                }
+                for rank, (idx, score) in enumerate(zip(top, top_scores))
+            ]
+
+            # If not enough recommendations, fill with popular items
+            if len(recommendations) < n_recommendations:
+                popular = self._get_popular_products(n_recommendations - len(recommendations))
+                recommendations.extend(popular)
+
+            return recommendations[:n_recommendations]
+
+        except Exception as e:
+            logger.error(f"Error generating ALS recommendations: {str(e)}")
+            return self._get_popular_products(n_recommendations)
+
+    def _get_popular_products(self, n=10):
+        """Get most popular products based on interaction count"""
+        if not self.trained or self._popularity is None:
+            return []
+
+        with self._lock:
+            product_ids = self.product_ids
+            popularity = self._popularity[:len(product_ids)]
+        return rank_popular(popularity, product_ids, n)
+
+    def save_model(self, filepath):
+        """Save trained model to disk"""
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+            model_data = {
+                'user_item_matrix': self.user_item_matrix,
+                'user_factors': self.user_factors,
+                'item_factors': self.item_factors,
+                'product_ids': self.product_ids,
+                'user_ids': self.user_ids,
+                'iteration_times': self.iteration_times,
+                'ann_index': self.ann_index.to_dict() if self.ann_index is not None else None,
+                'trained': self.trained
+            }
+            save_artifact(filepath, model_data, type(self).__name__)
+            logger.info(f"✅ Model saved to {filepath}")
+        except Exception as e:
+            logger.error(f"Error saving model: {str(e)}")
+            raise
+
+    def load_model(self, filepath):
+        """Load trained model from disk"""
+        try:
+            model_data = load_artifact(filepath)
+            self._set_interactions(csr_matrix(model_data['user_item_matrix']))
+            self._set_factors(model_data['user_factors'], model_data['item_factors'])
+            self.product_ids = model_data['product_ids']
+            self.user_ids = model_data['user_ids']
+            self.iteration_times = model_data.get('iteration_times', [])
+            ann_state = model_data.get('ann_index')
+            self.ann_index = IVFIndex.from_dict(ann_state) if ann_state else None
+            self.trained = model_data['trained']
+            self._build_indexes()
+            logger.info(f"✅ Model loaded from {filepath}")
+        except Exception as e:
+            logger.error(f"Error loading model: {str(e)}")
+            raise FileNotFoundError(f"Model file not found: {filepath}")
@@ -0,0 +1,345 @@
+"""
+Neighbor Engine
+Blockwise, multi-threaded top-K cosine similarity over sparse or dense vectors
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy.sparse import csr_matrix, diags, issparse, vstack
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the dense similarity blocks held in memory at once (all workers)
+DEFAULT_MAX_BLOCK_BYTES = 256 * 1024 * 1024
+
+
+def top_k_neighbors(vectors, k, candidates=None, self_indices=None, n_jobs=None,
+                    max_block_bytes=DEFAULT_MAX_BLOCK_BYTES, normalized=False):
+    """
+    Compute the top-K most similar candidates for every query row
+
+    Similarity is computed in row blocks across a thread pool; each block is a
+    dense (block_size x n_candidates) slab that is reduced to its top-K with
+    ``argpartition`` before the next one is produced, so peak memory is bounded
+    by ``max_block_bytes`` regardless of how many rows there are.
+
+    Args:
+        vectors: Query matrix (n_queries x n_features), sparse or dense
+        k: Number of neighbors to keep per query
+        candidates: Candidate matrix; defaults to ``vectors`` (self-similarity)
+        self_indices: Candidate index to exclude for each query row. Defaults to
+                      the diagonal when ``candidates`` is omitted
+        n_jobs: Worker threads (defaults to the CPU count)
+        max_block_bytes: Memory budget for the in-flight similarity blocks
+        normalized: Set when rows are already L2-normalized
+
+    Returns:
+        Tuple of (indices, scores) arrays shaped (n_queries, k), sorted by
+        descending score. Missing neighbors are padded with index -1 and score 0.
+    """
+    if candidates is None:
+        candidates = vectors
+        if self_indices is None:
+            self_indices = np.arange(vectors.shape[0])
+
+    if not normalized:
+        from sklearn.preprocessing import normalize
+        vectors = normalize(vectors)
+        candidates = vectors if candidates is vectors else normalize(candidates)
+
+    n_queries = vectors.shape[0]
+    n_candidates = candidates.shape[0]
+    k = max(0, min(k, n_candidates))
+
+    indices = np.full((n_queries, k), -1, dtype=np.int32)
+    scores = np.zeros((n_queries, k), dtype=np.float32)
+    if n_queries == 0 or k == 0:
+        return indices, scores
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    block_size = int(max(1, max_block_bytes // (n_jobs * n_candidates * 8)))
+    candidates_t = candidates.T.tocsr() if issparse(candidates) else np.ascontiguousarray(candidates.T)
+
+    def _process(start):
+        stop = min(start + block_size, n_queries)
+        sims = vectors[start:stop] @ candidates_t
+        sims = sims.toarray() if issparse(sims) else np.asarray(sims)
+        if self_indices is not None:
+            sims[np.arange(stop - start), self_indices[start:stop]] = 0
+
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        valid = top_scores > 0
+        indices[start:stop] = np.where(valid, top, -1)
+        scores[start:stop] = np.where(valid, top_scores, 0)
+
+    starts = range(0, n_queries, block_size)
+    if n_jobs == 1 or len(starts) == 1:
+        for start in starts:
+            _process(start)
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(_process, starts))
+
+    return indices, scores
+
+
+def neighbors_to_csr(indices, scores, n_columns):
+    """Convert padded (indices, scores) neighbor arrays into a sparse CSR graph"""
+    valid = indices >= 0
+    rows = np.repeat(np.arange(indices.shape[0]), valid.sum(axis=1))
+    return csr_matrix(
+        (scores[valid], (rows, indices[valid])),
+        shape=(indices.shape[0], n_columns),
+        dtype=np.float32
+    )
+
+
+def resize_csr(matrix, shape):
+    """Grow a CSR matrix to ``shape`` without copying its data arrays"""
+    added_rows = shape[0] - matrix.shape[0]
+    indptr = matrix.indptr
+    if added_rows > 0:
+        indptr = np.concatenate([indptr, np.full(added_rows, indptr[-1], dtype=indptr.dtype)])
+    return csr_matrix((matrix.data, matrix.indices, indptr), shape=shape)
+
+
+def scale_rows(matrix, factors):
+    """Copy of a CSR matrix with row i multiplied by ``factors[i]`` (no broadcasting temporaries)"""
+    matrix = csr_matrix(matrix, copy=True)
+    matrix.data *= np.repeat(np.asarray(factors, dtype=matrix.dtype), np.diff(matrix.indptr))
+    return matrix
+
+
+def replace_rows(matrix, rows, replacement):
+    """
+    Return a copy of ``matrix`` with ``rows`` replaced by the rows of ``replacement``
+
+    Built from sparse products (row mask plus a scatter matrix), so the cost is
+    O(nnz) vectorized work rather than per-row Python edits.
+    """
+    n_rows = matrix.shape[0]
+    rows = np.asarray(rows, dtype=np.int64)
+    keep = np.ones(n_rows, dtype=matrix.dtype)
+    keep[rows] = 0
+    scatter = csr_matrix(
+        (np.ones(len(rows), dtype=matrix.dtype), (rows, np.arange(len(rows)))),
+        shape=(n_rows, len(rows))
+    )
+    return (diags(keep) @ matrix + scatter @ csr_matrix(replacement)).tocsr()
+
+
+def top_k_rows(sims, k, self_indices=None):
+    """
+    Top-K columns of every row of a sparse score matrix
+
+    Only the stored entries of each row are ranked, so the cost follows the
+    number of nonzero scores rather than the number of columns.
+
+    Args:
+        sims: Sparse (n_queries x n_candidates) scores
+        k: Number of neighbors to keep per row
+        self_indices: Column to exclude for each row
+
+    Returns:
+        Tuple of (indices, scores) shaped (n_queries, k) like ``top_k_neighbors``
+    """
+    sims = csr_matrix(sims)
+    n_queries = sims.shape[0]
+    indices = np.full((n_queries, k), -1, dtype=np.int32)
+    scores = np.zeros((n_queries, k), dtype=np.float32)
+    if k == 0:
+        return indices, scores
+
+    for row in range(n_queries):
+        start, stop = sims.indptr[row], sims.indptr[row + 1]
+        columns = sims.indices[start:stop]
+        values = sims.data[start:stop]
+        keep = values > 0
+        if self_indices is not None:
+            keep &= columns != self_indices[row]
+        columns, values = columns[keep], values[keep]
+        if len(values) > k:
+            top = np.argpartition(-values, k - 1)[:k]
+            columns, values = columns[top], values[top]
+        order = np.argsort(-values, kind='stable')
+        indices[row, :len(order)] = columns[order]
+        scores[row, :len(order)] = values[order]
+    return indices, scores
+
+
+class SparseRows:
+    """
+    Sparse matrix whose rows can be replaced or appended cheaply
+
+    Rows live in a compacted CSR ``base`` plus an ``overlay`` of the rows
+    replaced or appended since. ``replace`` returns a new instance sharing
+    the base, so it costs O(overlay) rather than O(nnz); once the overlay
+    holds more than ``max_overlay`` rows it is merged into a new base.
+    Instances are never modified, so readers can keep using one while an
+    update builds its successor.
+
+    ``score`` and ``top_k`` multiply query rows with every row through an
+    inverted (transposed) copy of the base, built on first use, so their
+    cost follows the queries' posting lists instead of the size of the
+    matrix.
+    """
+
+    def __init__(self, base, max_overlay=4096):
+        self.base = csr_matrix(base)
+        self.n_rows = self.base.shape[0]
+        self.max_overlay = max_overlay
+        self.overlay = csr_matrix((0, self.base.shape[1]), dtype=self.base.dtype)
+        self.positions = np.zeros(0, dtype=np.int64)
+        self._slots = {}
+        self._postings = None
+
+    @property
+    def shape(self):
+        return (self.n_rows, self.base.shape[1])
+
+    def _postings_matrix(self):
+        if self._postings is None:
+            self._postings = self.base.T.tocsr()
+        return self._postings
+
+    def _overlay_slots(self, positions):
+        return np.fromiter((self._slots.get(position, -1) for position in positions.tolist()),
+                           dtype=np.int64, count=len(positions))
+
+    def rows(self, positions):
+        """CSR of the rows at ``positions``"""
+        positions = np.asarray(positions, dtype=np.int64)
+        slots = self._overlay_slots(positions)
+        in_overlay = slots >= 0
+        rows = self.base[np.where(in_overlay, 0, positions)]
+        if in_overlay.any():
+            rows = replace_rows(rows, np.flatnonzero(in_overlay), self.overlay[slots[in_overlay]])
+        return rows
+
+    def plus(self, positions, delta_rows):
+        """
+        CSR of the rows at ``positions`` plus ``delta_rows``
+
+        Positions past the end count as empty rows; the result has the
+        column count of ``delta_rows``.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        delta_rows = csr_matrix(delta_rows)
+        existing = np.flatnonzero(positions < self.n_rows)
+        previous = self.rows(positions[existing])
+        previous = csr_matrix((previous.data, previous.indices, previous.indptr),
+                              shape=(len(existing), delta_rows.shape[1]))
+        scatter = csr_matrix(
+            (np.ones(len(existing), dtype=previous.dtype), (existing, np.arange(len(existing)))),
+            shape=(len(positions), len(existing))
+        )
+        return (delta_rows + scatter @ previous).tocsr()
+
+    def replace(self, positions, replacement, n_rows=None):
+        """
+        Copy with ``positions`` set to the rows of ``replacement``
+
+        Args:
+            positions: Distinct row positions; positions past the end append rows
+            replacement: Sparse (len(positions) x n_features) rows; more columns
+                widen the matrix
+            n_rows: Row count of the result (every appended position must be given)
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        replacement = csr_matrix(replacement, dtype=self.base.dtype)
+        slots = self._overlay_slots(positions)
+        fresh = slots < 0
+
+        updated = SparseRows.__new__(SparseRows)
+        updated.__dict__.update(self.__dict__)
+        if replacement.shape[1] > self.base.shape[1]:
+            updated._widen(replacement.shape[1])
+        updated.n_rows = max(self.n_rows, n_rows or 0, int(positions.max()) + 1 if len(positions) else 0)
+        overlay = vstack([updated.overlay, replacement[fresh]], format='csr')
+        if not fresh.all():
+            overlay = replace_rows(overlay, slots[~fresh], replacement[~fresh])
+        updated.overlay = overlay
+        updated.positions = np.concatenate([self.positions, positions[fresh]])
+        updated._slots = dict(self._slots)
+        updated._slots.update(zip(positions[fresh].tolist(), range(len(self.positions), len(updated.positions))))
+
+        if len(updated.positions) > self.max_overlay:
+            return SparseRows(updated.tocsr(), self.max_overlay)
+        return updated
+
+    def _widen(self, n_features):
+        """Grow the column count in place (only called on a fresh copy); no data is copied"""
+        def widened(matrix):
+            return csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], n_features))
+        self.base = widened(self.base)
+        self.overlay = widened(self.overlay)
+        if self._postings is not None:
+            self._postings = resize_csr(self._postings, (n_features, self._postings.shape[1]))
+
+    def tocsr(self):
+        """The whole matrix as one CSR"""
+        base = self.base
+        if self.n_rows > base.shape[0]:
+            base = resize_csr(base, self.shape)
+        if len(self.positions) == 0:
+            return base
+        return replace_rows(base, self.positions, self.overlay)
+
+    def score(self, queries):
+        """Sparse (n_queries x n_rows) products of ``queries`` with every row"""
+        queries = csr_matrix(queries)
+        n_queries = queries.shape[0]
+        sims = (queries @ self._postings_matrix()).tocsr()
+        sims = csr_matrix((sims.data, sims.indices, sims.indptr), shape=(n_queries, self.n_rows))
+        if len(self.positions):
+            # Base entries of replaced rows are outdated; their overlay rows are scored instead
+            replaced = np.zeros(self.n_rows, dtype=bool)
+            replaced[self.positions] = True
+            sims.data[replaced[sims.indices]] = 0
+            overlay_sims = (queries @ self.overlay.T).tocoo()
+            sims = sims + csr_matrix(
+                (overlay_sims.data, (overlay_sims.row, self.positions[overlay_sims.col])),
+                shape=(n_queries, self.n_rows)
+            )
+            sims.eliminate_zeros()
+        return sims
+
+    def top_k(self, queries, k, self_indices=None, column_norms=None):
+        """
+        ``top_k_rows`` of ``score(queries)``, without merging base and overlay scores
+
+        Args:
+            queries: Sparse query rows
+            k: Number of rows kept per query
+            self_indices: Row to exclude for each query
+            column_norms: Divide the score against row j by ``column_norms[j]``
+        """
+        queries = csr_matrix(queries)
+        sims = (queries @ self._postings_matrix()).tocsr()
+        if column_norms is not None:
+            sims.data /= column_norms[sims.indices]
+        if len(self.positions) == 0:
+            return top_k_rows(sims, k, self_indices)
+
+        replaced = np.zeros(self.n_rows, dtype=bool)
+        replaced[self.positions] = True
+        sims.data[replaced[sims.indices]] = 0
+        indices, scores = top_k_rows(sims, k, self_indices)
+
+        overlay_sims = (queries @ self.overlay.T).tocsr()
+        overlay_sims.indices = self.positions[overlay_sims.indices]
+        if column_norms is not None:
+            overlay_sims.data /= column_norms[overlay_sims.indices]
+        overlay_indices, overlay_scores = top_k_rows(overlay_sims, k, self_indices)
+
+        merged_indices = np.hstack([indices, overlay_indices])
+        merged_scores = np.hstack([scores, overlay_scores])
+        top = np.argsort(-merged_scores, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(merged_indices, top, axis=1), np.take_along_axis(merged_scores, top, axis=1)
@@ -0,0 +1,210 @@
+"""
+Model Registry
+Versioned model bundles on disk and the atomically swapped set being served
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+import logging
+
+from .collaborative_filter import CollaborativeFilter
+from .content_based import ContentBasedFilter
+from .item_based import ItemBasedFilter
+from .matrix_factorization import MatrixFactorizationFilter
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAMES = ('collaborative', 'content_based', 'item_based', 'als')
+CURRENT_FILE = 'CURRENT'
+
+
+def create_models():
+    """Fresh, untrained instances of every served model"""
+    return {
+        'collaborative': CollaborativeFilter(),
+        'content_based': ContentBasedFilter(incremental=True),
+        'item_based': ItemBasedFilter(),
+        'als': MatrixFactorizationFilter()
+    }
+
+
+def new_version():
+    return time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:6]
+
+
+class ModelBundle:
+    """
+    One complete set of models trained from the same data snapshot
+
+    Bundles are built off to the side and published whole, so a request
+    holding ``registry.active`` always sees models of a single version.
+    """
+
+    def __init__(self, version, models=None):
+        self.version = version
+        self.created_at = time.time()
+        models = models or {}
+        self.collaborative = models.get('collaborative')
+        self.content_based = models.get('content_based')
+        self.item_based = models.get('item_based')
+        self.als = models.get('als')
+
+    def models(self):
+        return {name: getattr(self, name) for name in MODEL_NAMES}
+
+    def trained(self):
+        """Whether any model is trained, i.e. the bundle can serve recommendations"""
+        return any(model is not None and model.trained for model in self.models().values())
+
+    def complete(self):
+        """Whether every model is trained"""
+        return all(model is not None and model.trained for model in self.models().values())
+
+    def user_models(self):
+        """Models updated online from tracked behaviors"""
+        return [self.collaborative, self.item_based, self.als]
+
+
+def train_models(product_data, interaction_data):
+    """
+    Train a full set of models
+
+    Returns:
+        Tuple of (models dict, per-model training seconds)
+    """
+    models = create_models()
+    timings = {}
+    for name, model in models.items():
+        start = time.perf_counter()
+        model.train(product_data if name == 'content_based' else interaction_data)
+        timings[name] = round(time.perf_counter() - start, 3)
+    return models, timings
+
+
+def train_version(model_dir, version, product_data, interaction_data):
+    """
+    Train every model and save it as a new artifact version
+
+    Runs in a worker process during background retrains, so it only takes and
+    returns plain data; the serving process memory-maps the result.
+
+    Returns:
+        Per-model training seconds
+
+    Raises:
+        Exception: A model could not be saved; the version must not be published
+    """
+    models, timings = train_models(product_data, interaction_data)
+    save_version(model_dir, version, models)
+    return timings
+
+
+def save_version(model_dir, version, models):
+    """
+    Save trained models as artifact version ``version``
+
+    Raises:
+        Exception: A model could not be saved
+    """
+    version_dir = os.path.join(model_dir, 'versions', version)
+    for name, model in models.items():
+        model.save_model(os.path.join(version_dir, name))
+
+
+class ModelRegistry:
+    """Tracks the active model bundle and the versions saved under ``model_dir``"""
+
+    def __init__(self, model_dir, keep_versions=3):
+        """
+        Args:
+            model_dir: Root directory of the saved model versions
+            keep_versions: Saved versions retained on disk after a publish
+        """
+        self.model_dir = model_dir
+        self.keep_versions = keep_versions
+        self.active = ModelBundle(None)
+        self._lock = threading.Lock()
+
+    def publish(self, bundle, persist=False):
+        """
+        Make ``bundle`` the served version with a single reference swap
+
+        Args:
+            bundle: Fully trained bundle
+            persist: Point ``CURRENT`` at the bundle's saved version so restarts load it
+        """
+        with self._lock:
+            previous = self.active
+            self.active = bundle
+        logger.info(f"✅ Published model version {bundle.version} (previous: {previous.version})")
+        if persist:
+            self.persist(bundle.version)
+        return previous
+
+    def persist(self, version):
+        """Point ``CURRENT`` at a saved version so restarts load it, and prune old versions"""
+        self._write_current(version)
+        self._prune_versions()
+
+    def version_dir(self, version):
+        return os.path.join(self.model_dir, 'versions', version)
+
+    def load_version(self, version):
+        """Load a saved version (memory-mapped) into a new bundle"""
+        models = create_models()
+        for name, model in models.items():
+            model.load_model(os.path.join(self.version_dir(version), name))
+        return ModelBundle(version, models)
+
+    def load_current(self):
+        """
+        Load the version ``CURRENT`` points at, falling back to the unversioned
+        layout (one artifact directory or legacy pickle per model)
+
+        Legacy deployments only saved some of the models; the others are
+        created untrained.
+
+        Raises:
+            FileNotFoundError: No saved models
+        """
+        current_path = os.path.join(self.model_dir, CURRENT_FILE)
+        if os.path.exists(current_path):
+            with open(current_path) as f:
+                return self.load_version(f.read().strip())
+
+        paths = {name: self._unversioned_path(name) for name in MODEL_NAMES}
+        if not any(os.path.exists(path) for path in paths.values()):
+            raise FileNotFoundError(f"No saved models in {self.model_dir}")
+
+        models = create_models()
+        for name, model in models.items():
+            if os.path.exists(paths[name]):
+                model.load_model(paths[name])
+            else:
+                logger.warning(f"⚠️  No saved {name} model, starting it untrained")
+        return ModelBundle('unversioned', models)
+
+    def _unversioned_path(self, name):
+        path = os.path.join(self.model_dir, name)
+        legacy_path = f"{path}_model.pkl"
+        if not os.path.isdir(path) and os.path.exists(legacy_path):
+            return legacy_path
+        return path
+
+    def _write_current(self, version):
+        os.makedirs(self.model_dir, exist_ok=True)
+        tmp_path = os.path.join(self.model_dir, f"{CURRENT_FILE}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.model_dir, CURRENT_FILE))
+
+    def _prune_versions(self):
+        versions_dir = os.path.join(self.model_dir, 'versions')
+        versions = sorted(os.listdir(versions_dir)) if os.path.isdir(versions_dir) else []
+        active = self.active.version
+        for version in versions[:-self.keep_versions]:
+            if version != active:
+                shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
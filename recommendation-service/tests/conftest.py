@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service is run from its own directory (uvicorn app:app), not installed as a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
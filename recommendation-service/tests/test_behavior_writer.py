@@ -0,0 +1,179 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+from utils.behavior_writer import BehaviorWriter, WriteQueueFull, SOURCE
+
+
+class FlakyCollection:
+    """Wraps a mongomock collection; the next ``failures`` inserts raise, optionally after writing"""
+
+    def __init__(self, collection, failures=0, store_before_failing=False):
+        self.collection = collection
+        self.failures = failures
+        self.store_before_failing = store_before_failing
+        self.batch_sizes = []
+
+    def insert_many(self, documents, ordered=True):
+        self.batch_sizes.append(len(documents))
+        if self.failures:
+            self.failures -= 1
+            if self.store_before_failing:
+                # Written, but the reply never reaches the client
+                self.collection.insert_many(documents, ordered=ordered)
+            raise AutoReconnect('connection closed')
+        return self.collection.insert_many(documents, ordered=ordered)
+
+    def find(self, *args, **kwargs):
+        return self.collection.find(*args, **kwargs)
+
+
+def make_writer(failures=0, store_before_failing=False, **kwargs):
+    client = mongomock.MongoClient()
+    collection = FlakyCollection(client.db.userbehaviors, failures, store_before_failing)
+    writer = BehaviorWriter(lambda: (client, {'userbehaviors': collection}), lambda client: None, **kwargs)
+    return writer, collection
+
+
+def events(count, user='u'):
+    return [
+        {'_id': ObjectId(), 'userId': user, 'sessionId': 's', 'productId': str(i), 'action': 'view', 'timestamp': time.time()}
+        for i in range(count)
+    ]
+
+
+def stored_ids(collection):
+    return [doc['_id'] for doc in collection.find({}, {'_id': 1})]
+
+
+async def run_writer(writer, body):
+    task = asyncio.create_task(writer.run())
+    try:
+        await body()
+    finally:
+        task.cancel()
+
+
+def test_full_batches_flush_before_the_interval():
+    writer, collection = make_writer(batch_size=10, flush_interval=30)
+
+    async def body():
+        await asyncio.sleep(0)
+        writer.submit(events(5))
+        await asyncio.sleep(0.1)
+        assert stored_ids(collection) == []
+        writer.submit(events(20))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run_writer(writer, body))
+    assert len(stored_ids(collection)) == 25
+    assert collection.batch_sizes == [10, 10, 5]
+    assert writer.pending() == 0
+
+
+def test_partial_batch_flushes_after_the_interval():
+    writer, collection = make_writer(batch_size=100, flush_interval=0.05)
+
+    async def body():
+        writer.submit(events(3))
+        await asyncio.sleep(0.3)
+
+    asyncio.run(run_writer(writer, body))
+    assert len(stored_ids(collection)) == 3
+    assert collection.batch_sizes == [3]
+
+
+def test_failed_batch_is_retried_before_later_events():
+    writer, collection = make_writer(failures=2, batch_size=4, flush_interval=0.01, max_retry_delay=0.02)
+    first, second = events(6, 'first'), events(6, 'second')
+
+    async def body():
+        writer.submit(first)
+        await asyncio.sleep(0.01)
+        writer.submit(second)
+        await asyncio.sleep(0.3)
+
+    asyncio.run(run_writer(writer, body))
+    assert stored_ids(collection) == [event['_id'] for event in first + second]
+    assert writer.stats['failed_batches'] == 2
+    assert writer.stats['last_error'] == 'connection closed'
+    assert writer.pending() == 0
+
+
+def test_flush_raises_and_keeps_the_queue():
+    writer, collection = make_writer(failures=1)
+    batch = events(5)
+    writer.submit(batch)
+
+    with pytest.raises(AutoReconnect):
+        asyncio.run(writer.flush())
+    assert writer.pending() == 5
+
+    asyncio.run(writer.flush())
+    assert stored_ids(collection) == [event['_id'] for event in batch]
+
+
+def test_lost_reply_skips_the_stored_events():
+    writer, collection = make_writer(failures=1, store_before_failing=True, batch_size=4)
+    batch = events(10)
+    writer.submit(batch)
+
+    with pytest.raises(AutoReconnect):
+        asyncio.run(writer.flush())
+    asyncio.run(writer.flush())
+
+    assert stored_ids(collection) == [event['_id'] for event in batch]
+    assert writer.stats['duplicates_skipped'] == 4
+    assert writer.stats['events_written'] == 6
+
+
+def test_resubmitted_events_are_not_written_twice():
+    writer, collection = make_writer(batch_size=50)
+    batch = events(80)
+    writer.submit(batch[:40])
+    asyncio.run(writer.flush())
+    writer.submit(batch)
+    asyncio.run(writer.flush())
+
+    assert stored_ids(collection) == [event['_id'] for event in batch]
+    assert writer.stats['duplicates_skipped'] == 40
+    assert writer.stats['events_written'] == 80
+
+
+def test_full_queue_refuses_new_events():
+    writer, collection = make_writer(max_queue=10)
+    writer.submit(events(8))
+
+    with pytest.raises(WriteQueueFull):
+        writer.submit(events(3))
+    assert writer.pending() == 8
+    assert writer.stats['events_rejected'] == 3
+    assert writer.has_room(2) and not writer.has_room(3)
+
+    # Events recovered on startup are queued regardless
+    writer.submit(events(5), force=True)
+    assert writer.pending() == 13
+
+    asyncio.run(writer.flush())
+    assert writer.pending() == 0
+    assert len(stored_ids(collection)) == 13
+    assert writer.has_room(10)
+
+
+def test_documents_are_marked_as_written_by_the_service():
+    writer, collection = make_writer()
+    product_id = ObjectId()
+    writer.submit([{'_id': ObjectId(), 'userId': 'user1', 'productId': str(product_id), 'action': 'purchase', 'timestamp': 0.0}])
+    asyncio.run(writer.flush())
+
+    document = next(collection.find())
+    assert document['source'] == SOURCE
+    assert document['productId'] == product_id
+    assert document['userId'] == 'user1'
+    assert document['timestamp'].replace(tzinfo=None) == datetime(1970, 1, 1)
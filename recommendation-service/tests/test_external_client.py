@@ -0,0 +1,178 @@
+import asyncio
+import time
+
+import pytest
+
+web = pytest.importorskip('aiohttp.web')
+
+from utils.external_client import ExternalDataClient
+
+
+class Upstream:
+    """Local JSON API whose payload, latency and status the tests control"""
+
+    def __init__(self):
+        self.payload = {'version': 1}
+        self.status = 200
+        self.delay = 0.0
+        self.hits = 0
+        self._runner = None
+        self.url = None
+
+    async def _handle(self, request):
+        self.hits += 1
+        await asyncio.sleep(self.delay)
+        if self.status != 200:
+            return web.json_response({'error': 'unavailable'}, status=self.status)
+        return web.json_response(self.payload)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get('/trending', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}/trending'
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
+
+
+def test_concurrent_callers_share_one_fetch(tmp_path):
+    async def scenario():
+        async with Upstream() as upstream:
+            upstream.delay = 0.1
+            client = ExternalDataClient(tmp_path)
+            try:
+                results = await asyncio.gather(*(client.get_json(upstream.url) for _ in range(5)))
+            finally:
+                await client.close()
+            return upstream.hits, results, client.stats
+
+    hits, results, stats = asyncio.run(scenario())
+    assert hits == 1
+    assert results == [{'version': 1}] * 5
+    assert stats['fetches'] == 1
+    assert stats['shared_fetches'] == 4
+
+
+def test_stale_response_is_served_while_revalidating(tmp_path):
+    async def scenario():
+        async with Upstream() as upstream:
+            client = ExternalDataClient(tmp_path, ttl=60)
+            try:
+                # Cached an hour ago, past the TTL but within max_stale
+                client._remember(upstream.url, ({'version': 0}, time.time() - 3600))
+                upstream.delay = 0.05
+                stale = await client.get_json(upstream.url)
+                hits_when_served = upstream.hits
+                await asyncio.sleep(0.2)
+                fresh = await client.get_json(upstream.url)
+            finally:
+                await client.close()
+            return stale, hits_when_served, fresh, upstream.hits, client.stats
+
+    stale, hits_when_served, fresh, hits, stats = asyncio.run(scenario())
+    assert stale == {'version': 0}
+    assert hits_when_served == 0
+    assert fresh == {'version': 1}
+    assert hits == 1
+    assert stats['stale_served'] == 1
+
+
+def test_expired_response_is_fetched_again(tmp_path):
+    async def scenario():
+        async with Upstream() as upstream:
+            client = ExternalDataClient(tmp_path, ttl=60, max_stale=60)
+            try:
+                client._remember(upstream.url, ({'version': 0}, time.time() - 3600))
+                data = await client.get_json(upstream.url)
+            finally:
+                await client.close()
+            return data, upstream.hits
+
+    assert asyncio.run(scenario()) == ({'version': 1}, 1)
+
+
+def test_disk_cache_is_read_after_a_restart(tmp_path):
+    async def scenario():
+        async with Upstream() as upstream:
+            first = ExternalDataClient(tmp_path)
+            try:
+                await first.get_json(upstream.url)
+            finally:
+                await first.close()
+
+            restarted = ExternalDataClient(tmp_path)
+            try:
+                data = await restarted.get_json(upstream.url)
+                again = await restarted.get_json(upstream.url)
+            finally:
+                await restarted.close()
+            return data, again, upstream.hits, restarted.stats
+
+    data, again, hits, stats = asyncio.run(scenario())
+    assert data == again == {'version': 1}
+    assert hits == 1
+    assert stats['disk_hits'] == 1
+    assert stats['memory_hits'] == 1
+    assert stats['fetches'] == 0
+
+
+def test_unreadable_disk_cache_is_ignored(tmp_path):
+    async def scenario():
+        async with Upstream() as upstream:
+            client = ExternalDataClient(tmp_path)
+            client._path(upstream.url).write_text('{not json', encoding='utf-8')
+            try:
+                data = await client.get_json(upstream.url)
+            finally:
+                await client.close()
+            return data, upstream.hits
+
+    assert asyncio.run(scenario()) == ({'version': 1}, 1)
+
+
+def test_failed_url_waits_for_retry_interval(tmp_path):
+    async def scenario():
+        async with Upstream() as upstream:
+            upstream.status = 503
+            client = ExternalDataClient(tmp_path, retry_interval=0.2)
+            try:
+                failed = await client.get_json(upstream.url)
+                skipped = await client.get_json(upstream.url)
+                hits_before_retry = upstream.hits
+                upstream.status = 200
+                await asyncio.sleep(0.25)
+                retried = await client.get_json(upstream.url)
+            finally:
+                await client.close()
+            return failed, skipped, hits_before_retry, retried, upstream.hits, client.stats
+
+    failed, skipped, hits_before_retry, retried, hits, stats = asyncio.run(scenario())
+    assert failed is None and skipped is None
+    assert hits_before_retry == 1
+    assert retried == {'version': 1}
+    assert hits == 2
+    assert stats['fetch_errors'] == 1
+    assert '503' in stats['last_error']
+
+
+def test_stale_response_survives_a_failed_revalidation(tmp_path):
+    async def scenario():
+        async with Upstream() as upstream:
+            upstream.status = 500
+            client = ExternalDataClient(tmp_path, ttl=60, retry_interval=60)
+            try:
+                client._remember(upstream.url, ({'version': 0}, time.time() - 3600))
+                first = await client.get_json(upstream.url)
+                await asyncio.sleep(0.1)
+                second = await client.get_json(upstream.url)
+            finally:
+                await client.close()
+            return first, second, upstream.hits
+
+    assert asyncio.run(scenario()) == ({'version': 0}, {'version': 0}, 1)
@@ -0,0 +1,352 @@
+"""
+Behavior Store
+Fixed-capacity columnar ring buffer of behavior events
+"""
+
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Events kept in memory; the oldest are overwritten once the buffer is full
+DEFAULT_CAPACITY = 1_000_000
+
+class IdInterner:
+    """
+    Interns string ids (users, products, sessions, actions) to dense int codes
+
+    An interner only grows, so a code never changes meaning. Product and
+    action interners live for the process and are shared by rebuilt stores
+    and the models; user and session tables are replaced by compacted ones
+    instead (see ``BehaviorStore.compact_ids``).
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.index = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def codes(self, values: Iterable) -> np.ndarray:
+        """Codes for ``values``, adding unseen ones (-1 for missing values)"""
+        index, ids = self.index, self.ids
+        codes = []
+        # Batches may be interned from a loader thread while the event loop appends
+        with self._lock:
+            for value in values:
+                if value is None:
+                    codes.append(-1)
+                    continue
+                value = str(value)
+                code = index.get(value)
+                if code is None:
+                    code = len(ids)
+                    index[value] = code
+                    ids.append(value)
+                codes.append(code)
+        return np.array(codes, dtype=np.int32)
+
+    def lookup(self, value) -> Optional[int]:
+        """Code for a known value without adding it"""
+        return None if value is None else self.index.get(str(value))
+
+    @classmethod
+    def from_ids(cls, ids: List) -> 'IdInterner':
+        interner = cls()
+        interner.ids = list(ids)
+        interner.index = {value: code for code, value in enumerate(interner.ids)}
+        return interner
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Object array of ids for ``codes`` (None where the code is -1)"""
+        table = np.empty(len(self.ids) + 1, dtype=object)
+        table[:len(self.ids)] = self.ids
+        return table[codes]
+
+
+class BehaviorStore:
+    """
+    Behavior events in preallocated typed arrays used as a ring buffer
+
+    Each event is one slot across five arrays (user, product and session
+    codes, action code, epoch timestamp): 22 bytes per event instead of a
+    Mongo document dict. Appends write in place and wrap around when the
+    buffer is full, overwriting the oldest events, so there is never a
+    trim or a regrow copy.
+
+    The ``*_codes`` properties are zero-copy views of the live events. They
+    are in arrival order until the buffer first wraps; after that all slots
+    are live and the order is rotated, which aggregations don't care about.
+    Appends may overwrite slots under a view, so consumers that outlive the
+    current call (training) take ``interaction_arrays``, which copies.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, interners: Optional[Dict[str, IdInterner]] = None):
+        """
+        Args:
+            capacity: Events kept before the oldest are overwritten
+            interners: IdInterners to share ('users', 'products', 'sessions', 'actions')
+        """
+        interners = interners or {}
+        self.capacity = capacity
+        self.users = interners['users'] if 'users' in interners else IdInterner()
+        self.products = interners['products'] if 'products' in interners else IdInterner()
+        self.sessions = interners['sessions'] if 'sessions' in interners else IdInterner()
+        self.actions = interners['actions'] if 'actions' in interners else IdInterner()
+        # np.empty leaves untouched pages unallocated, so capacity costs nothing until used
+        self._user = np.empty(capacity, dtype=np.int32)
+        self._product = np.empty(capacity, dtype=np.int32)
+        self._session = np.empty(capacity, dtype=np.int32)
+        self._action = np.empty(capacity, dtype=np.int16)
+        self._timestamp = np.empty(capacity, dtype=np.float64)
+        self._head = 0
+        self._size = 0
+        # Held while slots are written and while interaction_arrays copies them
+        self._lock = threading.Lock()
+        # Events ever appended / overwritten by newer ones
+        self.appended = 0
+        self.evicted = 0
+        # User + session ids that make compact_ids worthwhile once the buffer has wrapped
+        self._compact_at = max(capacity, 1024)
+
+    def __len__(self):
+        return self._size
+
+    def interners(self) -> Dict[str, IdInterner]:
+        return {'users': self.users, 'products': self.products, 'sessions': self.sessions, 'actions': self.actions}
+
+    def empty_like(self) -> 'BehaviorStore':
+        """
+        A new, empty store of the same capacity sharing this store's product
+        and action codes
+
+        Users and sessions start from empty tables, so ids that are no longer
+        in the data are dropped on every rebuild.
+        """
+        return BehaviorStore(self.capacity, {'products': self.products, 'actions': self.actions})
+
+    def needs_compaction(self) -> bool:
+        """Whether the user and session tables have outgrown the live events"""
+        return self.evicted > 0 and len(self.users) + len(self.sessions) >= self._compact_at
+
+    def compact_ids(self, keep_sessions: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Re-intern users and sessions to the ids still in the buffer
+
+        Once the buffer wraps, ids of overwritten events stay in the tables
+        forever; this replaces both interners with ones holding only the live
+        ids (and ``keep_sessions``, e.g. open baskets) and rewrites the codes
+        in place. Products and actions keep their codes. Runs on the thread
+        that appends.
+
+        Args:
+            keep_sessions: Session codes to keep even without live events
+
+        Returns:
+            New code of every old session code (-1 where dropped)
+        """
+        with self._lock:
+            user_map = self._recode('_user', self.users)
+            session_map = self._recode('_session', self.sessions, keep_sessions)
+            self.users = IdInterner.from_ids(np.asarray(self.users.ids, dtype=object)[user_map >= 0])
+            self.sessions = IdInterner.from_ids(np.asarray(self.sessions.ids, dtype=object)[session_map >= 0])
+            # Amortized: the next compaction waits for as many new ids as are live now
+            self._compact_at = max(2 * (len(self.users) + len(self.sessions)), self.capacity, 1024)
+        logger.info(f"✅ Compacted behavior ids to {len(self.users)} users and {len(self.sessions)} sessions")
+        return session_map
+
+    def _recode(self, name: str, interner: IdInterner, keep: Optional[np.ndarray] = None) -> np.ndarray:
+        """Map old codes of ``interner`` to dense new ones and rewrite the ``name`` column"""
+        codes = getattr(self, name)[:self._size]
+        used = np.zeros(len(interner) + 1, dtype=bool)
+        used[codes] = True
+        if keep is not None:
+            used[np.asarray(keep, dtype=np.int64)] = True
+        # Slot -1 (missing id) stays -1
+        used[-1] = False
+        mapping = np.full(len(interner) + 1, -1, dtype=np.int32)
+        mapping[used] = np.arange(int(used.sum()), dtype=np.int32)
+        codes[:] = mapping[codes]
+        return mapping[:-1]
+
+    def append_columns(self, user_ids: List, product_ids: List, session_ids: List,
+                       actions: List, timestamps: np.ndarray):
+        """
+        Append a batch of events given as parallel columns
+
+        Args:
+            user_ids, product_ids, session_ids, actions: Raw values (ObjectIds
+                and other ids are stored as strings; None when missing)
+            timestamps: Epoch seconds (NaN when unknown)
+        """
+        n = len(user_ids)
+        skip = max(0, n - self.capacity)
+        with self._lock:
+            # Coded under the lock so they match the interners compact_ids swaps in
+            columns = (
+                (self._user, self.users.codes(user_ids)),
+                (self._product, self.products.codes(product_ids)),
+                (self._session, self.sessions.codes(session_ids)),
+                (self._action, self.actions.codes(actions)),
+                (self._timestamp, np.asarray(timestamps, dtype=np.float64))
+            )
+            head = self._head
+            for buffer, values in columns:
+                values = values[skip:]
+                first = min(len(values), self.capacity - head)
+                buffer[head:head + first] = values[:first]
+                buffer[:len(values) - first] = values[first:]
+
+            overflow = max(0, self._size + n - self.capacity)
+            self._head = (head + n - skip) % self.capacity
+            self._size = min(self.capacity, self._size + n)
+            self.appended += n
+        if overflow:
+            self.evicted += overflow
+            if self.evicted == overflow:
+                logger.warning(f"Behavior store full ({self.capacity} events); overwriting the oldest events")
+
+    def extend(self, behaviors: List[Dict]):
+        """Append behavior dicts (userId, productId, sessionId, action, timestamp)"""
+        self.append_columns(
+            [b.get('userId') for b in behaviors],
+            [b.get('productId') for b in behaviors],
+            [b.get('sessionId') for b in behaviors],
+            [b.get('action') for b in behaviors],
+            to_epoch_seconds([b.get('timestamp') for b in behaviors])
+        )
+
+    def append(self, behavior: Dict):
+        self.extend([behavior])
+
+    @property
+    def user_codes(self) -> np.ndarray:
+        return self._user[:self._size]
+
+    @property
+    def product_codes(self) -> np.ndarray:
+        return self._product[:self._size]
+
+    @property
+    def session_codes(self) -> np.ndarray:
+        return self._session[:self._size]
+
+    @property
+    def action_codes(self) -> np.ndarray:
+        return self._action[:self._size]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamp[:self._size]
+
+    def interaction_arrays(self) -> Dict:
+        """
+        Training input: copies of the live codes plus the id tables they index
+
+        The codes are copied under the store lock, so appends that wrap the
+        buffer during a (possibly threaded) training run cannot change its
+        input. Consumed by ``build_interaction_matrix`` without going through
+        strings or a DataFrame.
+        """
+        with self._lock:
+            arrays = {
+                'user_codes': self.user_codes.copy(),
+                'product_codes': self.product_codes.copy(),
+                'action_codes': self.action_codes.copy()
+            }
+            users = self.users
+        # Interners only grow (compaction swaps in a new one), so a later snapshot still covers every copied code
+        arrays.update({
+            'user_ids': list(users.ids),
+            'product_ids': list(self.products.ids),
+            'action_names': list(self.actions.ids)
+        })
+        return arrays
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Decoded columns (userId, productId, action), e.g. for building a DataFrame"""
+        return {
+            'userId': self.users.decode(self.user_codes),
+            'productId': self.products.decode(self.product_codes),
+            'action': self.actions.decode(self.action_codes)
+        }
+
+    def records(self, rows: np.ndarray) -> List[Dict]:
+        """Behavior dicts for the given slots"""
+        users = self.users.decode(self._user[rows])
+        products = self.products.decode(self._product[rows])
+        sessions = self.sessions.decode(self._session[rows])
+        actions = self.actions.decode(self._action[rows])
+        timestamps = self._timestamp[rows]
+        return [
+            {
+                'userId': users[i],
+                'productId': products[i],
+                'sessionId': sessions[i],
+                'action': actions[i],
+                'timestamp': None if np.isnan(timestamps[i]) else float(timestamps[i])
+            }
+            for i in range(len(users))
+        ]
+
+    def latest_rows(self, n: int) -> np.ndarray:
+        """Slots of the ``n`` most recently appended events, oldest first"""
+        n = min(n, self._size)
+        return (self._head - n + np.arange(n)) % self.capacity
+
+    def user_rows(self, user_id) -> np.ndarray:
+        """Slots of a user's events, oldest first"""
+        code = self.users.lookup(user_id)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.flatnonzero(self.user_codes == code)
+        if self._size == self.capacity:
+            rows = rows[np.argsort((rows - self._head) % self.capacity, kind='stable')]
+        return rows
+
+    def user_records(self, user_id) -> List[Dict]:
+        """
+        Behavior dicts of a user's events, oldest first
+
+        Taken under the store lock, so it is safe from executor threads while
+        the event loop appends or compacts ids.
+        """
+        with self._lock:
+            return self.records(self.user_rows(user_id))
+
+    def product_counts(self) -> np.ndarray:
+        """Number of events per product code"""
+        codes = self.product_codes
+        return np.bincount(codes[codes >= 0], minlength=len(self.products))
+
+    def memory_bytes(self) -> int:
+        """Bytes reserved for the event arrays (the id tables are extra)"""
+        return sum(buffer.nbytes for buffer in (self._user, self._product, self._session, self._action, self._timestamp))
+
+
+def to_epoch_seconds(values: List) -> np.ndarray:
+    """
+    Convert timestamps to epoch seconds (NaN when missing)
+
+    Naive datetimes are UTC, as pymongo returns them; those batches convert in
+    one vectorized step. Numbers are taken as epoch seconds already.
+    """
+    if all(value is None or (isinstance(value, datetime) and value.tzinfo is None) for value in values):
+        stamps = np.array(values, dtype='datetime64[us]')
+        seconds = stamps.astype(np.int64) / 1e6
+        seconds[np.isnat(stamps)] = np.nan
+        return seconds
+
+    result = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        if isinstance(value, datetime):
+            result[i] = (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+        elif isinstance(value, (int, float)):
+            result[i] = value
+    return result
@@ -0,0 +1,232 @@
+"""
+Behavior Writer
+Write-behind queue persisting tracked behaviors to MongoDB in batches
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Marks documents written by this service; the incremental sync skips them
+# since their events are already in memory
+SOURCE = 'recommendation-service'
+DUPLICATE_KEY = 11000
+
+
+class WriteQueueFull(Exception):
+    """The write-behind queue has no room for a batch; the caller should retry later"""
+
+
+class BehaviorWriter:
+    """
+    Buffers tracked behaviors and inserts them into ``userbehaviors`` behind the request path
+
+    ``submit`` only appends to an in-memory queue; a background task flushes
+    it with ``insert_many`` whenever ``batch_size`` events are waiting or
+    ``flush_interval`` seconds have passed. Batches are written in queue order
+    and an event leaves the queue only once it is stored, so a failed write
+    is retried (with exponential backoff) before anything behind it.
+
+    Every event carries a client-generated ``_id``: a retry of a batch whose
+    reply was lost hits a duplicate key and skips the events already stored
+    instead of inserting them twice. The queue holds at most ``max_queue``
+    events; ``ensure_room`` lets callers refuse new events (backpressure)
+    rather than letting memory grow while MongoDB is unavailable.
+    """
+
+    def __init__(self, open_database: Callable, close_client: Callable, batch_size: int = 1000,
+                 flush_interval: float = 1.0, max_queue: int = 100000, max_retry_delay: float = 30.0):
+        """
+        Args:
+            open_database: Returns ``(client, database)``; called again after a failed write
+            close_client: Releases a client returned by ``open_database``
+            batch_size: Events per ``insert_many``
+            flush_interval: Longest time an event waits before its batch is written
+            max_queue: Events buffered before new ones are refused
+            max_retry_delay: Cap of the backoff between failed attempts
+        """
+        self.open_database = open_database
+        self.close_client = close_client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retry_delay = max_retry_delay
+        self._queue = deque()
+        self._client = None
+        self._collection = None
+        self._full = None
+        self._flush_lock = None
+        self._retry_delay = 0.0
+        self.stats = {
+            'events_queued': 0,
+            'events_written': 0,
+            'events_rejected': 0,
+            'duplicates_skipped': 0,
+            'events_dropped': 0,
+            'batches': 0,
+            'failed_batches': 0,
+            'last_batch_size': 0,
+            'last_batch_ms': 0.0,
+            'last_error': None
+        }
+
+    def has_room(self, count: int = 1) -> bool:
+        return len(self._queue) + count <= self.max_queue
+
+    def ensure_room(self, count: int):
+        """
+        Raises:
+            WriteQueueFull: The queue has no room for ``count`` more events
+        """
+        if not self.has_room(count):
+            self.stats['events_rejected'] += count
+            raise WriteQueueFull(f"Write-behind queue is full ({len(self._queue)} events pending)")
+
+    def submit(self, behaviors: List[Dict], force: bool = False):
+        """
+        Queue behaviors (dicts with a client-generated ``_id``) for writing
+
+        Args:
+            force: Queue even past ``max_queue`` (events recovered on startup)
+
+        Raises:
+            WriteQueueFull: The queue has no room for the whole batch
+        """
+        if not force:
+            self.ensure_room(len(behaviors))
+        self._queue.extend(behaviors)
+        self.stats['events_queued'] += len(behaviors)
+        if self._full is not None and len(self._queue) >= self.batch_size:
+            self._full.set()
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    async def run(self):
+        """Flush loop; started as a background task on startup"""
+        self._full = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                self.stats['failed_batches'] += 1
+                self.stats['last_error'] = str(e)
+                self._retry_delay = min(self.max_retry_delay, max(self.flush_interval, self._retry_delay * 2))
+                logger.error(f"Writing behaviors to MongoDB failed ({len(self._queue)} pending, "
+                             f"retrying in {self._retry_delay:.1f}s): {str(e)}")
+                self._reset_client()
+                await asyncio.sleep(self._retry_delay)
+
+    async def flush(self):
+        """Write every queued event, oldest first; raises on the first failed batch"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        async with self._flush_lock:
+            while self._queue:
+                batch = list(islice(self._queue, self.batch_size))
+                start = time.perf_counter()
+                written, duplicates, dropped = await loop.run_in_executor(None, self._insert, batch)
+                # Only this task removes events, so the front of the queue is still ``batch``
+                for _ in range(written + duplicates + dropped):
+                    self._queue.popleft()
+                self._retry_delay = 0.0
+                self.stats['events_written'] += written
+                self.stats['duplicates_skipped'] += duplicates
+                self.stats['events_dropped'] += dropped
+                self.stats['batches'] += 1
+                self.stats['last_batch_size'] = written
+                self.stats['last_batch_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    def _insert(self, batch: List[Dict]):
+        """
+        Insert a batch in order, stopping at the first write error
+
+        Returns:
+            Tuple of (documents inserted, duplicates skipped, documents dropped),
+            which together count the leading events of ``batch`` that are done
+        """
+        from pymongo.errors import BulkWriteError
+
+        if self._collection is None:
+            self._client, database = self.open_database()
+            self._collection = database['userbehaviors']
+        documents = [_document(behavior) for behavior in batch]
+        try:
+            self._collection.insert_many(documents, ordered=True)
+            return len(batch), 0, 0
+        except BulkWriteError as e:
+            inserted = e.details.get('nInserted', 0)
+            error = (e.details.get('writeErrors') or [{}])[0]
+            if error.get('code') == DUPLICATE_KEY:
+                # Stored by an earlier attempt whose reply was lost; skip the whole run of stored events
+                rest = [document['_id'] for document in documents[inserted:]]
+                stored = {doc['_id'] for doc in self._collection.find({'_id': {'$in': rest}}, {'_id': 1})}
+                duplicates = next((i for i, event_id in enumerate(rest) if event_id not in stored), len(rest))
+                return inserted, max(duplicates, 1), 0
+            if 'index' not in error:
+                raise
+            # Rejected by the server (not a connection problem): retrying would block the queue forever
+            logger.error(f"Dropping behavior MongoDB rejected: {error.get('errmsg')}")
+            return inserted, 0, 1
+
+    def _reset_client(self):
+        client, self._client, self._collection = self._client, None, None
+        if client is not None:
+            try:
+                self.close_client(client)
+            except Exception:
+                pass
+
+    async def close(self, timeout: float = 5.0):
+        """Try to write what is still queued (anything left is recovered from the event log)"""
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except Exception as e:
+            logger.warning(f"{len(self._queue)} behaviors not written to MongoDB on shutdown: {str(e)}")
+        self._reset_client()
+
+    def metrics(self) -> Dict:
+        return {
+            **self.stats,
+            'queue_depth': len(self._queue),
+            'max_queue': self.max_queue,
+            'batch_size': self.batch_size,
+            'flush_interval_seconds': self.flush_interval,
+            'retry_delay_seconds': self._retry_delay
+        }
+
+
+def _document(behavior: Dict) -> Dict:
+    """The ``userbehaviors`` document for a tracked behavior (see UserBehavior.js)"""
+    from bson import ObjectId
+
+    timestamp = behavior.get('timestamp')
+    now = datetime.now(timezone.utc)
+    document = {
+        '_id': ObjectId(behavior['_id']),
+        'sessionId': behavior.get('sessionId'),
+        'action': behavior.get('action'),
+        'timestamp': datetime.fromtimestamp(timestamp, timezone.utc) if timestamp is not None else now,
+        'metadata': behavior.get('metadata') or {},
+        'source': SOURCE,
+        'createdAt': now,
+        'updatedAt': now
+    }
+    # Ids are ObjectId refs in the schema; anything else (e.g. sample data ids) is kept as a string
+    for field in ('userId', 'productId'):
+        value = behavior.get(field)
+        if value is not None:
+            document[field] = ObjectId(value) if ObjectId.is_valid(value) else value
+    return document
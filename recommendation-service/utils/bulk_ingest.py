@@ -0,0 +1,150 @@
+"""
+Bulk Behavior Ingestion
+Parses and validates batches of tracked behaviors (JSON arrays or NDJSON)
+"""
+
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Accepted spellings of each field: the service's snake_case and the storefront's camelCase
+_ALIASES = {
+    'userId': ('user_id', 'userId'),
+    'sessionId': ('session_id', 'sessionId'),
+    'productId': ('product_id', 'productId'),
+    'action': ('action',)
+}
+_REQUIRED = ('sessionId', 'productId', 'action')
+# Errors reported back per request; the counts always cover every event
+MAX_REPORTED_ERRORS = 20
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+def parse_batch(body: bytes, content_type: Optional[str] = None, max_events: int = 10000) -> Tuple[List, List[Dict]]:
+    """
+    Split a request body into raw events
+
+    Accepts a JSON array, ``{"behaviors": [...]}`` (the storefront's buffer
+    payload) or NDJSON (one event per line; used when the content type says
+    so or the body isn't a single JSON document). Unparseable NDJSON lines
+    are rejected individually.
+
+    Returns:
+        (raw events, parse errors as {'index', 'error'})
+
+    Raises:
+        ValueError: The body is not valid JSON or NDJSON
+        BatchTooLarge: More than ``max_events`` events
+    """
+    ndjson = content_type is not None and 'ndjson' in content_type
+    if not ndjson:
+        try:
+            document = json.loads(body)
+        except ValueError:
+            ndjson = True
+        else:
+            if isinstance(document, dict) and isinstance(document.get('behaviors'), list):
+                events = document['behaviors']
+            elif isinstance(document, list):
+                events = document
+            else:
+                # A single event, i.e. one-line NDJSON
+                events = [document]
+            if len(events) > max_events:
+                raise BatchTooLarge(f"At most {max_events} events per request")
+            return events, []
+
+    lines = [line for line in body.splitlines() if line.strip()]
+    if len(lines) > max_events:
+        raise BatchTooLarge(f"At most {max_events} events per request")
+    events = []
+    errors = []
+    for index, line in enumerate(lines):
+        try:
+            events.append(json.loads(line))
+        except ValueError as e:
+            errors.append({'index': index, 'error': f"invalid JSON: {e}"})
+            events.append(None)
+    if lines and len(errors) == len(lines):
+        raise ValueError("Body is neither JSON nor NDJSON")
+    return events, errors
+
+
+def validate_events(events: List, parse_errors: Optional[List[Dict]] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Validate raw events and convert them to behavior dicts
+
+    ``sessionId``, ``productId`` and ``action`` are required, as for
+    ``/behavior/track``. An optional ``timestamp`` (epoch seconds or
+    milliseconds, or an ISO 8601 string; ``metadata.timestamp`` as sent by
+    the storefront also works) keeps buffered events in the right trending
+    bucket.
+
+    Returns:
+        (behavior dicts, errors as {'index', 'error'})
+    """
+    failed = {error['index'] for error in parse_errors or []}
+    errors = list(parse_errors or [])
+    behaviors = []
+    for index, event in enumerate(events):
+        if index in failed:
+            continue
+        try:
+            behaviors.append(_to_behavior(event))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    errors.sort(key=lambda error: error['index'])
+    return behaviors, errors
+
+
+def _to_behavior(event) -> Dict:
+    if not isinstance(event, dict):
+        raise ValueError("event must be an object")
+
+    behavior = {}
+    for field, keys in _ALIASES.items():
+        value = event.get(keys[0])
+        if value is None and len(keys) > 1:
+            value = event.get(keys[1])
+        if value is None:
+            if field in _REQUIRED:
+                raise ValueError(f"missing {keys[0]}")
+        elif type(value) is not str:
+            # Numeric ids are accepted and stored as strings
+            if type(value) is not int:
+                raise ValueError(f"{keys[0]} must be a non-empty string")
+            value = str(value)
+        elif not value:
+            raise ValueError(f"{keys[0]} must be a non-empty string")
+        behavior[field] = value
+
+    metadata = event.get('metadata')
+    if metadata is not None and not isinstance(metadata, dict):
+        raise ValueError("metadata must be an object")
+    metadata = metadata or {}
+    behavior['metadata'] = metadata
+
+    timestamp = event.get('timestamp', metadata.get('timestamp'))
+    behavior['timestamp'] = None if timestamp is None else _epoch_seconds(timestamp)
+    return behavior
+
+
+def _epoch_seconds(value) -> float:
+    if isinstance(value, bool):
+        raise ValueError("timestamp must be epoch seconds or an ISO 8601 string")
+    if isinstance(value, (int, float)):
+        # Browsers send Date.now() milliseconds
+        return value / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"invalid timestamp: {value!r}")
+        return (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp()
+    raise ValueError("timestamp must be epoch seconds or an ISO 8601 string")
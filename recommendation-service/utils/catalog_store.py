@@ -0,0 +1,260 @@
+"""
+Catalog Store
+Indexed in-memory product catalog
+"""
+
+import sys
+import bisect
+import logging
+import itertools
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .name_matcher import PatternMatcher
+
+logger = logging.getLogger(__name__)
+
+class ProductRecord:
+    """One catalog product; ``__slots__`` keeps it far smaller than a Mongo document dict"""
+
+    __slots__ = ('id', 'name', 'description', 'category', 'price', 'image', 'tags',
+                 'stock', 'unit', 'unit_quantity', 'updated_at', 'seq')
+
+    def __init__(self, id, name=None, description=None, category=None, price=None, image=None,
+                 tags=None, stock=None, unit=None, unit_quantity=None, updated_at=None):
+        self.id = id
+        self.name = name
+        self.description = description
+        # Few distinct values, shared across many products
+        self.category = sys.intern(category) if isinstance(category, str) else category
+        self.price = price
+        self.image = image
+        self.tags = tags
+        self.stock = stock
+        self.unit = sys.intern(unit) if isinstance(unit, str) else unit
+        self.unit_quantity = unit_quantity
+        self.updated_at = updated_at
+        self.seq = 0
+
+    @classmethod
+    def from_dict(cls, product: Dict) -> 'ProductRecord':
+        return cls(
+            str(product.get('_id', product.get('id', ''))),
+            name=product.get('name'),
+            description=product.get('description'),
+            category=product.get('category'),
+            price=product.get('price'),
+            image=product.get('image'),
+            tags=product.get('tags'),
+            stock=product.get('stock'),
+            unit=product.get('unit'),
+            unit_quantity=product.get('unitQuantity'),
+            updated_at=product.get('updatedAt')
+        )
+
+    def same_as(self, other: 'ProductRecord') -> bool:
+        """Whether both records hold the same product data"""
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__ if field != 'seq')
+
+    def to_dict(self) -> Dict:
+        """The product as a Mongo-shaped dict (fields that are set only)"""
+        product = {'_id': self.id}
+        for key, attr in _FIELD_ATTRS.items():
+            value = getattr(self, attr)
+            if value is not None and key != '_id':
+                product[key] = value
+        return product
+
+    def summary(self) -> Dict:
+        """The fields endpoints attach to recommendations"""
+        return {
+            'product_id': self.id,
+            'name': self.name,
+            'category': self.category,
+            'price': self.price,
+            'image': self.image
+        }
+
+
+# Catalog versions, unique across stores so a replaced catalog never repeats one
+_versions = itertools.count(1)
+
+# Mongo field name -> ProductRecord attribute
+_FIELD_ATTRS = {
+    '_id': 'id', 'name': 'name', 'description': 'description', 'category': 'category',
+    'price': 'price', 'image': 'image', 'tags': 'tags', 'stock': 'stock', 'unit': 'unit',
+    'unitQuantity': 'unit_quantity', 'updatedAt': 'updated_at'
+}
+
+
+class CatalogStore:
+    """
+    Product catalog with a hash index by id and secondary indexes by category
+    and, given a ``PatternMatcher``, by the pattern terms each name contains
+
+    Iteration follows catalog order (first insertion); replacing a product
+    keeps its position, as the list-based catalog did.
+    """
+
+    def __init__(self, products: Optional[Iterable[Dict]] = None, name_matcher: Optional[PatternMatcher] = None):
+        self._records = {}
+        self._by_category = {}
+        self._name_matcher = name_matcher
+        # Term -> (seq, id) of the products whose name contains it, in catalog order
+        self._by_term = {}
+        self._next_seq = 0
+        # Changes on every upsert or removal, for anything derived from the catalog
+        self.version = next(_versions)
+        if products:
+            self.upsert(products)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, product_id) -> bool:
+        return str(product_id) in self._records
+
+    def __iter__(self) -> Iterator[ProductRecord]:
+        return iter(self._records.values())
+
+    def ids(self) -> List[str]:
+        return list(self._records)
+
+    def get(self, product_id) -> Optional[ProductRecord]:
+        """O(1) lookup by id"""
+        return self._records.get(str(product_id))
+
+    def head(self, limit: int) -> List[ProductRecord]:
+        """The first ``limit`` products in catalog order"""
+        records = []
+        for record in self._records.values():
+            if len(records) >= limit:
+                break
+            records.append(record)
+        return records
+
+    def upsert(self, products: Iterable[Dict]) -> List[ProductRecord]:
+        """Insert new products or replace existing ones (matched by _id)"""
+        records = []
+        for product in products:
+            record = ProductRecord.from_dict(product)
+            previous = self._records.get(record.id)
+            if previous is None:
+                record.seq = self._next_seq
+                self._next_seq += 1
+                self._index_name(record)
+            else:
+                record.seq = previous.seq
+                if previous.name != record.name:
+                    self._unindex_name(previous)
+                    self._index_name(record)
+                if previous.category == record.category:
+                    # Same category: replace in place, keeping the product's position
+                    self._by_category[record.category or ''][record.id] = record
+                    self._records[record.id] = record
+                    records.append(record)
+                    continue
+                self._unindex(previous)
+            self._records[record.id] = record
+            self._index(record)
+            records.append(record)
+        if records:
+            self.version = next(_versions)
+        return records
+
+    def remove(self, product_ids: Iterable) -> int:
+        """Remove products by id; returns how many were present"""
+        removed = 0
+        for product_id in product_ids:
+            record = self._records.pop(str(product_id), None)
+            if record is not None:
+                self._unindex(record)
+                self._unindex_name(record)
+                removed += 1
+        if removed:
+            self.version = next(_versions)
+        return removed
+
+    def categories(self) -> List[str]:
+        return list(self._by_category)
+
+    def in_category(self, category: str) -> List[ProductRecord]:
+        """Products whose category equals ``category``, in catalog order"""
+        return list(self._by_category.get(category, {}).values())
+
+    def matching_category(self, term: str, limit: Optional[int] = None) -> List[ProductRecord]:
+        """
+        Products whose category contains ``term`` (case-insensitive), in catalog order
+
+        Only the distinct category names are scanned, not the products.
+        """
+        term = term.lower()
+        groups = [group for category, group in self._by_category.items() if term in str(category).lower()]
+        if len(groups) == 1:
+            records = list(groups[0].values())
+        else:
+            records = sorted((record for group in groups for record in group.values()), key=lambda r: r.seq)
+        return records if limit is None else records[:limit]
+
+    def named(self, term: str) -> Iterator[ProductRecord]:
+        """
+        Products whose name contains ``term`` (case-insensitive), in catalog order
+
+        Terms of the name matcher are served from the term index; any other
+        term falls back to scanning the catalog.
+        """
+        term = term.lower()
+        if self._name_matcher is None or term not in self._name_matcher:
+            return (record for record in self._records.values() if term in (record.name or '').lower())
+        return (self._records[product_id] for _, product_id in self._by_term.get(term, ()))
+
+    def enrich(self, items: List[Dict], id_key: str = 'product_id') -> List[Dict]:
+        """Fill in name, category, price and image for each item from the catalog (O(1) per item)"""
+        for item in items:
+            record = self._records.get(str(item.get(id_key)))
+            if record is None:
+                continue
+            for key, value in record.summary().items():
+                if item.get(key) is None:
+                    item[key] = value
+        return items
+
+    def to_dicts(self) -> List[Dict]:
+        """Products as Mongo-shaped dicts, e.g. for training the content model"""
+        return [record.to_dict() for record in self._records.values()]
+
+    def _index(self, record: ProductRecord):
+        group = self._by_category.setdefault(record.category or '', {})
+        group[record.id] = record
+        # A product that moved category lands at the end; restore catalog order
+        if len(group) > 1 and next(reversed(group.values())).seq < _second_last(group).seq:
+            ordered = sorted(group.values(), key=lambda r: r.seq)
+            self._by_category[record.category or ''] = {r.id: r for r in ordered}
+
+    def _index_name(self, record: ProductRecord):
+        if self._name_matcher is None or not record.name:
+            return
+        for term in self._name_matcher.find(record.name):
+            bisect.insort(self._by_term.setdefault(term, []), (record.seq, record.id))
+
+    def _unindex_name(self, record: ProductRecord):
+        if self._name_matcher is None or not record.name:
+            return
+        for term in self._name_matcher.find(record.name):
+            entries = self._by_term[term]
+            del entries[bisect.bisect_left(entries, (record.seq, record.id))]
+            if not entries:
+                del self._by_term[term]
+
+    def _unindex(self, record: ProductRecord):
+        key = record.category or ''
+        group = self._by_category.get(key)
+        if group is not None:
+            group.pop(record.id, None)
+            if not group:
+                del self._by_category[key]
+
+
+def _second_last(group: Dict) -> ProductRecord:
+    values = reversed(group.values())
+    next(values)
+    return next(values)
@@ -7,8 +7,18 @@ Enhanced with cold-start handling and real-time sync
 import os
 import logging
 from typing import List, Dict, Optional
+import time
 import asyncio
-from datetime import datetime, timedelta
+from itertools import islice
+from datetime import datetime, timedelta, timezone
+
+from .behavior_store import BehaviorStore, DEFAULT_CAPACITY
+from .catalog_store import CatalogStore, ProductRecord
+from .trending import TrendingEngine
+from .market_basket import MarketBasket
+from .name_matcher import PatternMatcher
+from .user_profiles import UserProfileStore
+from .behavior_writer import SOURCE
 
 logger = logging.getLogger(__name__)
 
@@ -20,13 +30,144 @@ except ImportError:
     EXTERNAL_DATA_AVAILABLE = False
     logger.warning("External data module not available")
 
+# Fields the service reads; everything else stays on the server
+PRODUCT_FIELDS = {
+    '_id': 1, 'name': 1, 'description': 1, 'category': 1, 'price': 1,
+    'image': 1, 'tags': 1, 'stock': 1, 'unit': 1, 'unitQuantity': 1, 'updatedAt': 1
+}
+BEHAVIOR_FIELDS = {'_id': 1, 'userId': 1, 'productId': 1, 'sessionId': 1, 'action': 1, 'timestamp': 1}
+
+
+def _read_products(cursor, batch_size: int) -> List[Dict]:
+    """Fetch the next batch of products as slim dicts with string ids"""
+    return [{**doc, '_id': str(doc['_id']), '_raw_id': doc['_id']} for doc in islice(cursor, batch_size)]
+
+
+def _read_behaviors(cursor, batch_size: int, behavior_store: BehaviorStore):
+    """
+    Fetch the next batch of behaviors straight into ``behavior_store``
+
+    Returns:
+        Tuple of (number of behaviors read, largest _id in the batch)
+    """
+    docs = list(islice(cursor, batch_size))
+    if not docs:
+        return 0, None
+    behavior_store.extend(docs)
+    return len(docs), max(doc['_id'] for doc in docs)
+
+
+def _newest_own_id(collection, before):
+    """Raw bytes of the newest _id this service wrote below ``before`` (None if there is none)"""
+    doc = collection.find_one({'source': SOURCE, '_id': {'$lt': before}}, {'_id': 1}, sort=[('_id', -1)])
+    return doc['_id'].binary if doc else None
+
+
+def _build_trending(behavior_store: BehaviorStore, capacity: int) -> TrendingEngine:
+    trending = TrendingEngine(capacity=capacity)
+    trending.rebuild(
+        behavior_store.product_codes, behavior_store.action_codes, behavior_store.timestamps,
+        behavior_store.products.ids, behavior_store.actions.ids
+    )
+    return trending
+
+
+def _build_basket(behavior_store: BehaviorStore, basket: MarketBasket) -> MarketBasket:
+    basket.rebuild(
+        behavior_store.session_codes, behavior_store.product_codes, behavior_store.action_codes,
+        behavior_store.timestamps, behavior_store.actions.ids, len(behavior_store.products)
+    )
+    return basket
+
+
+def _build_profiles(behavior_store: BehaviorStore, catalog: CatalogStore, profiles: UserProfileStore) -> UserProfileStore:
+    profiles.rebuild(behavior_store, catalog)
+    return profiles
+
+
+def _read_all(cursor) -> List[Dict]:
+    return list(cursor)
+
+
+def _settled_object_id(settle_seconds: float):
+    """
+    ObjectId below which inserts are considered complete
+
+    ObjectIds are generated by the writers and only roughly ordered by time, so
+    the newest few seconds are left for the next sync instead of risking a
+    watermark that skips a document committed late.
+    """
+    from bson import ObjectId
+    return ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=settle_seconds))
+
+
+def _advance_product_watermarks(watermarks: Dict, products: List[Dict]):
+    """Move the product watermarks past ``products`` (read with ``_raw_id``)"""
+    from bson import ObjectId
+    ids = [p['_raw_id'] for p in products if isinstance(p['_raw_id'], ObjectId)]
+    updated = [p['updatedAt'] for p in products if isinstance(p.get('updatedAt'), datetime)]
+    for key, values in (('products_id', ids), ('products_updated_at', updated)):
+        if watermarks[key] is not None:
+            values.append(watermarks[key])
+        if values:
+            watermarks[key] = max(values)
+
+
 class DataLoader:
-    def __init__(self):
-        self.products = []
-        self.behaviors = []
+    def __init__(self, mongo_client=None):
+        """
+        Args:
+            mongo_client: Optional pymongo-compatible client (e.g. mongomock) used
+                instead of connecting to ``MONGODB_URI``
+        """
+        # Pattern terms indexed against catalog names, so matching a term is a lookup
+        self.name_matcher = PatternMatcher(
+            external_data.pattern_terms() + instacart_patterns.pattern_terms()
+        ) if EXTERNAL_DATA_AVAILABLE else None
+        self.catalog = CatalogStore(name_matcher=self.name_matcher)
+        # Hour -> first hour with the same time-based categories
+        by_categories = {}
+        self._dayparts = [by_categories.setdefault(tuple(self.time_categories(hour)), hour) for hour in range(24)]
+        self.behavior_store = BehaviorStore(int(os.getenv('BEHAVIOR_STORE_CAPACITY', str(DEFAULT_CAPACITY))))
+        self.trending_capacity = int(os.getenv('TRENDING_CAPACITY', '2000'))
+        self.trending = TrendingEngine(capacity=self.trending_capacity)
+        self.basket = self._new_basket()
+        self.profiles = self._new_profiles()
+        # Optional EventLog of tracked behaviors, replayed into every (re)loaded behavior store
+        self.event_log = None
+        # Optional BehaviorWriter persisting tracked behaviors to MongoDB (write-behind)
+        self.behavior_writer = None
         self.mongodb_uri = os.getenv('MONGODB_URI', '')
-        self.use_mongodb = bool(self.mongodb_uri)
+        self.mongo_client = mongo_client
+        self.use_mongodb = bool(self.mongodb_uri) or mongo_client is not None
+        self.product_batch_size = int(os.getenv('MONGO_PRODUCT_BATCH_SIZE', '1000'))
+        self.behavior_batch_size = int(os.getenv('MONGO_BEHAVIOR_BATCH_SIZE', '5000'))
+        self.sync_settle_seconds = float(os.getenv('SYNC_SETTLE_SECONDS', '2'))
+        self.deletion_scan_interval = float(os.getenv('SYNC_DELETION_SCAN_INTERVAL', '60'))
+        # Position of the last sync in each collection (set by a full load, advanced by sync_delta)
+        self.watermarks = {'products_id': None, 'products_updated_at': None, 'behaviors_id': None}
+        self.loaded_from_mongodb = False
+        self._last_deletion_scan = 0.0
+        # Resume token of the product change stream, None until it is opened;
+        # use_change_stream is cleared when the server cannot provide one
+        self.use_change_stream = os.getenv('SYNC_CHANGE_STREAM', 'true').lower() != 'false'
+        self._change_stream_token = None
+        self._sync_lock = asyncio.Lock()
         
+    def _new_profiles(self) -> UserProfileStore:
+        return UserProfileStore(
+            max_users=int(os.getenv('PROFILE_CACHE_MAX_USERS', '100000')),
+            ttl=float(os.getenv('PROFILE_CACHE_TTL', '604800')),
+            max_bytes=int(os.getenv('PROFILE_CACHE_MAX_MB', '64')) * 1024 * 1024
+        )
+    
+    def _new_basket(self) -> MarketBasket:
+        return MarketBasket(
+            top_k=int(os.getenv('BASKET_TOP_K', '50')),
+            min_pair_count=int(os.getenv('BASKET_MIN_PAIR_COUNT', '2')),
+            max_sessions=int(os.getenv('BASKET_MAX_SESSIONS', '100000'))
+        )
+    
     async def load_data(self):
         """Load data from MongoDB or sample data"""
         try:
@@ -35,41 +176,280 @@ class DataLoader:
             else:
                 self._load_sample_data()
                 
-            logger.info(f"✅ Loaded {len(self.products)} products and {len(self.behaviors)} behaviors")
+            logger.info(f"✅ Loaded {len(self.catalog)} products and {len(self.behavior_store)} behaviors")
         except Exception as e:
             logger.error(f"Error loading data: {str(e)}")
             # Fallback to sample data
             self._load_sample_data()
     
+    def _open_database(self):
+        from pymongo import MongoClient
+        client = self.mongo_client or MongoClient(self.mongodb_uri)
+        return client, client.get_default_database()
+    
+    def _close_client(self, client):
+        if self.mongo_client is None:
+            client.close()
+    
     async def _load_from_mongodb(self):
-        """Load data from MongoDB"""
+        """
+        Stream products and the full behavior history from MongoDB
+
+        Both collections are read concurrently with projected cursors. Each batch
+        is fetched and decoded on a worker thread, so the event loop only wakes
+        up between batches. The loaded data replaces the current data at the end
+        and resets the sync watermarks.
+
+        With an event log, logged behaviors the service has not written to
+        MongoDB yet are replayed on top and queued for writing again.
+        Behaviors tracked while the load runs go to the current store; they
+        are carried over to the new one when it is swapped in.
+        """
         try:
-            from pymongo import MongoClient
+            client, db = self._open_database()
+            try:
+                async with self._sync_lock:
+                    behaviors_before = _settled_object_id(self.sync_settle_seconds)
+                    # Tracked from here on: newer than the MongoDB read and past the log replay
+                    tracked_from = self.behavior_store.appended
+                    logged_through = self.event_log.position() if self.event_log is not None else None
+                    products, (behavior_store, behaviors_id) = await asyncio.gather(
+                        self._stream_products(db['products']),
+                        self._stream_behaviors(db['userbehaviors'], {'_id': {'$lt': behaviors_before}})
+                    )
+                    
+                    loop = asyncio.get_running_loop()
+                    unwritten = []
+                    if self.event_log is not None:
+                        written_through = await loop.run_in_executor(
+                            None, _newest_own_id, db['userbehaviors'], behaviors_before
+                        )
+                        _, unwritten = await loop.run_in_executor(
+                            None, self.event_log.replay, behavior_store, written_through, logged_through
+                        )
+                    trending = await loop.run_in_executor(
+                        None, _build_trending, behavior_store, self.trending_capacity
+                    )
+                    basket = await loop.run_in_executor(None, _build_basket, behavior_store, self._new_basket())
+                    catalog = CatalogStore(products, self.name_matcher)
+                    profiles = await loop.run_in_executor(
+                        None, _build_profiles, behavior_store, catalog, self._new_profiles()
+                    )
+                    
+                    # No await from here to the swap, so nothing tracked in between is missed
+                    tracked = self.behavior_store.records(
+                        self.behavior_store.latest_rows(self.behavior_store.appended - tracked_from)
+                    )
+                    self.watermarks = {'products_id': None, 'products_updated_at': None, 'behaviors_id': behaviors_id}
+                    _advance_product_watermarks(self.watermarks, products)
+                    self.catalog = catalog
+                    self.behavior_store = behavior_store
+                    self.trending = trending
+                    self.basket = basket
+                    self.profiles = profiles
+                    if tracked:
+                        behavior_store.extend(tracked)
+                        trending.add_many(tracked)
+                        self._count_baskets(tracked)
+                        for behavior in tracked:
+                            profiles.record(behavior, behavior_store, catalog)
+                    if unwritten and self.behavior_writer is not None:
+                        self.behavior_writer.submit(unwritten, force=True)
+                    self.loaded_from_mongodb = True
+                    self._last_deletion_scan = time.monotonic()
+                    self._change_stream_token = None
+            finally:
+                self._close_client(client)
             
-            client = MongoClient(self.mongodb_uri)
-            db = client.get_default_database()
-            
-            # Load products
-            products_collection = db['products']
-            self.products = list(products_collection.find())
-            
-            # Load user behaviors
-            behaviors_collection = db['userbehaviors']
-            self.behaviors = list(behaviors_collection.find().limit(10000))  # Limit for performance
-            
-            client.close()
-            logger.info(f"Loaded from MongoDB: {len(self.products)} products, {len(self.behaviors)} behaviors")
+            logger.info(f"Loaded from MongoDB: {len(self.catalog)} products, {len(self.behavior_store)} behaviors")
             
         except Exception as e:
             logger.error(f"MongoDB error: {str(e)}")
             raise
     
+    async def _stream_products(self, collection, query: Optional[Dict] = None) -> List[Dict]:
+        """Products matching ``query`` as slim dicts; ``_raw_id`` keeps the original _id"""
+        loop = asyncio.get_running_loop()
+        cursor = collection.find(query or {}, PRODUCT_FIELDS, batch_size=self.product_batch_size)
+        products = []
+        try:
+            while True:
+                batch = await loop.run_in_executor(None, _read_products, cursor, self.product_batch_size)
+                if not batch:
+                    return products
+                products.extend(batch)
+        finally:
+            cursor.close()
+    
+    async def _stream_behaviors(self, collection, query: Dict, behavior_store: Optional[BehaviorStore] = None):
+        """
+        Append behaviors matching ``query`` to ``behavior_store``, in _id order
+
+        A new store sharing the current product and action codes is used by default.
+
+        Returns:
+            Tuple of (behavior store, largest _id read or None)
+        """
+        loop = asyncio.get_running_loop()
+        cursor = collection.find(query, BEHAVIOR_FIELDS, batch_size=self.behavior_batch_size).sort('_id', 1)
+        behavior_store = self.behavior_store.empty_like() if behavior_store is None else behavior_store
+        last_id = None
+        try:
+            while True:
+                count, batch_last_id = await loop.run_in_executor(
+                    None, _read_behaviors, cursor, self.behavior_batch_size, behavior_store
+                )
+                if not count:
+                    return behavior_store, last_id
+                last_id = batch_last_id
+        finally:
+            cursor.close()
+    
+    async def sync_delta(self) -> Dict[str, List]:
+        """
+        Merge the MongoDB changes made since the last load or sync
+
+        Behaviors are read past an ``_id`` watermark. Products are read past an
+        ``_id`` watermark (inserts) and an ``updatedAt`` watermark (edits, when
+        documents carry it); unchanged re-reads are dropped. Deleted products,
+        and inserts the ``_id`` watermark cannot see (non-ObjectId ids), come
+        from a change stream on the products collection. Without one (a
+        standalone server), they are found by periodically comparing the
+        collection's ids with the loaded catalog; that scan reads every id, so
+        its interval bounds its cost. The cost of a sync therefore follows the
+        rate of change, not the size of the data.
+
+        Returns:
+            Dict with 'upserted' products, 'removed' product ids and the new
+            'behaviors', for applying to the live models
+        """
+        client, db = self._open_database()
+        try:
+            async with self._sync_lock:
+                upserted, removed = await self._sync_products(db['products'])
+                behaviors = await self._sync_behaviors(db['userbehaviors'])
+        finally:
+            self._close_client(client)
+        
+        if upserted or removed or behaviors:
+            logger.info(f"Synced from MongoDB: {len(upserted)} products changed, {len(removed)} removed, {len(behaviors)} new behaviors")
+        return {'upserted': upserted, 'removed': removed, 'behaviors': behaviors}
+    
+    async def _sync_products(self, collection):
+        loop = asyncio.get_running_loop()
+        
+        clauses = []
+        if self.watermarks['products_id'] is not None:
+            clauses.append({'_id': {'$gt': self.watermarks['products_id']}})
+        if self.watermarks['products_updated_at'] is not None:
+            # Writes can commit out of updatedAt order too, so re-read a short overlap
+            since = self.watermarks['products_updated_at'] - timedelta(seconds=self.sync_settle_seconds)
+            clauses.append({'updatedAt': {'$gte': since}})
+        changed = await self._stream_products(collection, clauses[0] if len(clauses) == 1 else {'$or': clauses}) if clauses else []
+        seen = {p['_id'] for p in changed}
+        
+        removed = []
+        missed = []
+        changes = await loop.run_in_executor(None, self._read_change_stream, collection)
+        if changes is not None:
+            for pid, (operation, raw_id) in changes.items():
+                if operation == 'delete' and pid in self.catalog:
+                    removed.append(pid)
+                elif operation == 'insert' and pid not in self.catalog and pid not in seen:
+                    missed.append(raw_id)
+        elif (self.use_change_stream and self._change_stream_token is not None) or \
+                time.monotonic() - self._last_deletion_scan >= self.deletion_scan_interval:
+            # The stream was just positioned (or is unavailable): compare every id
+            self._last_deletion_scan = time.monotonic()
+            docs = await loop.run_in_executor(None, _read_all, collection.find({}, {'_id': 1}))
+            current_ids = {str(doc['_id']): doc['_id'] for doc in docs}
+            removed = [pid for pid in self.catalog.ids() if pid not in current_ids]
+            missed = [raw_id for pid, raw_id in current_ids.items() if pid not in self.catalog and pid not in seen]
+        if missed:
+            changed.extend(await self._stream_products(collection, {'_id': {'$in': missed}}))
+        
+        _advance_product_watermarks(self.watermarks, changed)
+        for product in changed:
+            del product['_raw_id']
+        
+        changed = [p for p in changed if not self._unchanged(p)]
+        if changed:
+            self.upsert_products(changed)
+        if removed:
+            self.remove_products(removed)
+        return changed, removed
+    
+    def _read_change_stream(self, collection) -> Optional[Dict[str, tuple]]:
+        """
+        Product inserts and deletes since the previous call, from a change stream
+
+        The stream is reopened from the stored resume token on every call and
+        read until it has no more events, so no connection is held between
+        syncs.
+
+        Returns:
+            Dict of product id -> (last operation, raw _id), or None when there is
+            no stream position to read from (first call, lost history, or no
+            change stream support); the caller then scans the ids instead
+        """
+        if not self.use_change_stream:
+            return None
+        from pymongo.errors import OperationFailure, PyMongoError
+        token = self._change_stream_token
+        changes = {}
+        try:
+            pipeline = [{'$match': {'operationType': {'$in': ['insert', 'delete']}}}]
+            with collection.watch(pipeline, resume_after=token) as stream:
+                while True:
+                    change = stream.try_next()
+                    if change is None:
+                        break
+                    raw_id = change['documentKey']['_id']
+                    changes[str(raw_id)] = (change['operationType'], raw_id)
+                self._change_stream_token = stream.resume_token
+        except (TypeError, NotImplementedError, OperationFailure) as e:
+            # 40573: change streams need a replica set; other clients lack watch()
+            if not isinstance(e, OperationFailure) or e.code == 40573:
+                logger.warning(f"Product change stream unavailable, scanning ids every {self.deletion_scan_interval:g}s instead: {e}")
+                self.use_change_stream = False
+            else:
+                logger.warning(f"Product change stream lost its position, rescanning ids: {e}")
+            self._change_stream_token = None
+            return None
+        except PyMongoError as e:
+            logger.warning(f"Reading the product change stream failed, rescanning ids: {e}")
+            self._change_stream_token = None
+            return None
+        return changes if token is not None else None
+    
+    def _unchanged(self, product: Dict) -> bool:
+        current = self.catalog.get(product['_id'])
+        return current is not None and current.same_as(ProductRecord.from_dict(product))
+    
+    async def _sync_behaviors(self, collection) -> List[Dict]:
+        # Behaviors this service wrote are already in memory
+        query = {'_id': {'$lt': _settled_object_id(self.sync_settle_seconds)}, 'source': {'$ne': SOURCE}}
+        if self.watermarks['behaviors_id'] is not None:
+            query['_id']['$gt'] = self.watermarks['behaviors_id']
+        
+        start = self.behavior_store.appended
+        _, last_id = await self._stream_behaviors(collection, query, self.behavior_store)
+        if last_id is not None:
+            self.watermarks['behaviors_id'] = last_id
+        behaviors = self.behavior_store.records(self.behavior_store.latest_rows(self.behavior_store.appended - start))
+        self._compact_ids()
+        self.trending.add_many(behaviors)
+        self._count_baskets(behaviors)
+        for behavior in behaviors:
+            self.profiles.record(behavior, self.behavior_store, self.catalog)
+        return behaviors
+    
     def _load_sample_data(self):
         """Load sample grocery data for initial testing"""
         logger.info("Loading sample grocery data...")
         
         # Sample grocery products
-        self.products = [
+        self.catalog = CatalogStore([
             {'_id': '1', 'name': 'Fresh Milk', 'category': 'Dairy', 'price': 2.99, 'description': 'Fresh whole milk', 'image': 'https://images.unsplash.com/photo-1563636619-e9143da7973b?w=500'},
             {'_id': '2', 'name': 'Bread', 'category': 'Bakery', 'price': 1.99, 'description': 'Whole wheat bread', 'image': 'https://images.unsplash.com/photo-1598373182133-52452f7691ef?w=500'},
             {'_id': '3', 'name': 'Eggs', 'category': 'Dairy', 'price': 3.49, 'description': 'Free range eggs', 'image': 'https://images.unsplash.com/photo-1569246294372-ed319c674f14?w=500'},
@@ -90,10 +470,11 @@ class DataLoader:
             {'_id': '18', 'name': 'Jam', 'category': 'Spreads', 'price': 2.99, 'description': 'Strawberry jam', 'image': 'https://images.unsplash.com/photo-1570773823795-c1c5c56784d9?w=500'},
             {'_id': '19', 'name': 'Olive Oil', 'category': 'Oils', 'price': 8.99, 'description': 'Extra virgin olive oil', 'image': 'https://images.unsplash.com/photo-1474979266404-7cadd259d366?w=500'},
             {'_id': '20', 'name': 'Salt', 'category': 'Spices', 'price': 0.99, 'description': 'Sea salt', 'image': 'https://images.unsplash.com/photo-1549488344-c7388568e998?w=500'},
-        ]
+        ], self.name_matcher)
         
         # Sample user behaviors
-        self.behaviors = [
+        self.behavior_store = self.behavior_store.empty_like()
+        self.behavior_store.extend([
             {'userId': 'user1', 'productId': '1', 'action': 'purchase'},
             {'userId': 'user1', 'productId': '2', 'action': 'purchase'},
             {'userId': 'user1', 'productId': '4', 'action': 'view'},
@@ -103,81 +484,133 @@ class DataLoader:
             {'userId': 'user3', 'productId': '4', 'action': 'purchase'},
             {'userId': 'user3', 'productId': '5', 'action': 'purchase'},
             {'userId': 'user3', 'productId': '1', 'action': 'view'},
-        ]
+        ])
+        if self.event_log is not None:
+            self.event_log.replay(self.behavior_store)
         
-        logger.info(f"Loaded {len(self.products)} sample products")
+        self.trending = _build_trending(self.behavior_store, self.trending_capacity)
+        self.basket = _build_basket(self.behavior_store, self._new_basket())
+        self.profiles = _build_profiles(self.behavior_store, self.catalog, self._new_profiles())
+        
+        logger.info(f"Loaded {len(self.catalog)} sample products")
     
     def has_data(self) -> bool:
         """Check if data is loaded"""
-        return len(self.products) > 0
+        return len(self.catalog) > 0
     
     def get_product_data(self) -> List[Dict]:
         """Get product data for content-based filtering"""
-        return self.products
+        return self.catalog.to_dicts()
     
-    def get_interaction_data(self) -> List[Dict]:
-        """Get user-product interaction data for collaborative filtering"""
-        return self.behaviors
+    def get_interaction_data(self) -> Dict:
+        """Get user-product interaction arrays (copied interned codes) for collaborative filtering"""
+        return self.behavior_store.interaction_arrays()
     
-    def get_trending_products(self, limit: int = 10) -> List[Dict]:
-        """Get trending products based on recent behaviors"""
-        if not self.behaviors:
+    def get_trending_products(self, limit: int = 10, window: str = '24h') -> List[Dict]:
+        """
+        Get trending products: action-weighted, time-decayed activity within ``window``
+
+        Raises:
+            KeyError: Unknown window (see ``trending.windows``)
+        """
+        top = self.trending.top(window, limit)
+        if not top:
             # Return first N products if no behavior data
             return [
-                {
-                    'product_id': p['_id'],
-                    'name': p.get('name'),
-                    'category': p.get('category'),
-                    'price': p.get('price'),
-                    'image': p.get('image'),
-                    'rank': idx + 1
-                }
-                for idx, p in enumerate(self.products[:limit])
+                {**record.summary(), 'rank': idx + 1}
+                for idx, record in enumerate(self.catalog.head(limit))
             ]
         
-        # Count product occurrences in behaviors
-        from collections import Counter
-        product_counts = Counter([b['productId'] for b in self.behaviors])
-        most_common = product_counts.most_common(limit)
-        
-        # Get product details for trending items
-        product_map = {p['_id']: p for p in self.products}
-        
-        trending = []
-        for idx, (product_id, count) in enumerate(most_common):
-            product = product_map.get(product_id, {})
-            trending.append({
-                'product_id': str(product_id),
-                'name': product.get('name'),
-                'category': product.get('category'),
-                'price': product.get('price'),
-                'image': product.get('image'),
-                'interaction_count': count,
-                'rank': idx + 1
-            })
-        
-        return trending
+        trending = [
+            {'product_id': item['product_id'], 'name': None, 'category': None, 'price': None, 'image': None,
+             'score': item['score'], 'interaction_count': item['interaction_count'], 'rank': idx + 1}
+            for idx, item in enumerate(top)
+        ]
+        return self.catalog.enrich(trending)
     
     def get_product_by_id(self, product_id: str) -> Optional[Dict]:
         """Get a single product by ID"""
-        for product in self.products:
-            if str(product['_id']) == str(product_id):
-                return product
-        return None
-    
-    async def sync_from_mongodb(self):
-        """Reload data from MongoDB (for periodic updates)"""
-        if self.use_mongodb:
+        record = self.catalog.get(product_id)
+        return record.to_dict() if record else None
+    
+    def upsert_products(self, products: List[Dict]):
+        """Insert new catalog products or replace existing ones (matched by _id)"""
+        self.catalog.upsert(products)
+    
+    def remove_products(self, product_ids: List[str]):
+        """Remove catalog products by ID"""
+        self.catalog.remove(product_ids)
+    
+    async def sync_from_mongodb(self, full: bool = False) -> Dict[str, List]:
+        """
+        Bring the loaded data up to date with MongoDB (for periodic updates)
+
+        Args:
+            full: Reload everything instead of syncing the changes since the last sync
+
+        Returns:
+            The merged changes (see ``sync_delta``); empty after a full reload
+        """
+        if not self.use_mongodb:
+            logger.warning("MongoDB not configured, keeping the loaded data")
+        elif full or not self.loaded_from_mongodb:
             await self._load_from_mongodb()
         else:
-            logger.warning("MongoDB not configured, using sample data")
+            return await self.sync_delta()
+        return {'upserted': [], 'removed': [], 'behaviors': []}
     
     def add_behavior(self, behavior: Dict):
         """Add a new behavior record in real-time"""
-        self.behaviors.append(behavior)
-        # Keep behaviors list manageable
-        if len(self.behaviors) > 15000:
-            self.behaviors = self.behaviors[-10000:]
+        self.add_behaviors([behavior])
+    
+    def add_behaviors(self, behaviors: List[Dict]) -> List[Dict]:
+        """
+        Add a batch of tracked behaviors in one pass
+
+        The batch is appended to the behavior store and the event log at once,
+        then counted into trending and the cached user profiles and queued
+        for MongoDB.
+
+        Returns:
+            The behaviors as added (timestamped now where they had no timestamp)
+
+        Raises:
+            WriteQueueFull: The MongoDB write-behind queue is full; nothing was added
+        """
+        now = time.time()
+        if self.behavior_writer is not None:
+            self.behavior_writer.ensure_room(len(behaviors))
+            from bson import ObjectId
+            # The id is logged with the event, so a restart knows whether it reached MongoDB
+            behaviors = [
+                {**b, 'timestamp': b['timestamp'] if b.get('timestamp') is not None else now, '_id': ObjectId()}
+                for b in behaviors
+            ]
+        else:
+            behaviors = [b if b.get('timestamp') is not None else {**b, 'timestamp': now} for b in behaviors]
+        self.behavior_store.extend(behaviors)
+        self._compact_ids()
+        if self.event_log is not None:
+            self.event_log.append_many(behaviors)
+        if self.behavior_writer is not None:
+            self.behavior_writer.submit(behaviors, force=True)
+        self.trending.add_many(behaviors)
+        self._count_baskets(behaviors)
+        for behavior in behaviors:
+            self.profiles.record(behavior, self.behavior_store, self.catalog)
+        return behaviors
+    
+    def _compact_ids(self):
+        """Drop user and session ids that left the wrapped behavior buffer, keeping open baskets' sessions"""
+        if self.behavior_store.needs_compaction():
+            self.basket.remap_sessions(self.behavior_store.compact_ids(keep_sessions=self.basket.open_sessions()))
+    
+    def _count_baskets(self, behaviors: List[Dict]):
+        """Add the basket events among ``behaviors`` (already in the behavior store) to the basket engine"""
+        sessions, products = self.behavior_store.sessions, self.behavior_store.products
+        for behavior in behaviors:
+            if behavior.get('action') in self.basket.actions:
+                self.basket.add(sessions.lookup(behavior.get('sessionId')), products.lookup(behavior.get('productId')))
     
     def get_cold_start_recommendations(self, category: Optional[str] = None, limit: int = 10) -> List[Dict]:
         """
@@ -192,107 +625,105 @@ class DataLoader:
             matched_products = []
             for rec in pattern_recs:
                 product_name = rec.get('product_name', '').lower()
-                for product in self.products:
-                    if product_name in product.get('name', '').lower():
-                        matched_products.append({
-                            'product_id': str(product.get('_id', product.get('id', ''))),
-                            'name': product.get('name'),
-                            'category': product.get('category'),
-                            'price': product.get('price'),
-                            'image': product.get('image'),
-                            'confidence': rec.get('confidence', 0.5),
-                            'source': 'cold_start'
-                        })
-                        break
+                if not product_name:
+                    # Category affinities name no product
+                    continue
+                product = next(self.catalog.named(product_name), None)
+                if product is not None:
+                    matched_products.append({
+                        **product.summary(),
+                        'confidence': rec.get('confidence', 0.5),
+                        'source': 'cold_start'
+                    })
             
             if matched_products:
                 return matched_products[:limit]
         
         # Fallback: return category-filtered or top products
-        if category:
-            category_products = [
-                p for p in self.products 
-                if category.lower() in p.get('category', '').lower()
-            ]
-            products_to_return = category_products[:limit] if category_products else self.products[:limit]
-        else:
-            products_to_return = self.products[:limit]
+        products_to_return = self.catalog.matching_category(category, limit) if category else []
+        if not products_to_return:
+            products_to_return = self.catalog.head(limit)
         
-        return [
-            {
-                'product_id': str(p.get('_id', p.get('id', ''))),
-                'name': p.get('name'),
-                'category': p.get('category'),
-                'price': p.get('price'),
-                'image': p.get('image'),
-                'source': 'default'
-            }
-            for p in products_to_return
-        ]
+        return [{**p.summary(), 'source': 'default'} for p in products_to_return]
     
     def get_frequently_bought_together(self, product_id: str, limit: int = 5) -> List[Dict]:
         """
         Get products frequently bought together with given product
-        Uses external patterns if available
+        Mined from our own session baskets first, then external patterns if available
         """
-        product = self.get_product_by_id(product_id)
+        product = self.catalog.get(product_id)
         if not product:
             return []
         
-        product_name = product.get('name', '')
+        product_name = product.name or ''
         related = []
         
-        if EXTERNAL_DATA_AVAILABLE:
+        product_ids = self.behavior_store.products.ids
+        for item in self.basket.related(self.behavior_store.products.lookup(product.id), limit):
+            partner = self.catalog.get(product_ids[item['product_code']])
+            if partner is None:
+                continue
+            related.append({
+                **partner.summary(),
+                'confidence': item['confidence'],
+                'support': item['support'],
+                'lift': item['lift'],
+                'co_occurrences': item['co_occurrences'],
+                'type': 'frequently_bought_together'
+            })
+        
+        if EXTERNAL_DATA_AVAILABLE and len(related) < limit:
             # Get co-purchase suggestions from external patterns
             suggestions = instacart_patterns.get_co_purchase_suggestions(product_name)
             
             # Match suggestions to actual products
+            seen = {r['product_id'] for r in related}
             for suggestion in suggestions:
                 suggestion_name = suggestion.get('suggestion', '').lower()
-                for p in self.products:
-                    if suggestion_name in p.get('name', '').lower() and str(p.get('_id')) != product_id:
+                for p in self.catalog.named(suggestion_name):
+                    if p.id != product.id and p.id not in seen:
                         related.append({
-                            'product_id': str(p.get('_id', p.get('id', ''))),
-                            'name': p.get('name'),
-                            'category': p.get('category'),
-                            'price': p.get('price'),
-                            'image': p.get('image'),
+                            **p.summary(),
                             'confidence': suggestion.get('confidence', 0.5),
                             'type': 'frequently_bought_together'
                         })
+                        seen.add(p.id)
                         break
         
         # Fallback: same category products
         if len(related) < limit:
-            product_category = product.get('category', '')
-            for p in self.products:
-                if (p.get('category', '') == product_category and 
-                    str(p.get('_id')) != product_id and
-                    str(p.get('_id')) not in [r['product_id'] for r in related]):
-                    related.append({
-                        'product_id': str(p.get('_id', p.get('id', ''))),
-                        'name': p.get('name'),
-                        'category': p.get('category'),
-                        'price': p.get('price'),
-                        'image': p.get('image'),
-                        'type': 'same_category'
-                    })
+            seen = {r['product_id'] for r in related}
+            for p in self.catalog.in_category(product.category or ''):
+                if p.id != product.id and p.id not in seen:
+                    related.append({**p.summary(), 'type': 'same_category'})
                     if len(related) >= limit:
                         break
         
         return related[:limit]
     
-    def get_time_based_recommendations(self, limit: int = 10) -> List[Dict]:
+    def get_time_based_recommendations(self, limit: int = 10, hour: Optional[int] = None) -> List[Dict]:
         """
-        Get recommendations based on current time of day
+        Get recommendations based on time of day (the current hour by default)
         """
-        recommended_categories = []
+        recommended_categories = self.time_categories(hour)
+        
+        # Filter products by recommended categories
+        recommended = []
+        for category in recommended_categories:
+            for p in self.catalog.matching_category(category, limit - len(recommended)):
+                recommended.append({**p.summary(), 'source': 'time_based'})
+            if len(recommended) >= limit:
+                return recommended
         
+        return recommended[:limit]
+    
+    def time_categories(self, hour: Optional[int] = None) -> List[str]:
+        """Categories recommended at ``hour`` (the current hour by default)"""
         if EXTERNAL_DATA_AVAILABLE:
-            recommended_categories = external_data.get_time_based_recommendations()
+            recommended_categories = external_data.get_time_based_recommendations(hour)
         else:
-            from datetime import datetime
-            hour = datetime.now().hour
+            if hour is None:
+                hour = datetime.now().hour
             if 6 <= hour < 11:
                 recommended_categories = ['dairy', 'bakery', 'breakfast']
             elif 11 <= hour < 14:
@@ -301,59 +732,33 @@ class DataLoader:
                 recommended_categories = ['snacks', 'beverages']
             else:
                 recommended_categories = ['meat', 'vegetables', 'grains']
-        
-        # Filter products by recommended categories
-        recommended = []
-        for category in recommended_categories:
-            for p in self.products:
-                if category.lower() in p.get('category', '').lower():
-                    recommended.append({
-                        'product_id': str(p.get('_id', p.get('id', ''))),
-                        'name': p.get('name'),
-                        'category': p.get('category'),
-                        'price': p.get('price'),
-                        'image': p.get('image'),
-                        'source': 'time_based'
-                    })
-                    if len(recommended) >= limit:
-                        return recommended
-        
-        return recommended[:limit]
+        return recommended_categories
+    
+    def daypart(self, hour: Optional[int] = None) -> int:
+        """
+        First hour of the daypart containing ``hour`` (the current hour by default)
+
+        Hours with the same recommended categories share a daypart, and so the
+        same time-based recommendations.
+        """
+        return self._dayparts[datetime.now().hour if hour is None else hour]
+    
+    def cold_start_categories(self) -> List[str]:
+        """Category arguments worth materializing for cold start: none, and every known category"""
+        categories = [''] + [str(category).lower() for category in self.catalog.categories() if category]
+        if EXTERNAL_DATA_AVAILABLE:
+            categories += [pattern['category'] for pattern in external_data.grocery_patterns]
+            categories += list(external_data.category_affinities)
+        return list(dict.fromkeys(categories))
+    
+    def get_user_behaviors(self, user_id: str) -> List[Dict]:
+        """Get all loaded and tracked behaviors for a single user"""
+        return self.behavior_store.user_records(user_id)
     
     def get_user_behavior_summary(self, user_id: str) -> Dict:
         """
         Get summary of a user's behavior for personalization
-        """
-        user_behaviors = [b for b in self.behaviors if str(b.get('userId')) == str(user_id)]
-        
-        if not user_behaviors:
-            return {'has_history': False, 'total_interactions': 0}
-        
-        # Count by action type
-        action_counts = {}
-        category_interests = {}
-        product_ids = []
-        
-        for behavior in user_behaviors:
-            action = behavior.get('action', 'view')
-            action_counts[action] = action_counts.get(action, 0) + 1
-            
-            product_id = behavior.get('productId')
-            if product_id:
-                product_ids.append(product_id)
-                product = self.get_product_by_id(product_id)
-                if product:
-                    cat = product.get('category', 'other')
-                    category_interests[cat] = category_interests.get(cat, 0) + 1
-        
-        # Sort categories by interest
-        top_categories = sorted(category_interests.items(), key=lambda x: x[1], reverse=True)[:5]
-        
-        return {
-            'has_history': True,
-            'total_interactions': len(user_behaviors),
-            'action_counts': action_counts,
-            'top_categories': [c[0] for c in top_categories],
-            'unique_products_viewed': len(set(product_ids))
-        }
 
+        Served from the per-user profile cache, which tracked events keep up to date
+        """
+        return self.profiles.summary(user_id)
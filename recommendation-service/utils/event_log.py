@@ -0,0 +1,442 @@
+"""
+Event Log
+Segmented append-only binary log of tracked behaviors, replayed on startup
+"""
+
+import os
+import time
+import struct
+import zlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Segment header: magic and format version
+SEGMENT_MAGIC = b'EVLG'
+FORMAT_VERSION = 2
+_SEGMENT_HEADER = struct.Struct('<4sH')
+# Record frame: payload length and CRC32, then the payload
+_FRAME = struct.Struct('<II')
+# Payload: timestamp, byte lengths of user, product, session and action (0xFFFF = None)
+# and of the event id (0 or 12), followed by those values
+_EVENT = struct.Struct('<dHHHHB')
+_NONE = 0xFFFF
+_FIELDS = ('userId', 'productId', 'sessionId', 'action')
+
+
+def encode_event(behavior: Dict) -> bytes:
+    """One framed log record for a behavior dict"""
+    values = []
+    lengths = []
+    for field in _FIELDS:
+        value = behavior.get(field)
+        if value is None:
+            lengths.append(_NONE)
+            continue
+        data = str(value).encode('utf-8')[:_NONE - 1]
+        values.append(data)
+        lengths.append(len(data))
+    # ObjectId assigned for the MongoDB write-behind, if any
+    event_id = getattr(behavior.get('_id'), 'binary', None) or b''
+    values.append(event_id)
+    timestamp = behavior.get('timestamp')
+    payload = (_EVENT.pack(float('nan') if timestamp is None else float(timestamp), *lengths, len(event_id))
+               + b''.join(values))
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_segment(data: bytes):
+    """
+    Decode the records of one segment's bytes into parallel columns
+
+    Decoding stops at the first torn or corrupt record (a write cut short by
+    a crash), so everything before it is kept.
+
+    Returns:
+        (users, products, sessions, actions, event ids, timestamps, valid_bytes);
+        event ids are 12-byte ObjectIds or None
+    """
+    magic, version = _SEGMENT_HEADER.unpack_from(data) if len(data) >= _SEGMENT_HEADER.size else (None, None)
+    if magic != SEGMENT_MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Not an event log segment (or an unsupported format version)")
+
+    columns = ([], [], [], [])
+    event_ids = []
+    timestamps = []
+    # Decoding strings once per distinct value keeps replay fast
+    cache = {}
+    view = memoryview(data)
+    offset = _SEGMENT_HEADER.size
+    end = len(data)
+    frame_size, event_size = _FRAME.size, _EVENT.size
+    while offset + frame_size <= end:
+        length, crc = _FRAME.unpack_from(data, offset)
+        start = offset + frame_size
+        if start + length > end or zlib.crc32(view[start:start + length]) != crc:
+            break
+        timestamp, *lengths = _EVENT.unpack_from(data, start)
+        position = start + event_size
+        for column, size in zip(columns, lengths[:4]):
+            if size == _NONE:
+                column.append(None)
+                continue
+            raw = data[position:position + size]
+            value = cache.get(raw)
+            if value is None:
+                value = cache[raw] = raw.decode('utf-8')
+            column.append(value)
+            position += size
+        id_size = lengths[4]
+        event_ids.append(data[position:position + id_size] if id_size else None)
+        timestamps.append(timestamp)
+        offset = start + length
+    return (*columns, event_ids, np.array(timestamps, dtype=np.float64), offset)
+
+
+class EventLog:
+    """
+    Durable local log of tracked behaviors
+
+    ``append`` only encodes the event into an in-memory buffer; a background
+    thread writes the buffer and fsyncs once per ``fsync_interval`` (group
+    commit), so tracking never waits on the disk and a crash loses at most
+    that interval. The log is a directory of numbered segments; a segment is
+    closed once it reaches ``segment_bytes``, and closed segments older than
+    ``retention`` seconds are deleted by compaction.
+
+    Several worker processes can share one ``directory``: on first use each
+    process locks a ``worker-N`` subdirectory no live process holds and only
+    writes, replays and compacts the segments in it. The lock is released
+    when the process exits, so a restarted worker takes over (and replays)
+    a directory whose owner is gone.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 fsync_interval: float = 0.05, retention: float = 7 * 86400):
+        """
+        Args:
+            directory: Directory holding the workers' segment directories (created if missing)
+            segment_bytes: Size at which the active segment is closed
+            fsync_interval: Seconds between group commits
+            retention: Seconds a closed segment is kept after its last write
+        """
+        self.root = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.retention = retention
+        os.makedirs(directory, exist_ok=True)
+
+        self._buffer = bytearray()
+        self._buffer_lock = threading.Lock()
+        # Held while writing to or reading the segment files
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._file = None
+        self._segment = None
+        # Lock file of the claimed worker directory (see _claim)
+        self._owner = None
+        self._directory = None
+        self._claim_lock = threading.Lock()
+        self.stats = {
+            'events_appended': 0,
+            'events_replayed': 0,
+            'commits': 0,
+            'last_commit_events': 0,
+            'last_commit_ms': 0.0,
+            'write_errors': 0,
+            'segments_compacted': 0,
+            'torn_records': 0
+        }
+        self._pending_events = 0
+        # Events this process has committed to its segments
+        self._committed_events = 0
+
+    @property
+    def directory(self) -> str:
+        """This process's segment directory, claimed on first use"""
+        if self._directory is None:
+            self._claim()
+        return self._directory
+
+    def _claim(self):
+        with self._claim_lock:
+            if self._directory is not None:
+                return
+            slot = 0
+            while self._directory is None:
+                directory = os.path.join(self.root, f"worker-{slot}")
+                os.makedirs(directory, exist_ok=True)
+                owner = open(os.path.join(directory, 'owner.lock'), 'a+b')
+                if _try_lock(owner):
+                    self._owner = owner
+                    self._directory = directory
+                    logger.info(f"Event log using {directory}")
+                else:
+                    owner.close()
+                    slot += 1
+            self._adopt_unowned_segments()
+
+    def _adopt_unowned_segments(self):
+        # Segments written directly under the root (single-directory layout) continue in this one
+        if any(name.startswith('segment-') for name in os.listdir(self._directory)):
+            return
+        for name in sorted(os.listdir(self.root)):
+            if name.startswith('segment-') and name.endswith('.log'):
+                try:
+                    os.rename(os.path.join(self.root, name), os.path.join(self._directory, name))
+                except FileNotFoundError:
+                    # Adopted by another worker
+                    pass
+
+    def segments(self) -> List[str]:
+        """This process's segment file paths, oldest first"""
+        names = sorted(name for name in os.listdir(self.directory) if name.startswith('segment-') and name.endswith('.log'))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def append(self, behavior: Dict):
+        """Queue a behavior for the next group commit"""
+        self.append_many([behavior])
+
+    def append_many(self, behaviors: List[Dict]):
+        """Queue a batch of behaviors for the next group commit"""
+        records = b''.join(encode_event(behavior) for behavior in behaviors)
+        with self._buffer_lock:
+            self._buffer += records
+            self._pending_events += len(behaviors)
+            self.stats['events_appended'] += len(behaviors)
+
+    def start(self):
+        """Start the group-commit thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='event-log-writer', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Commit what is buffered and stop the writer"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        with self._claim_lock:
+            if self._owner is not None:
+                # Closing the lock file releases the worker directory
+                self._owner.close()
+                self._owner = None
+
+    def _run(self):
+        last_compaction = time.monotonic()
+        while not self._stopped.is_set():
+            self._wake.wait(self.fsync_interval)
+            try:
+                self.flush()
+                if time.monotonic() - last_compaction > 60:
+                    self.compact()
+                    last_compaction = time.monotonic()
+            except Exception as e:
+                logger.error(f"Event log write failed: {str(e)}")
+
+    def flush(self):
+        """Write and fsync everything appended so far (one group commit)"""
+        with self._io_lock:
+            with self._buffer_lock:
+                data, self._buffer = self._buffer, bytearray()
+                events, self._pending_events = self._pending_events, 0
+            if not data:
+                return
+            start = time.perf_counter()
+            try:
+                segment = self._active_segment()
+                segment.write(data)
+                segment.flush()
+                os.fsync(segment.fileno())
+            except Exception:
+                # A partial write may have left a torn record; retry in a fresh segment
+                self._abandon_segment()
+                # Keep the events for the next commit; they go before anything appended since
+                with self._buffer_lock:
+                    self._buffer[:0] = data
+                    self._pending_events += events
+                self.stats['write_errors'] += 1
+                raise
+            self._committed_events += events
+            self.stats['commits'] += 1
+            self.stats['last_commit_events'] = events
+            self.stats['last_commit_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            if segment.tell() >= self.segment_bytes:
+                segment.close()
+                self._file = None
+
+    def _active_segment(self):
+        if self._file is None:
+            existing = self.segments()
+            index = int(os.path.basename(existing[-1])[8:-4]) + 1 if existing else 0
+            while True:
+                self._segment = os.path.join(self.directory, f"segment-{index:010d}.log")
+                try:
+                    # Never reuse a segment, even if something else wrote one
+                    self._file = open(self._segment, 'xb')
+                    break
+                except FileExistsError:
+                    index += 1
+            self._file.write(_SEGMENT_HEADER.pack(SEGMENT_MAGIC, FORMAT_VERSION))
+            self._fsync_directory()
+        return self._file
+
+    def _abandon_segment(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _fsync_directory(self):
+        # Makes a new segment's directory entry durable (not supported on every platform)
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def position(self) -> int:
+        """Number of events appended so far, for ``replay(..., through=...)``"""
+        return self.stats['events_appended']
+
+    def replay(self, behavior_store, written_through: Optional[bytes] = None,
+               through: Optional[int] = None) -> Tuple[int, List[Dict]]:
+        """
+        Append logged events to ``behavior_store``, oldest first
+
+        Buffered events are committed first, so the replay includes every
+        event appended before the call.
+
+        Args:
+            written_through: Newest event id (12-byte ObjectId) already loaded
+                from MongoDB; events with an id up to it are skipped. Events
+                are written to MongoDB in log order, so the rest were not.
+            through: A ``position()``; events appended after it are not
+                replayed (the caller picks them up elsewhere)
+
+        Returns:
+            Tuple of (events replayed, the replayed events that have an id,
+            as behavior dicts, for writing to MongoDB)
+        """
+        start = time.perf_counter()
+        self.flush()
+        replayed = 0
+        unwritten = []
+        segments = []
+        with self._io_lock:
+            # Committed events are the log's newest, so events appended after ``through`` end the log
+            skip = max(0, self._committed_events - through) if through is not None else 0
+            for path in self.segments():
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    users, products, sessions, actions, event_ids, timestamps, valid_bytes = decode_segment(data)
+                except Exception as e:
+                    logger.error(f"Skipping unreadable event log segment {path}: {str(e)}")
+                    continue
+                if valid_bytes < len(data):
+                    self.stats['torn_records'] += 1
+                    logger.warning(f"Event log segment {os.path.basename(path)} ends in a torn record "
+                                   f"({len(data) - valid_bytes} bytes ignored)")
+                segments.append([users, products, sessions, actions, event_ids, timestamps])
+        while skip and segments:
+            columns = segments[-1]
+            n = len(columns[5])
+            if n <= skip:
+                segments.pop()
+            else:
+                segments[-1] = [column[:n - skip] for column in columns]
+            skip -= min(n, skip)
+
+        for users, products, sessions, actions, event_ids, timestamps in segments:
+            if written_through is not None:
+                keep = [i for i, event_id in enumerate(event_ids) if event_id is None or event_id > written_through]
+                if len(keep) < len(event_ids):
+                    users, products, sessions, actions, event_ids = (
+                        [column[i] for i in keep] for column in (users, products, sessions, actions, event_ids)
+                    )
+                    timestamps = timestamps[keep]
+            if not len(timestamps):
+                continue
+            behavior_store.append_columns(users, products, sessions, actions, timestamps)
+            replayed += len(timestamps)
+            unwritten.extend(
+                {'_id': event_id, 'userId': users[i], 'productId': products[i], 'sessionId': sessions[i],
+                 'action': actions[i], 'timestamp': None if np.isnan(timestamps[i]) else float(timestamps[i])}
+                for i, event_id in enumerate(event_ids) if event_id is not None
+            )
+        self.stats['events_replayed'] += replayed
+        if replayed:
+            logger.info(f"✅ Replayed {replayed} logged behaviors in {time.perf_counter() - start:.2f}s")
+        return replayed, unwritten
+
+    def compact(self) -> int:
+        """
+        Delete closed segments not written to within ``retention`` seconds
+
+        Returns:
+            Number of segments deleted
+        """
+        cutoff = time.time() - self.retention
+        removed = 0
+        with self._io_lock:
+            for path in self.segments():
+                if path == self._segment and self._file is not None:
+                    continue
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+        if removed:
+            self.stats['segments_compacted'] += removed
+            logger.info(f"Compacted {removed} expired event log segments")
+        return removed
+
+    def status(self) -> Dict:
+        segments = self.segments()
+        return {
+            **self.stats,
+            'directory': self.directory,
+            'segments': len(segments),
+            'bytes_on_disk': sum(os.path.getsize(path) for path in segments),
+            'buffered_events': self._pending_events
+        }
+
+
+def _try_lock(file) -> bool:
+    """Take a non-blocking exclusive lock on ``file``, held until it is closed"""
+    try:
+        import fcntl
+    except ImportError:
+        # Windows
+        import msvcrt
+        file.seek(0)
+        try:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,234 @@
+"""
+External Data Client
+Pooled HTTP client for external data APIs with a memory and disk cache
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExternalDataClient:
+    """
+    Fetches JSON from external APIs through one shared connection pool
+
+    Responses are cached in memory (LRU, ``max_entries``) and as files under
+    ``cache_dir``, so they survive restarts. A response younger than ``ttl``
+    is served as is. An older one is still served (up to ``max_stale``) while
+    a background fetch revalidates it (stale-while-revalidate), so only the
+    very first request for a URL ever waits on the network; ``run`` keeps a
+    set of URLs fresh ahead of time so not even that one does.
+
+    Concurrent requests for the same URL share a single fetch.
+    """
+
+    def __init__(self, cache_dir, ttl: float = 86400, max_stale: float = 7 * 86400,
+                 max_entries: int = 256, max_connections: int = 10, timeout: float = 5.0,
+                 retry_interval: float = 60.0):
+        """
+        Args:
+            cache_dir: Directory of the on-disk cache (created if missing)
+            ttl: Seconds a response is fresh
+            max_stale: Seconds past ``ttl`` a response may still be served while revalidating
+            max_entries: Responses kept in memory
+            max_connections: Size of the connection pool
+            timeout: Seconds a fetch may take
+            retry_interval: Seconds before a failed URL is fetched again
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        # URL -> (data, fetched_at epoch seconds), least recently used first
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._failed_at = {}
+        self._session = None
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'stale_served': 0,
+            'misses': 0,
+            'fetches': 0,
+            'shared_fetches': 0,
+            'fetch_errors': 0,
+            'last_fetch_ms': 0.0,
+            'last_error': None
+        }
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp  # Only needed when an external API is configured
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def get_json(self, url: str) -> Optional[Any]:
+        """
+        The JSON response of ``url``, from cache when possible
+
+        Returns:
+            The decoded JSON, or None when the URL cannot be fetched and nothing
+            usable is cached
+        """
+        entry = self._memory.get(url)
+        if entry is not None:
+            self._memory.move_to_end(url)
+            self.stats['memory_hits'] += 1
+        else:
+            entry = await asyncio.get_running_loop().run_in_executor(None, self._read_disk, url)
+            if entry is not None:
+                self.stats['disk_hits'] += 1
+                self._remember(url, entry)
+
+        if entry is not None:
+            data, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                return data
+            if age < self.ttl + self.max_stale:
+                self.stats['stale_served'] += 1
+                self.revalidate(url)
+                return data
+
+        self.stats['misses'] += 1
+        if self._recently_failed(url):
+            return None
+        try:
+            return await self._fetch_shared(url)
+        except Exception as e:
+            logger.warning(f"External API unavailable: {e}")
+            return None
+
+    def fetched_at(self, url: str) -> Optional[float]:
+        """When the response of ``url`` held in memory was fetched (None if there is none)"""
+        entry = self._memory.get(url)
+        return entry[1] if entry is not None else None
+
+    def revalidate(self, url: str):
+        """Refresh ``url`` in the background unless a fetch is already running or recently failed"""
+        if url in self._inflight or self._recently_failed(url):
+            return
+        task = self._fetch_shared(url)
+        task.add_done_callback(_log_failure)
+
+    def _fetch_shared(self, url: str) -> asyncio.Future:
+        """The running fetch of ``url``, or a new one; callers awaiting it share the result"""
+        task = self._inflight.get(url)
+        if task is not None:
+            self.stats['shared_fetches'] += 1
+        else:
+            task = self._inflight[url] = asyncio.ensure_future(self._fetch(url))
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        # A cancelled caller must not cancel the fetch other callers are waiting on
+        return asyncio.shield(task)
+
+    async def _fetch(self, url: str) -> Any:
+        start = time.perf_counter()
+        self.stats['fetches'] += 1
+        try:
+            async with self._get_session().get(url) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        except Exception as e:
+            self._failed_at[url] = time.monotonic()
+            self.stats['fetch_errors'] += 1
+            self.stats['last_error'] = str(e)
+            raise
+        self._failed_at.pop(url, None)
+        self.stats['last_fetch_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        entry = (data, time.time())
+        self._remember(url, entry)
+        await asyncio.get_running_loop().run_in_executor(None, self._write_disk, url, entry)
+        return data
+
+    def _recently_failed(self, url: str) -> bool:
+        failed_at = self._failed_at.get(url)
+        return failed_at is not None and time.monotonic() - failed_at < self.retry_interval
+
+    def _remember(self, url: str, entry):
+        self._memory[url] = entry
+        self._memory.move_to_end(url)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    def _read_disk(self, url: str):
+        try:
+            with open(self._path(url), 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            return cached['data'], float(cached['fetched_at'])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable external data cache for {url}: {e}")
+            return None
+
+    def _write_disk(self, url: str, entry):
+        data, fetched_at = entry
+        path = self._path(url)
+        temporary = path.with_suffix('.tmp')
+        try:
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump({'url': url, 'fetched_at': fetched_at, 'data': data}, f)
+            # Readers see the old file or the new one, never a partial write
+            os.replace(temporary, path)
+        except Exception as e:
+            logger.warning(f"Could not cache external data for {url}: {e}")
+
+    async def run(self, urls: Iterable[str], interval: float = 60.0):
+        """
+        Keep ``urls`` fresh: fetch each before its cached response expires
+
+        Started as a background task; request paths then only read the cache.
+        """
+        urls = list(urls)
+        while True:
+            for url in urls:
+                entry = self._memory.get(url)
+                if entry is None:
+                    entry = await asyncio.get_running_loop().run_in_executor(None, self._read_disk, url)
+                    if entry is not None:
+                        self._remember(url, entry)
+                # Refresh once most of the TTL has passed, so readers never see it expire
+                if entry is None or time.time() - entry[1] > 0.8 * self.ttl:
+                    self.revalidate(url)
+            await asyncio.sleep(min(interval, self.ttl / 10))
+
+    async def close(self):
+        """Cancel running fetches and release the connection pool"""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def metrics(self) -> Dict:
+        return {
+            **self.stats,
+            'memory_entries': len(self._memory),
+            'inflight': len(self._inflight),
+            'ttl_seconds': self.ttl,
+            'max_connections': self.max_connections
+        }
+
+
+def _log_failure(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"External data refresh failed: {task.exception()}")
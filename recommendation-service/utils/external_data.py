@@ -4,15 +4,18 @@ Hooks into public e-commerce datasets via APIs for cold-start recommendations
 No data downloading - uses API calls to fetch patterns on-demand
 """
 
+import os
 import logging
 import json
 import hashlib
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
-import aiohttp
 import asyncio
 from pathlib import Path
 
+from .name_matcher import PatternMatcher
+from .external_client import ExternalDataClient
+
 logger = logging.getLogger(__name__)
 
 class ExternalDataHook:
@@ -25,10 +28,18 @@ class ExternalDataHook:
         self.cache_dir = Path(__file__).parent.parent / 'data' / 'cache'
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.cache_ttl = timedelta(hours=24)  # Cache data for 24 hours
+        # Shared connection pool; responses are cached in memory and under cache_dir
+        self.client = ExternalDataClient(
+            self.cache_dir,
+            ttl=self.cache_ttl.total_seconds(),
+            max_connections=int(os.getenv('EXTERNAL_MAX_CONNECTIONS', '10'))
+        )
         
         # Pre-defined grocery shopping patterns based on common market basket analysis
         # These patterns are derived from publicly available research on grocery shopping
         self.grocery_patterns = self._get_grocery_patterns()
+        # Finds every pattern item in a product name in one pass
+        self.matcher = PatternMatcher(self.pattern_terms())
         
         # Category affinities based on public e-commerce research
         self.category_affinities = self._get_category_affinities()
@@ -105,6 +116,10 @@ class ExternalDataHook:
             }
         ]
     
+    def pattern_terms(self) -> List[str]:
+        """Every product term of the grocery patterns"""
+        return [item.lower() for pattern in self.grocery_patterns for item in pattern['products']]
+    
     def _get_category_affinities(self) -> Dict[str, List[str]]:
         """
         Category affinity mappings based on public shopping research
@@ -180,23 +195,21 @@ class ExternalDataHook:
         Match actual products from catalog to shopping patterns
         Returns mapping of pattern_id to product_ids
         """
-        pattern_matches = {}
+        pattern_matches = {pattern['pattern_id']: {} for pattern in self.grocery_patterns}
+        items = [(pattern['pattern_id'], frozenset(item.lower() for item in pattern['products']))
+                 for pattern in self.grocery_patterns]
         
-        for pattern in self.grocery_patterns:
-            pattern_matches[pattern['pattern_id']] = []
-            
-            for product in products:
-                product_name = product.get('name', '').lower()
-                product_category = product.get('category', '').lower()
-                
-                # Check if product matches any pattern item
-                for pattern_item in pattern['products']:
-                    if pattern_item.lower() in product_name or pattern_item.lower() in product_category:
-                        product_id = str(product.get('_id', product.get('id', '')))
-                        if product_id not in pattern_matches[pattern['pattern_id']]:
-                            pattern_matches[pattern['pattern_id']].append(product_id)
+        for product in products:
+            # Pattern items in the product's name or category, found in one pass over each
+            found = self.matcher.find(product.get('name') or '') | self.matcher.find(product.get('category') or '')
+            if not found:
+                continue
+            product_id = str(product.get('_id', product.get('id', '')))
+            for pattern_id, pattern_items in items:
+                if not found.isdisjoint(pattern_items):
+                    pattern_matches[pattern_id][product_id] = None
         
-        return pattern_matches
+        return {pattern_id: list(matches) for pattern_id, matches in pattern_matches.items()}
     
     def get_frequently_bought_together(self, product_name: str, products: List[Dict]) -> List[str]:
         """
@@ -204,23 +217,23 @@ class ExternalDataHook:
         Returns list of product IDs
         """
         product_name_lower = product_name.lower()
-        related_product_ids = []
+        related_product_ids = {}
+        catalog_terms = None
         
         # Find patterns containing this product
         for pattern in self.grocery_patterns:
             if any(item.lower() in product_name_lower or product_name_lower in item.lower() 
                    for item in pattern['products']):
+                if catalog_terms is None:
+                    # Pattern items in each catalog name, found once for all patterns
+                    catalog_terms = self.matcher.find_all(p.get('name') for p in products)
+                wanted = frozenset(item.lower() for item in pattern['products'] if item.lower() not in product_name_lower)
                 # Find other products in catalog that match pattern items
-                for catalog_product in products:
-                    catalog_name = catalog_product.get('name', '').lower()
-                    for pattern_item in pattern['products']:
-                        if (pattern_item.lower() in catalog_name and 
-                            pattern_item.lower() not in product_name_lower):
-                            product_id = str(catalog_product.get('_id', catalog_product.get('id', '')))
-                            if product_id not in related_product_ids:
-                                related_product_ids.append(product_id)
+                for catalog_product, found in zip(products, catalog_terms):
+                    if not found.isdisjoint(wanted):
+                        related_product_ids[str(catalog_product.get('_id', catalog_product.get('id', '')))] = None
         
-        return related_product_ids
+        return list(related_product_ids)
     
     def get_time_based_recommendations(self, hour: Optional[int] = None) -> List[str]:
         """
@@ -248,18 +261,13 @@ class ExternalDataHook:
     async def fetch_trending_from_api(self, api_url: Optional[str] = None) -> List[Dict]:
         """
         Fetch trending data from external API (if configured)
+        Served from the client's cache (stale data is revalidated in the background)
         Falls back to pattern-based trending if API unavailable
         """
         if api_url:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(api_url, timeout=5) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            logger.info(f"Fetched {len(data)} trending items from external API")
-                            return data
-            except Exception as e:
-                logger.warning(f"External API unavailable: {e}")
+            data = await self.client.get_json(api_url)
+            if data is not None:
+                return data
         
         # Fallback: return pattern-based trending
         trending = []
@@ -316,6 +324,11 @@ class InstacartPatternHook:
         'personal_care': 0.30,
     }
     
+    @classmethod
+    def pattern_terms(cls) -> List[str]:
+        """Every product term of the co-purchase pairs"""
+        return [item for pair in cls.CO_PURCHASE_PAIRS for item in pair[:2]]
+    
     @classmethod
     def get_co_purchase_suggestions(cls, product_name: str) -> List[Dict]:
         """Get products commonly purchased together"""
@@ -0,0 +1,247 @@
+"""
+Market Basket Engine
+Products bought together, mined from session baskets (add_to_cart / purchase events)
+"""
+
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+logger = logging.getLogger(__name__)
+
+# Actions that put a product in a session's basket
+BASKET_ACTIONS = ('add_to_cart', 'purchase')
+
+
+class MarketBasket:
+    """
+    Sparse item-item co-occurrence over session baskets, pruned to the top-K per item
+
+    A basket is the set of distinct products a session added to cart or
+    bought. For a pair of products (i, j):
+
+    - support = baskets with both / all baskets
+    - confidence(i -> j) = baskets with both / baskets with i
+    - lift = confidence / (baskets with j / all baskets)
+
+    ``rebuild`` mines the whole behavior history with one sparse product
+    (basket matrix transposed times itself). Each item keeps only its
+    ``top_k`` strongest partners, stored CSR-style and ordered best first,
+    so ``related`` is an O(k) slice. ``add`` updates the counts as events
+    arrive; an item's row becomes a small dict on its first update and is
+    pruned back to ``top_k`` whenever it grows to twice that.
+
+    Only the ``max_sessions`` most recently active baskets are remembered.
+    A session pushed out of them is closed: its later events are ignored,
+    since with its products forgotten they would count its pairs (and the
+    basket) again. Closed sessions cost one byte per session code.
+    """
+
+    def __init__(self, top_k: int = 50, min_pair_count: int = 2, max_sessions: int = 100000,
+                 max_basket_size: int = 100, actions: Sequence[str] = BASKET_ACTIONS):
+        """
+        Args:
+            top_k: Partners kept per item
+            min_pair_count: Baskets a pair must share before it is served
+            max_sessions: Open session baskets remembered for incremental updates
+            max_basket_size: Larger baskets (bots, bulk orders) add no pairs
+            actions: Actions that put a product in the basket
+        """
+        self.top_k = top_k
+        self.min_pair_count = min_pair_count
+        self.max_sessions = max_sessions
+        self.max_basket_size = max_basket_size
+        self.actions = frozenset(actions)
+        self.n_baskets = 0
+        self._item_counts = np.zeros(0, dtype=np.int64)
+        # Pruned co-occurrence rows from the last rebuild, best partner first
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.zeros(0, dtype=np.int32)
+        self._counts = np.zeros(0, dtype=np.int64)
+        # Rows changed since the rebuild (item -> {partner: count}) and their sorted partners
+        self._rows = {}
+        self._sorted = {}
+        # Session code -> product codes in its basket, least recently active first
+        self._sessions = OrderedDict()
+        # Flags by session code: evicted from _sessions, so later events are ignored
+        self._closed = np.zeros(0, dtype=bool)
+        self.ignored_events = 0
+
+    def rebuild(self, session_codes: np.ndarray, product_codes: np.ndarray, action_codes: np.ndarray,
+                timestamps: np.ndarray, action_names: List[str], n_products: int):
+        """Mine every basket in a behavior history (the interned arrays of a ``BehaviorStore``)"""
+        if not n_products:
+            return
+        basket_actions = [code for code, name in enumerate(action_names) if name in self.actions]
+        mask = np.isin(action_codes, basket_actions) & (session_codes >= 0) & (product_codes >= 0)
+        sessions, session_rows = np.unique(session_codes[mask], return_inverse=True)
+        products = product_codes[mask].astype(np.int64)
+
+        # Distinct (session, product) pairs form the basket matrix
+        keys = np.unique(session_rows.astype(np.int64) * n_products + products)
+        rows, columns = keys // n_products, keys % n_products
+        baskets = csr_matrix(
+            (np.ones(len(keys), dtype=np.int32), (rows, columns)), shape=(len(sessions), n_products)
+        )
+        small = baskets[np.flatnonzero(np.diff(baskets.indptr) <= self.max_basket_size)]
+
+        self.n_baskets = int(len(sessions))
+        self._item_counts = np.asarray(baskets.sum(axis=0)).ravel().astype(np.int64)
+        co_occurrence = (small.T @ small).tocsr()
+        co_occurrence.setdiag(0)
+        co_occurrence.eliminate_zeros()
+        self._prune(co_occurrence, n_products)
+        self._rows = {}
+        self._sorted = {}
+
+        # Remember the most recently active sessions so their later events extend the same basket
+        last_seen = np.full(len(sessions), -np.inf)
+        np.maximum.at(last_seen, session_rows, np.nan_to_num(timestamps[mask], nan=-np.inf))
+        order = np.argsort(last_seen, kind='stable')
+        recent, forgotten = order[-self.max_sessions:], order[:-self.max_sessions]
+        self._sessions = OrderedDict(
+            (int(sessions[row]), set(baskets.indices[baskets.indptr[row]:baskets.indptr[row + 1]].tolist()))
+            for row in recent
+        )
+        self._closed = np.zeros(int(sessions[-1]) + 1 if len(sessions) else 0, dtype=bool)
+        self._closed[sessions[forgotten]] = True
+        self.ignored_events = 0
+
+    def _prune(self, co_occurrence: csr_matrix, n_products: int):
+        """Keep the ``top_k`` partners per row: highest count first, then highest lift"""
+        rows = np.repeat(np.arange(n_products), np.diff(co_occurrence.indptr))
+        counts = co_occurrence.data.astype(np.int64)
+        # Within a row, a rarer partner has the higher lift for the same count
+        order = np.lexsort((self._item_counts[co_occurrence.indices], -counts, rows))
+        rank = np.arange(len(order)) - co_occurrence.indptr[rows[order]]
+        keep = order[rank < self.top_k]
+        self._indptr = np.concatenate(([0], np.cumsum(np.bincount(rows[keep], minlength=n_products))))
+        self._indices = co_occurrence.indices[keep].astype(np.int32)
+        self._counts = counts[keep]
+
+    def add(self, session_code: Optional[int], product_code: Optional[int]):
+        """Count one basket event (add_to_cart or purchase) given interned codes"""
+        if session_code is None or product_code is None:
+            return
+        basket = self._sessions.get(session_code)
+        if basket is None:
+            if session_code < len(self._closed) and self._closed[session_code]:
+                self.ignored_events += 1
+                return
+            basket = self._sessions[session_code] = set()
+            self.n_baskets += 1
+            if len(self._sessions) > self.max_sessions:
+                self._close(self._sessions.popitem(last=False)[0])
+        else:
+            self._sessions.move_to_end(session_code)
+        if product_code in basket:
+            return
+
+        self._ensure_item(product_code)
+        self._item_counts[product_code] += 1
+        if len(basket) < self.max_basket_size:
+            for other in basket:
+                self._bump(product_code, other)
+                self._bump(other, product_code)
+        basket.add(product_code)
+
+    def _close(self, session_code: int):
+        if session_code >= len(self._closed):
+            size = max(session_code + 1, 2 * len(self._closed))
+            self._closed = np.concatenate((self._closed, np.zeros(size - len(self._closed), dtype=bool)))
+        self._closed[session_code] = True
+
+    def open_sessions(self) -> np.ndarray:
+        """Session codes of the remembered baskets"""
+        return np.fromiter(self._sessions.keys(), dtype=np.int64, count=len(self._sessions))
+
+    def remap_sessions(self, mapping: np.ndarray):
+        """
+        Renumber the remembered and closed sessions after the behavior store
+        re-interned its sessions
+
+        A closed session whose events all left the store is dropped; if it
+        shows up again it starts a new basket.
+        """
+        self._sessions = OrderedDict(
+            (int(mapping[code]), basket) for code, basket in self._sessions.items() if mapping[code] >= 0
+        )
+        closed = mapping[np.flatnonzero(self._closed[:len(mapping)])]
+        closed = closed[closed >= 0]
+        self._closed = np.zeros(int(closed.max()) + 1 if len(closed) else 0, dtype=bool)
+        self._closed[closed] = True
+
+    def _ensure_item(self, code: int):
+        if code >= len(self._item_counts):
+            size = max(code + 1, 2 * len(self._item_counts))
+            self._item_counts = np.concatenate((self._item_counts, np.zeros(size - len(self._item_counts), dtype=np.int64)))
+
+    def _row(self, item: int) -> Dict[int, int]:
+        row = self._rows.get(item)
+        if row is None:
+            start, end = self._slice(item)
+            row = self._rows[item] = dict(zip(self._indices[start:end].tolist(), self._counts[start:end].tolist()))
+        return row
+
+    def _slice(self, item: int):
+        if item + 1 >= len(self._indptr):
+            return 0, 0
+        return self._indptr[item], self._indptr[item + 1]
+
+    def _bump(self, item: int, partner: int):
+        row = self._row(item)
+        row[partner] = row.get(partner, 0) + 1
+        self._sorted.pop(item, None)
+        if len(row) > 2 * self.top_k:
+            self._rows[item] = dict(self._ranked(row)[:self.top_k])
+
+    def _ranked(self, row: Dict[int, int]) -> List:
+        counts = self._item_counts
+        return sorted(row.items(), key=lambda pair: (-pair[1], counts[pair[0]] if pair[0] < len(counts) else 0))
+
+    def related(self, product_code: Optional[int], k: int) -> List[Dict]:
+        """
+        Up to ``k`` products most often in the same basket, strongest first
+
+        Returns:
+            Dicts with 'product_code', 'co_occurrences', 'support', 'confidence' and 'lift'
+        """
+        if product_code is None or product_code >= len(self._item_counts) or not self._item_counts[product_code]:
+            return []
+        if product_code in self._rows:
+            ranked = self._sorted.get(product_code)
+            if ranked is None:
+                ranked = self._sorted[product_code] = self._ranked(self._rows[product_code])[:self.top_k]
+        else:
+            start, end = self._slice(product_code)
+            end = min(end, start + k)
+            ranked = zip(self._indices[start:end].tolist(), self._counts[start:end].tolist())
+
+        item_counts = self._item_counts
+        item_count = int(item_counts[product_code])
+        n_baskets = self.n_baskets
+        related = []
+        for partner, count in ranked:
+            if count < self.min_pair_count or len(related) >= k:
+                break
+            related.append({
+                'product_code': partner,
+                'co_occurrences': count,
+                'support': round(count / n_baskets, 6),
+                'confidence': round(count / item_count, 4),
+                'lift': round(count * n_baskets / (item_count * int(item_counts[partner])), 4)
+            })
+        return related
+
+    def stats(self) -> Dict:
+        return {
+            'baskets': self.n_baskets,
+            'open_sessions': len(self._sessions),
+            'closed_sessions': int(self._closed.sum()),
+            'ignored_events': self.ignored_events,
+            'pairs_kept': int(len(self._counts)),
+            'rows_updated_since_rebuild': len(self._rows)
+        }
@@ -0,0 +1,94 @@
+"""
+Materialized Views
+Pre-serialized responses of the anonymous endpoints, rebuilt when the catalog changes
+"""
+
+import json
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+def serialize(payload: Dict) -> bytes:
+    """JSON body as FastAPI's JSONResponse renders it"""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+class MaterializedView:
+    """
+    Response bodies of one endpoint, serialized once per distinct arguments
+
+    ``render(*key)`` computes the response payload for a key. ``refresh``
+    renders every key of ``keys()`` up front, so the common requests never
+    compute anything; other keys are rendered on first request and kept,
+    least recently used first out, up to ``max_entries``.
+
+    Everything is rendered from the catalog, so a view stamps its entries
+    with ``version()`` (the catalog version) and is rebuilt on first use
+    after it moved, whichever code path changed the catalog.
+    """
+
+    def __init__(self, name: str, render: Callable[..., Dict], keys: Callable[[], Iterable[tuple]],
+                 version: Callable[[], Hashable], max_entries: int = 1024):
+        """
+        Args:
+            name: Name used in logs and stats
+            render: Payload for a key's arguments
+            keys: Keys materialized by ``refresh``
+            version: Version of the view's inputs; entries of another version are stale
+            max_entries: Bodies kept in memory, the materialized keys included
+        """
+        self.name = name
+        self.render = render
+        self.keys = keys
+        self.version = version
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.last_refresh_ms = 0.0
+
+    def get(self, *key) -> bytes:
+        """The serialized response for ``key``"""
+        if self._version != self.version():
+            self.refresh()
+        body = self._bodies.get(key)
+        if body is not None:
+            self.hits += 1
+            self._bodies.move_to_end(key)
+            return body
+        self.misses += 1
+        body = self._bodies[key] = serialize(self.render(*key))
+        if len(self._bodies) > self.max_entries:
+            self._bodies.popitem(last=False)
+        return body
+
+    def refresh(self):
+        """Render every materialized key again, dropping all other entries"""
+        start = time.perf_counter()
+        version = self.version()
+        bodies = OrderedDict()
+        for key in self.keys():
+            if key not in bodies:
+                bodies[key] = serialize(self.render(*key))
+        # Swapped in whole, so a request never sees a mix of versions
+        self._bodies, self._version = bodies, version
+        self.refreshes += 1
+        self.last_refresh_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._bodies),
+            'bytes': sum(len(body) for body in self._bodies.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'refreshes': self.refreshes,
+            'last_refresh_ms': self.last_refresh_ms
+        }
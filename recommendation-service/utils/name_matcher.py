@@ -0,0 +1,85 @@
+"""
+Name Matcher
+Aho-Corasick automaton finding every pattern term contained in a product name
+"""
+
+import logging
+from collections import deque
+from typing import FrozenSet, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+
+class PatternMatcher:
+    """
+    Compiled set of lowercase terms, matched as substrings in one pass over a text
+
+    ``find(text)`` returns the same terms as ``{t for t in terms if t in
+    text.lower()}`` but costs O(len(text)) however many terms there are.
+    The automaton is built once per term set; build a new matcher when the
+    terms change.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        # An empty term would match every text
+        self.terms = sorted({term.lower() for term in terms if term})
+        # Trie transitions per state, the longest proper suffix state (failure link)
+        # and the terms ending at each state, including those reached by failure links
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [frozenset()]
+        for term in self.terms:
+            self._insert(term)
+        self._link()
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._term_set
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _insert(self, term: str):
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(frozenset())
+            state = next_state
+        self._output[state] = frozenset((term,))
+
+    def _link(self):
+        """Set failure links breadth first, so a state's suffix is linked before the state"""
+        self._term_set = frozenset(self.terms)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = self._goto[fallback].get(char, 0)
+                self._fail[child] = link if link != child else 0
+                if self._output[self._fail[child]]:
+                    self._output[child] = self._output[child] | self._output[self._fail[child]]
+
+    def find(self, text: str) -> FrozenSet[str]:
+        """Terms occurring in ``text`` (case-insensitive)"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        found = frozenset()
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found = found | output[state]
+        return found
+
+    def find_all(self, texts: Iterable[str]) -> List[FrozenSet[str]]:
+        """``find`` for each text"""
+        return [self.find(text or '') for text in texts]
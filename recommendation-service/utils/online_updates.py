@@ -0,0 +1,154 @@
+"""
+Online Model Updates
+Buffers tracked behaviors and folds them into the trained models in the background
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class OnlineUpdater:
+    """
+    Collects behavior events and periodically applies them with ``partial_fit``
+
+    Events are appended from the request path in O(1); a background task
+    drains them every ``interval`` seconds and runs the fold-in on an executor
+    thread so the event loop is never blocked by model updates.
+    """
+
+    def __init__(self, get_models: Callable[[], List], interval: float = 2.0, max_pending: int = 50000):
+        """
+        Args:
+            get_models: Returns the models to update (called on every flush so swapped models are picked up)
+            interval: Seconds between flushes
+            max_pending: Events buffered before the oldest are dropped
+        """
+        self.get_models = get_models
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        self._captured = None
+        # Behaviors submitted so far, and how many had been when the capture started
+        self._submitted = 0
+        self._capture_from = 0
+        # Bumped after every applied batch, so responses cached from the models can be invalidated
+        self.version = 0
+        self.stats = {
+            'events_applied': 0,
+            'events_dropped': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_batch_ms': 0.0
+        }
+
+    def submit(self, behavior: Dict):
+        """Queue a behavior for the next fold-in"""
+        self.submit_many([behavior])
+
+    def submit_many(self, behaviors: List[Dict]):
+        """Queue a batch of behaviors for the next fold-in"""
+        with self._lock:
+            self._pending.extend(behaviors)
+            self._submitted += len(behaviors)
+            if len(self._pending) > self.max_pending:
+                overflow = len(self._pending) - self.max_pending
+                del self._pending[:overflow]
+                self.stats['events_dropped'] += overflow
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start_capture(self):
+        """
+        Start recording applied batches (replayed onto a model version being built)
+
+        Call it right after taking the training snapshot: behaviors submitted
+        before then are already in the snapshot, so they are not recorded even
+        when their batch is applied later.
+        """
+        with self._lock:
+            self._capture_from = self._submitted
+        self._captured = []
+
+    def drain_capture(self) -> List[Dict]:
+        """
+        Return the behaviors applied since the last drain
+
+        Waits for an in-flight batch, so call it off the event loop.
+        """
+        with self._apply_lock:
+            captured = self._captured
+            if captured is None:
+                return []
+            self._captured = []
+        return captured
+
+    def pause(self) -> List[Dict]:
+        """
+        Hold back further batches until ``resume`` and end the capture
+
+        Waits for an in-flight batch, so call it off the event loop. Returns
+        the behaviors applied since the last drain; nothing else is applied
+        to the current models until the caller swaps in new ones and resumes.
+        """
+        self._apply_lock.acquire()
+        captured, self._captured = self._captured or [], None
+        return captured
+
+    def resume(self):
+        self._apply_lock.release()
+
+    def stop_capture(self):
+        self._captured = None
+
+    async def run(self):
+        """Flush loop; started as a background task on startup"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Online update failed: {str(e)}")
+
+    async def flush(self):
+        """Apply all queued behaviors to the models"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            first = self._submitted - len(batch)
+        if not batch:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._apply, batch, first)
+
+    def _apply(self, batch: List[Dict], first: int):
+        """Apply ``batch``, whose first behavior was the ``first``-th submitted"""
+        start = time.perf_counter()
+        with self._apply_lock:
+            apply_behaviors(self.get_models(), batch)
+            self.version += 1
+            captured = self._captured
+            if captured is not None:
+                captured.extend(batch[max(self._capture_from - first, 0):])
+
+        self.stats['events_applied'] += len(batch)
+        self.stats['batches'] += 1
+        self.stats['last_batch_size'] = len(batch)
+        self.stats['last_batch_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        logger.debug(f"Applied {len(batch)} online behavior updates in {self.stats['last_batch_ms']} ms")
+
+
+def apply_behaviors(models: List, batch: List[Dict]):
+    """Fold a batch of behaviors into every trained model"""
+    for model in models:
+        if model is None or not model.trained:
+            continue
+        try:
+            model.partial_fit(batch)
+        except Exception as e:
+            logger.error(f"Error folding behaviors into {type(model).__name__}: {str(e)}")
@@ -0,0 +1,80 @@
+"""
+Service Readiness
+Per-component startup state and time to the first successful response
+"""
+
+import logging
+import time
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+class ReadinessTracker:
+    """
+    Tracks when each startup component (models, data, ...) became usable
+
+    Times are measured from construction, which happens while ``app`` is
+    imported, so they include loading the application's own modules.
+    """
+
+    def __init__(self, components: Iterable[str]):
+        self._start = time.perf_counter()
+        self.started_at = time.time()
+        self.components = {
+            name: {'status': 'pending', 'ready_after_seconds': None, 'detail': None}
+            for name in components
+        }
+        self.first_response = None
+
+    def elapsed(self) -> float:
+        return round(time.perf_counter() - self._start, 3)
+
+    def mark(self, name: str, status: str, detail: Optional[str] = None):
+        """Set a component's status ('pending', 'loading', 'ready' or 'failed')"""
+        component = self.components[name]
+        component['status'] = status
+        component['detail'] = detail
+        if status == 'ready':
+            component['ready_after_seconds'] = self.elapsed()
+            logger.info(f"✅ {name} ready after {component['ready_after_seconds']}s" + (f" ({detail})" if detail else ""))
+
+    def is_ready(self, name: str) -> bool:
+        return self.components[name]['status'] == 'ready'
+
+    def record_first_response(self, path: str):
+        if self.first_response is None:
+            self.first_response = {'path': path, 'after_seconds': self.elapsed()}
+            logger.info(f"⏱️  First successful response after {self.first_response['after_seconds']}s ({path})")
+
+    def report(self) -> Dict:
+        return {
+            'uptime_seconds': self.elapsed(),
+            'components': self.components,
+            'first_successful_response': self.first_response
+        }
+
+
+class FirstResponseMiddleware:
+    """
+    ASGI middleware recording the first successful response under ``path_prefix``
+
+    Once that response has been seen, requests pass straight through.
+    """
+
+    def __init__(self, app, tracker: ReadinessTracker, path_prefix: str = '/recommend'):
+        self.app = app
+        self.tracker = tracker
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if (self.tracker.first_response is not None or scope['type'] != 'http'
+                or not scope['path'].startswith(self.path_prefix)):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_and_record(message):
+            if message['type'] == 'http.response.start' and message['status'] < 400:
+                self.tracker.record_first_response(scope['path'])
+            await send(message)
+
+        await self.app(scope, receive, send_and_record)
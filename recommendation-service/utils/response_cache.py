@@ -0,0 +1,162 @@
+"""
+Response Cache
+Serialized recommendation responses keyed by endpoint, arguments and data version
+"""
+
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional
+
+from .materialized_views import serialize
+
+logger = logging.getLogger(__name__)
+
+# Rough memory cost of an entry besides its body (key, ETag, bookkeeping)
+_ENTRY_BYTES = 400
+
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag of a response body"""
+    return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` header names ``etag`` (weak comparison, as RFC 9110 requires)"""
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(',')}
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+class CachedResponse:
+    """One serialized response and its ETag"""
+
+    __slots__ = ('body', 'etag', 'expires_at', 'tags', 'nbytes')
+
+    def __init__(self, body: bytes, expires_at: float, tags: tuple):
+        self.body = body
+        self.etag = etag_for(body)
+        self.expires_at = expires_at
+        self.tags = tags
+        self.nbytes = len(body) + _ENTRY_BYTES
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized responses for one data version
+
+    Entries are only valid for the ``version`` they were computed under
+    (e.g. model version and catalog version): the first lookup under a new
+    version drops every entry, so a retrain, hot-swap or catalog change
+    invalidates the cache whichever code path caused it.
+
+    Within a version, answers still drift as behaviors are tracked
+    (trending, basket counts, online model updates), so entries expire after
+    ``ttl`` seconds. Entries can carry tags (e.g. a user id) and be dropped
+    early by tag, e.g. when that user's own behavior changes their
+    recommendations. The least recently used entries are evicted once
+    ``max_entries`` or ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            ttl: Seconds an entry is served (0 disables the cache)
+            max_entries: Responses kept in memory
+            max_bytes: Estimated memory budget for all responses
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        # Tag -> keys of the entries carrying it
+        self._by_tag = {}
+        self._version = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[CachedResponse]:
+        """The cached response for ``key`` under ``version``, if any and not expired"""
+        if version != self._version:
+            self.clear()
+            self._version = version
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._drop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: Hashable, version: Hashable, payload: Dict, tags: Iterable[Hashable] = ()) -> CachedResponse:
+        """Serialize ``payload`` and, when it was computed under the current version, cache it"""
+        entry = CachedResponse(serialize(payload), time.monotonic() + self.ttl, tuple(tags))
+        if self.ttl <= 0 or version != self._version:
+            return entry
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = entry
+        self.nbytes += entry.nbytes
+        for tag in entry.tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        self._evict()
+        return entry
+
+    def invalidate(self, tag: Hashable) -> int:
+        """Drop the entries carrying ``tag``; returns how many were dropped"""
+        keys = self._by_tag.get(tag)
+        if not keys:
+            return 0
+        dropped = len(keys)
+        for key in list(keys):
+            self._drop(key)
+        self.invalidations += dropped
+        return dropped
+
+    def clear(self):
+        """Drop every entry"""
+        self._entries.clear()
+        self._by_tag.clear()
+        self.nbytes = 0
+
+    def _drop(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.nbytes -= entry.nbytes
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def _evict(self):
+        """Drop the least recently used entries beyond the caps"""
+        while self._entries and (len(self._entries) > self.max_entries or self.nbytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'estimated_bytes': self.nbytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
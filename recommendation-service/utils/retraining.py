@@ -0,0 +1,177 @@
+"""
+Background Retraining
+Builds a complete new model version off the event loop and hot-swaps it in
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from models.collaborative_filter import count_interactions
+from models.registry import train_version, new_version
+from utils.online_updates import apply_behaviors
+
+logger = logging.getLogger(__name__)
+
+class RetrainManager:
+    """
+    Runs retrain jobs one at a time and publishes their result atomically
+
+    Training happens in a separate process (or a worker thread when
+    ``use_processes`` is off) and writes a new artifact version; the serving
+    process memory-maps it, replays the behaviors and catalog edits applied to
+    the live models since the data snapshot, and swaps the bundle in with a
+    single reference assignment. Loading and replaying run on executor
+    threads; only the swap runs on the event loop. Requests keep being served
+    by the previous version until then.
+    """
+
+    def __init__(self, registry, data_loader, online_updater, use_processes: bool = True, max_jobs: int = 20,
+                 refresh_data: Optional[Callable[[], Awaitable]] = None):
+        """
+        Args:
+            registry: ModelRegistry to publish to
+            data_loader: DataLoader providing the training snapshot
+            online_updater: OnlineUpdater whose applied behaviors are replayed
+            use_processes: Train in a child process instead of a thread
+            max_jobs: Finished jobs kept for status queries
+            refresh_data: Brings the loaded data up to date before a job takes its
+                snapshot (defaults to a full ``data_loader.load_data()``)
+        """
+        self.registry = registry
+        self.data_loader = data_loader
+        self.online_updater = online_updater
+        self.use_processes = use_processes
+        self.max_jobs = max_jobs
+        self.refresh_data = refresh_data or data_loader.load_data
+        self.jobs = {}
+        self._running = None
+        self._catalog_journal = None
+
+    def submit(self) -> Dict:
+        """Start a retrain job, or return the one already running"""
+        if self._running is not None:
+            return self.jobs[self._running]
+
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'job_id': job_id,
+            'status': 'queued',
+            'stage': 'queued',
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'duration_seconds': None,
+            'version': None,
+            'timings': {},
+            'data_stats': {},
+            'error': None
+        }
+        self.jobs[job_id] = job
+        while len(self.jobs) > self.max_jobs:
+            del self.jobs[next(iter(self.jobs))]
+
+        self._running = job_id
+        asyncio.get_running_loop().create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+    def latest(self) -> Optional[Dict]:
+        return next(reversed(self.jobs.values()), None)
+
+    def record_catalog_change(self, kind: str, payload: List):
+        """Remember an 'upsert' or 'remove' applied to the live content model during a retrain"""
+        if self._catalog_journal is not None:
+            self._catalog_journal.append((kind, payload))
+
+    def _executor(self):
+        if self.use_processes:
+            return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        return ThreadPoolExecutor(max_workers=1)
+
+    async def _run(self, job: Dict):
+        loop = asyncio.get_running_loop()
+        job['status'] = 'running'
+        job['started_at'] = time.time()
+        start = time.perf_counter()
+        try:
+            job['stage'] = 'loading_data'
+            await self.refresh_data()
+            product_data = self.data_loader.get_product_data()
+            interaction_data = self.data_loader.get_interaction_data()
+            job['data_stats'] = {'products': len(product_data), 'behaviors': count_interactions(interaction_data)}
+
+            # Everything applied to the live models from here on is replayed onto the new version
+            self.online_updater.start_capture()
+            self._catalog_journal = []
+
+            job['stage'] = 'training'
+            version = new_version()
+            executor = self._executor()
+            try:
+                job['timings'] = await loop.run_in_executor(
+                    executor, train_version, self.registry.model_dir, version, product_data, interaction_data
+                )
+            finally:
+                # Joining the worker process blocks, so keep it off the event loop
+                await loop.run_in_executor(None, executor.shutdown)
+
+            job['stage'] = 'loading'
+            bundle = await loop.run_in_executor(None, self.registry.load_version, version)
+
+            job['stage'] = 'replaying'
+            await loop.run_in_executor(None, self._catch_up, bundle, self._drain_catalog())
+
+            # Hold back online updates until the swap, so nothing applied to the live
+            # models is missed; the final catch-up still runs off the event loop
+            behaviors = await loop.run_in_executor(None, self.online_updater.pause)
+            try:
+                changes = self._drain_catalog()
+                while behaviors or changes:
+                    await loop.run_in_executor(None, self._replay, bundle, behaviors, changes)
+                    behaviors, changes = [], self._drain_catalog()
+                # No await between the last catalog drain and the swap
+                self.registry.publish(bundle)
+            finally:
+                self.online_updater.resume()
+            await loop.run_in_executor(None, self.registry.persist, bundle.version)
+
+            job['version'] = version
+            job['status'] = 'completed'
+            job['stage'] = 'completed'
+            logger.info(f"✅ Retrain job {job['job_id']} published version {version}")
+
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            logger.error(f"Retrain job {job['job_id']} failed: {str(e)}")
+
+        finally:
+            self.online_updater.stop_capture()
+            self._catalog_journal = None
+            self._running = None
+            job['finished_at'] = time.time()
+            job['duration_seconds'] = round(time.perf_counter() - start, 3)
+
+    def _catch_up(self, bundle, catalog_changes: List):
+        self._replay(bundle, self.online_updater.drain_capture(), catalog_changes)
+
+    def _drain_catalog(self) -> List:
+        journal, self._catalog_journal = self._catalog_journal, []
+        return journal
+
+    @staticmethod
+    def _replay(bundle, behaviors: List[Dict], catalog_changes: List):
+        if behaviors:
+            apply_behaviors(bundle.user_models(), behaviors)
+        for kind, payload in catalog_changes:
+            if kind == 'upsert':
+                bundle.content_based.upsert_products(payload)
+            elif kind == 'remove':
+                bundle.content_based.remove_products(payload)
@@ -0,0 +1,316 @@
+"""
+Trending Engine
+Sliding-window, action-weighted and decayed product popularity maintained as events arrive
+"""
+
+import math
+import time
+import logging
+import itertools
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Event weight per action; anything else (e.g. 'search') counts as 1
+ACTION_WEIGHTS = {
+    'view': 1.0,
+    'click': 2.0,
+    'add_to_cart': 3.0,
+    'wishlist': 4.0,
+    'purchase': 5.0,
+    'remove_from_cart': 0.0
+}
+
+# Trending generations, unique across engines so a rebuilt engine never repeats one
+_generations = itertools.count(1)
+
+# name -> (span seconds, number of buckets)
+DEFAULT_WINDOWS = {
+    '1h': (3600, 60),
+    '24h': (86400, 96),
+    '7d': (7 * 86400, 168)
+}
+
+
+class TrendingWindow:
+    """
+    Top products of one sliding window, in fixed memory
+
+    Scores are kept per time bucket in a ``capacity x n_buckets`` matrix, one
+    row per tracked product. Rolling into a new bucket clears the oldest
+    column, so events leave the window exactly on time. A product's score is
+    its bucket sums weighted by ``0.5 ** (age / half_life)``, which makes
+    recent activity count more than activity near the window's far edge.
+
+    When every row is taken, a new product replaces the lowest-scoring one
+    and inherits its score (space-saving), so the heavy hitters are kept
+    and scores only ever overestimate, by at most the evicted score.
+    """
+
+    def __init__(self, span: float, n_buckets: int, capacity: int = 2000, half_life: Optional[float] = None):
+        """
+        Args:
+            span: Window length in seconds
+            n_buckets: Time buckets the window is divided into
+            capacity: Products tracked at once
+            half_life: Seconds for an event's weight to halve (default span / 4)
+        """
+        self.span = span
+        self.n_buckets = n_buckets
+        self.bucket_seconds = span / n_buckets
+        self.capacity = capacity
+        self.half_life = half_life or span / 4
+        # Weight of a bucket by age (0 = current bucket)
+        self._age_weights = 0.5 ** (np.arange(n_buckets) * self.bucket_seconds / self.half_life)
+        self._reset()
+
+    def _reset(self):
+        capacity, n_buckets = self.capacity, self.n_buckets
+        self._scores = np.zeros((capacity, n_buckets), dtype=np.float32)
+        self._events = np.zeros((capacity, n_buckets), dtype=np.int32)
+        self._total = np.zeros(capacity, dtype=np.float64)
+        self._slots = {}
+        self._ids = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+        self._bucket = None
+        self._top = None
+
+    def _column(self, bucket: int) -> int:
+        return bucket % self.n_buckets
+
+    def advance(self, now: float):
+        """Roll the window forward to ``now``, expiring buckets that left it"""
+        bucket = int(now // self.bucket_seconds)
+        if self._bucket is None:
+            self._bucket = bucket
+            return
+        if bucket <= self._bucket:
+            return
+
+        expired = min(bucket - self._bucket, self.n_buckets)
+        for b in range(bucket - expired + 1, bucket + 1):
+            column = self._column(b)
+            self._scores[:, column] = 0
+            self._events[:, column] = 0
+        self._bucket = bucket
+        self._rescore()
+
+    def _rescore(self):
+        """Recompute decayed totals and free rows with no events left in the window"""
+        ages = (self._bucket - np.arange(self.n_buckets)) % self.n_buckets
+        weights_by_column = self._age_weights[ages]
+        self._total = self._scores @ weights_by_column.astype(np.float32)
+
+        empty = np.flatnonzero(self._events.sum(axis=1) == 0)
+        for slot in empty:
+            product_id = self._ids[slot]
+            if product_id is not None:
+                del self._slots[product_id]
+                self._ids[slot] = None
+                self._free.append(slot)
+        self._top = None
+
+    def add(self, product_id: str, weight: float, timestamp: float):
+        """Count one event; events outside the window are ignored"""
+        bucket = int(timestamp // self.bucket_seconds)
+        age = self._bucket - bucket
+        if age < 0 or age >= self.n_buckets:
+            return
+
+        slot = self._slots.get(product_id)
+        if slot is None:
+            slot = self._claim(product_id)
+        column = self._column(bucket)
+        self._scores[slot, column] += weight
+        self._events[slot, column] += 1
+        self._total[slot] += weight * self._age_weights[age]
+        self._top = None
+
+    def add_many(self, product_ids: Sequence[str], weights: np.ndarray, timestamps: np.ndarray):
+        """Count a batch of events (same result as calling ``add`` for each, in order)"""
+        buckets = (timestamps // self.bucket_seconds).astype(np.int64)
+        ages = self._bucket - buckets
+        inside = np.flatnonzero((ages >= 0) & (ages < self.n_buckets))
+        if not len(inside):
+            return
+        decayed = weights[inside] * self._age_weights[ages[inside]]
+        slots = np.empty(len(inside), dtype=np.int64)
+        for i, row in enumerate(inside.tolist()):
+            product_id = product_ids[row]
+            slot = self._slots.get(product_id)
+            if slot is None:
+                slot = self._claim(product_id)
+            slots[i] = slot
+            # Totals go in right away so a later claim in this batch sees them, as with ``add``
+            self._total[slot] += decayed[i]
+        columns = self._column(buckets[inside])
+        np.add.at(self._scores, (slots, columns), weights[inside])
+        np.add.at(self._events, (slots, columns), 1)
+        self._top = None
+
+    def _claim(self, product_id: str) -> int:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            # Space-saving: take over the weakest product's row along with its counts
+            slot = int(np.argmin(self._total))
+            del self._slots[self._ids[slot]]
+        self._slots[product_id] = slot
+        self._ids[slot] = product_id
+        return slot
+
+    def load(self, product_ids: Sequence[str], scores: np.ndarray, events: np.ndarray, now: float):
+        """
+        Replace the contents with pre-aggregated per-product bucket matrices
+
+        Args:
+            product_ids: Product per row of ``scores``/``events``
+            scores: (n_products, n_buckets) weighted scores by bucket age (column 0 = current bucket)
+            events: (n_products, n_buckets) event counts in the same layout
+        """
+        self._reset()
+        self._bucket = int(now // self.bucket_seconds)
+        totals = scores @ self._age_weights
+        keep = np.argsort(-totals, kind='stable')[:self.capacity]
+        keep = keep[events[keep].sum(axis=1) > 0]
+        columns = self._column(self._bucket - np.arange(self.n_buckets))
+        for row in keep:
+            self._claim(product_ids[row])
+        slots = np.array([self._slots[product_ids[row]] for row in keep], dtype=np.int64)
+        if len(slots):
+            self._scores[np.ix_(slots, columns)] = scores[keep]
+            self._events[np.ix_(slots, columns)] = events[keep]
+            self._total[slots] = totals[keep]
+
+    def top(self, k: int) -> List[Dict]:
+        """The ``k`` highest-scoring products, highest first"""
+        if self._top is None or len(self._top) < k:
+            slots = np.array(list(self._slots.values()), dtype=np.int64)
+            if len(slots) > k:
+                slots = slots[np.argpartition(-self._total[slots], k - 1)[:k]]
+            slots = slots[np.argsort(-self._total[slots], kind='stable')]
+            self._top = [
+                {
+                    'product_id': self._ids[slot],
+                    'score': round(float(self._total[slot]), 4),
+                    'interaction_count': int(self._events[slot].sum())
+                }
+                for slot in slots
+            ]
+        return self._top[:k]
+
+    def __len__(self):
+        return len(self._slots)
+
+
+class TrendingEngine:
+    """
+    Trending products over several sliding windows (1h, 24h and 7d by default)
+
+    Tracked events are added in O(1) per window and reads return the cached
+    top list, so serving trending no longer depends on how many behaviors
+    are held in memory. ``generation`` changes whenever the counts do, so
+    cached responses can be keyed on it. Reads may come from executor
+    threads while the event loop adds events, so both hold ``_lock``.
+    """
+
+    def __init__(self, windows: Optional[Dict] = None, capacity: int = 2000,
+                 action_weights: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            windows: Window name -> (span seconds, number of buckets)
+            capacity: Products tracked per window
+            action_weights: Event weight per action
+        """
+        self.action_weights = action_weights or ACTION_WEIGHTS
+        self.windows = {
+            name: TrendingWindow(span, n_buckets, capacity)
+            for name, (span, n_buckets) in (windows or DEFAULT_WINDOWS).items()
+        }
+        self.events_seen = 0
+        self.generation = next(_generations)
+        self._lock = threading.Lock()
+
+    def weight(self, action: Optional[str]) -> float:
+        return self.action_weights.get(action, 1.0)
+
+    def add(self, product_id, action: Optional[str] = None, timestamp: Optional[float] = None):
+        """Count one tracked event (timestamp in epoch seconds, default now)"""
+        if product_id is None:
+            return
+        now = time.time()
+        timestamp = now if timestamp is None or math.isnan(timestamp) else min(timestamp, now)
+        weight = self.weight(action)
+        with self._lock:
+            for window in self.windows.values():
+                window.advance(now)
+                window.add(str(product_id), weight, timestamp)
+            self.events_seen += 1
+            self.generation = next(_generations)
+
+    def add_many(self, behaviors: List[Dict]):
+        """Count a batch of tracked events (behavior dicts with productId, action and timestamp)"""
+        behaviors = [b for b in behaviors if b.get('productId') is not None]
+        if not behaviors:
+            return
+        now = time.time()
+        product_ids = [str(b['productId']) for b in behaviors]
+        weights = np.array([self.weight(b.get('action')) for b in behaviors])
+        timestamps = np.array([b.get('timestamp') if b.get('timestamp') is not None else np.nan for b in behaviors],
+                              dtype=np.float64)
+        timestamps = np.where(np.isnan(timestamps), now, np.minimum(timestamps, now))
+        with self._lock:
+            for window in self.windows.values():
+                window.advance(now)
+                window.add_many(product_ids, weights, timestamps)
+            self.events_seen += len(behaviors)
+            self.generation = next(_generations)
+
+    def rebuild(self, product_codes: np.ndarray, action_codes: np.ndarray, timestamps: np.ndarray,
+                product_ids: List[str], action_names: List[str], now: Optional[float] = None):
+        """
+        Rebuild every window from a behavior history in one vectorized pass
+
+        Takes the interned arrays of a ``BehaviorStore``; events without a
+        timestamp are counted as happening now.
+        """
+        now = time.time() if now is None else now
+        valid = product_codes >= 0
+        products = product_codes[valid]
+        # One weight per action code; the extra last entry serves code -1 (no action)
+        weights = np.array([self.weight(name) for name in action_names] + [1.0])[action_codes[valid]]
+        times = np.where(np.isnan(timestamps[valid]), now, np.minimum(timestamps[valid], now))
+
+        used, rows = np.unique(products, return_inverse=True)
+        with self._lock:
+            for window in self.windows.values():
+                ages = int(now // window.bucket_seconds) - (times // window.bucket_seconds).astype(np.int64)
+                inside = (ages >= 0) & (ages < window.n_buckets)
+                cells = rows[inside] * window.n_buckets + ages[inside]
+                size = len(used) * window.n_buckets
+                scores = np.bincount(cells, weights=weights[inside], minlength=size).reshape(len(used), window.n_buckets)
+                events = np.bincount(cells, minlength=size).reshape(len(used), window.n_buckets)
+                window.load([product_ids[code] for code in used], scores, events, now)
+            self.events_seen = int(valid.sum())
+            self.generation = next(_generations)
+
+    def top(self, window: str, k: int) -> List[Dict]:
+        """
+        Top ``k`` products of a window
+
+        Raises:
+            KeyError: Unknown window name
+        """
+        trending_window = self.windows[window]
+        with self._lock:
+            trending_window.advance(time.time())
+            return trending_window.top(k)
+
+    def stats(self) -> Dict:
+        return {
+            'events_seen': self.events_seen,
+            'windows': {name: {'span_seconds': w.span, 'tracked_products': len(w)} for name, w in self.windows.items()}
+        }
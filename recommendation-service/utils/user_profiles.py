@@ -0,0 +1,231 @@
+"""
+User Profiles
+Per-user behavior aggregates kept up to date as events are tracked
+"""
+
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rough memory cost of a profile and of each entry in its counters, for the memory cap
+_PROFILE_BYTES = 600
+_COUNTER_ENTRY_BYTES = 120
+_PRODUCT_ENTRY_BYTES = 60
+
+
+class UserProfile:
+    """Action counts, category interest and distinct products of one user"""
+
+    __slots__ = ('action_counts', 'category_counts', 'products', 'total', 'touched_at', 'nbytes')
+
+    def __init__(self):
+        self.action_counts = {}
+        self.category_counts = {}
+        # Product codes of the behavior store's interner
+        self.products = set()
+        self.total = 0
+        self.touched_at = time.monotonic()
+        self.nbytes = _PROFILE_BYTES
+
+    def add(self, action: str, category: Optional[str], product_code: Optional[int]):
+        if action not in self.action_counts:
+            self.nbytes += _COUNTER_ENTRY_BYTES
+        self.action_counts[action] = self.action_counts.get(action, 0) + 1
+        if category is not None:
+            if category not in self.category_counts:
+                self.nbytes += _COUNTER_ENTRY_BYTES
+            self.category_counts[category] = self.category_counts.get(category, 0) + 1
+        if product_code is not None and product_code not in self.products:
+            self.products.add(product_code)
+            self.nbytes += _PRODUCT_ENTRY_BYTES
+        self.total += 1
+
+    def summary(self) -> Dict:
+        # Few categories per user, so this sort is cheap
+        top_categories = sorted(self.category_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+        return {
+            'has_history': True,
+            'total_interactions': self.total,
+            'action_counts': dict(self.action_counts),
+            'top_categories': [c[0] for c in top_categories],
+            'unique_products_viewed': len(self.products)
+        }
+
+
+class UserProfileStore:
+    """
+    LRU cache of ``UserProfile`` aggregates, updated in O(1) per tracked event
+
+    Every tracked event creates or updates its user's profile, so reads
+    never scan the behavior history. ``rebuild`` seeds the profiles from a
+    behavior store after a full reload, in one vectorized pass. Profiles
+    untouched for ``ttl`` seconds are dropped, and the least recently used
+    ones are evicted once ``max_users`` or ``max_bytes`` is exceeded; a
+    dropped user's profile starts again from their next event.
+    """
+
+    def __init__(self, max_users: int = 100_000, ttl: float = 3600, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_users: Profiles kept in memory
+            ttl: Seconds a profile lives without being read or updated
+            max_bytes: Estimated memory budget for all profiles
+        """
+        self.max_users = max_users
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._profiles = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def __contains__(self, user_id) -> bool:
+        return str(user_id) in self._profiles
+
+    def clear(self):
+        """Drop every profile, e.g. after the behavior store was replaced"""
+        self._profiles.clear()
+        self.nbytes = 0
+
+    def record(self, behavior: Dict, behavior_store, catalog):
+        """Count one event that was just appended to ``behavior_store``"""
+        user_id = behavior.get('userId')
+        if user_id is None:
+            return
+        key = str(user_id)
+        profile = self._profiles.get(key)
+        if profile is None:
+            profile = self._profiles[key] = UserProfile()
+            self.nbytes += profile.nbytes
+        product_id = behavior.get('productId')
+        record = catalog.get(product_id) if product_id is not None else None
+        before = profile.nbytes
+        profile.add(
+            behavior.get('action') or 'view',
+            (record.category or 'other') if record is not None else None,
+            behavior_store.products.lookup(product_id)
+        )
+        self.nbytes += profile.nbytes - before
+        self._touch(key, profile)
+        self._evict()
+
+    def summary(self, user_id) -> Dict:
+        """Behavior summary of a user (see ``UserProfile.summary``)"""
+        key = str(user_id)
+        profile = self._profiles.get(key)
+        if profile is not None and time.monotonic() - profile.touched_at > self.ttl:
+            self._drop(key)
+            profile = None
+
+        if profile is None:
+            self.misses += 1
+            return {'has_history': False, 'total_interactions': 0}
+        self.hits += 1
+        self._touch(key, profile)
+        return profile.summary()
+
+    def rebuild(self, behavior_store, catalog):
+        """
+        Replace every profile with aggregates of ``behavior_store``
+
+        Only the ``max_users`` most recently active users get a profile, in
+        LRU order; ``max_bytes`` is then enforced as usual.
+        """
+        self.clear()
+        rows = behavior_store.latest_rows(len(behavior_store))
+        users = behavior_store.user_codes[rows]
+        rows, users = rows[users >= 0], users[users >= 0]
+        if not len(rows):
+            return
+
+        # Users by their last event, most recent first
+        user_codes, last_seen = np.unique(users[::-1], return_index=True)
+        recent = user_codes[np.argsort(last_seen, kind='stable')[:self.max_users]]
+        selected = np.sort(recent)
+        local = np.searchsorted(selected, users)
+        keep = selected[np.minimum(local, len(selected) - 1)] == users
+        rows, local = rows[keep], local[keep]
+
+        profiles = [UserProfile() for _ in range(len(selected))]
+        for index, total in enumerate(np.bincount(local, minlength=len(selected)).tolist()):
+            profiles[index].total = total
+
+        action_names = behavior_store.actions.ids
+        n_actions = len(action_names) + 1
+        pairs, counts = np.unique(local.astype(np.int64) * n_actions + behavior_store.action_codes[rows] + 1, return_counts=True)
+        for pair, count in zip(pairs.tolist(), counts.tolist()):
+            code = pair % n_actions - 1
+            action = action_names[code] if code >= 0 else 'view'
+            action_counts = profiles[pair // n_actions].action_counts
+            action_counts[action] = action_counts.get(action, 0) + count
+
+        product_ids = behavior_store.products.ids
+        products = behavior_store.product_codes[rows]
+        with_product = products >= 0
+        n_products = max(len(product_ids), 1)
+        pairs, counts = np.unique(local[with_product].astype(np.int64) * n_products + products[with_product], return_counts=True)
+        categories = {}
+        for pair, count in zip(pairs.tolist(), counts.tolist()):
+            code = pair % n_products
+            profile = profiles[pair // n_products]
+            profile.products.add(code)
+            if code not in categories:
+                record = catalog.get(product_ids[code])
+                categories[code] = (record.category or 'other') if record is not None else None
+            category = categories[code]
+            if category is not None:
+                profile.category_counts[category] = profile.category_counts.get(category, 0) + count
+
+        user_ids = behavior_store.users.ids
+        now = time.monotonic()
+        # Least recently active first, so the LRU order matches activity
+        for code in recent[::-1].tolist():
+            profile = profiles[np.searchsorted(selected, code)]
+            profile.touched_at = now
+            profile.nbytes += (_COUNTER_ENTRY_BYTES * (len(profile.action_counts) + len(profile.category_counts))
+                               + _PRODUCT_ENTRY_BYTES * len(profile.products))
+            self._profiles[user_ids[code]] = profile
+            self.nbytes += profile.nbytes
+        self._evict()
+
+    def _touch(self, key: str, profile: UserProfile):
+        profile.touched_at = time.monotonic()
+        self._profiles.move_to_end(key)
+
+    def _drop(self, key: str):
+        profile = self._profiles.pop(key)
+        self.nbytes -= profile.nbytes
+        self.evictions += 1
+
+    def _evict(self):
+        """Drop expired profiles and the least recently used ones beyond the caps"""
+        now = time.monotonic()
+        while self._profiles:
+            key, oldest = next(iter(self._profiles.items()))
+            if (len(self._profiles) > self.max_users or self.nbytes > self.max_bytes
+                    or now - oldest.touched_at > self.ttl):
+                self._drop(key)
+            else:
+                break
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'users_cached': len(self._profiles),
+            'estimated_bytes': self.nbytes,
+            'max_users': self.max_users,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions
+        }